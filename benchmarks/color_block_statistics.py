@@ -0,0 +1,153 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""Benchmark duplicate stitch filtering and the color block statistics.
+
+Run from the root of the git clone:
+
+    python -m benchmarks.color_block_statistics [--random N] [--repeat N]
+
+The color blocks of each document in benchmarks/corpus.py, as they are and
+with a jittered copy of every stitch (some of them closer than 0.1mm), are
+filtered by filter_duplicate_stitches() and by the original implementation,
+which compares all stitches one by one.  So are --random stitch plans.  The
+filtered stitch plans must be identical.  Then the summary that the print
+preview and the API show is read --repeat times, computing each number from
+scratch like the original did and through the cached statistics, and must
+be the same too.
+"""
+
+import argparse
+import random
+import sys
+import time
+
+import numpy
+
+from lib.stitch_plan import ColorBlock, Stitch, StitchPlan
+from lib.stitch_plan.stitch import COLOR_CHANGE, JUMP, STOP, TRIM
+from lib.svg import PIXELS_PER_MM
+
+from .ties import copy_stitch_plan, corpus_stitch_plans, random_stitch_plans
+
+
+def stitch_by_stitch_filter_duplicate_stitches(color_block):
+    """The original implementation."""
+
+    if not len(color_block):
+        return
+
+    x = color_block.x.tolist()
+    y = color_block.y.tolist()
+    flags = color_block.flags.tolist()
+    keep = [True] * len(color_block)
+    min_length = 0.1 * PIXELS_PER_MM
+    last = 0
+
+    for i in range(1, len(color_block)):
+        if flags[last] & JUMP or flags[i] & (STOP | TRIM | COLOR_CHANGE):
+            pass
+        elif ((x[i] - x[last]) ** 2 + (y[i] - y[last]) ** 2) ** 0.5 <= min_length:
+            keep[i] = False
+            continue
+
+        last = i
+
+    color_block._keep(keep)
+
+
+def original_summary(stitch_plan):
+    """The summary as the original computed it, each number from scratch."""
+
+    bounding_boxes = [(float(block.x.min()), float(block.y.min()), float(block.x.max()), float(block.y.max())) for block in stitch_plan]
+    thread = sum(float(numpy.hypot(numpy.diff(block.x), numpy.diff(block.y)).sum()) for block in stitch_plan)
+
+    return dict(num_stops=sum(1 for block in stitch_plan if block.stop_after),
+                num_trims=sum(int(numpy.count_nonzero(block.flags & TRIM)) for block in stitch_plan),
+                num_stitches=sum(len(block) for block in stitch_plan),
+                bounding_box=(min(bb[0] for bb in bounding_boxes), min(bb[1] for bb in bounding_boxes),
+                              max(bb[2] for bb in bounding_boxes), max(bb[3] for bb in bounding_boxes)),
+                estimated_thread=round(thread / PIXELS_PER_MM / 1000, 2))
+
+
+def summary(stitch_plan):
+    data = stitch_plan.__json__()
+    del data['color_blocks']
+    return data
+
+
+def with_duplicates(stitch_plan, rng):
+    duplicated = StitchPlan()
+    for color_block in stitch_plan:
+        stitches = []
+        for stitch in color_block.stitches:
+            stitches.append(stitch)
+            if not stitch.flags & (JUMP | TRIM | STOP | COLOR_CHANGE):
+                jitter = rng.choice([0, 0.05, 0.1, 0.15]) * PIXELS_PER_MM
+                stitches.append(Stitch(stitch.x + jitter, stitch.y, tags=stitch.tags))
+        duplicated.add_color_block(ColorBlock(color_block.color, stitches))
+
+    return duplicated
+
+
+def timed(function, stitch_plan, repeat):
+    duration = float('inf')
+    for i in range(repeat):
+        copy = copy_stitch_plan(stitch_plan)
+        start = time.perf_counter()
+        function(copy)
+        duration = min(duration, time.perf_counter() - start)
+
+    return duration, copy
+
+
+def timed_summary(function, stitch_plan, repeat):
+    start = time.perf_counter()
+    for i in range(repeat):
+        result = function(stitch_plan)
+
+    return time.perf_counter() - start, result
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.color_block_statistics", description=__doc__.split("\n")[0])
+    parser.add_argument("--random", type=int, default=500, help="number of random stitch plans (default: 500)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per stitch plan, the best time counts (default: 5)")
+    args = parser.parse_args(args)
+
+    print("%-36s %9s %9s %10s %10s %10s %10s %s" % ("document", "stitches", "filtered", "filter", "new", "summary", "new", "same"))
+
+    rng = random.Random(1)
+    plans = []
+    for name, svg, stitch_plan in corpus_stitch_plans():
+        plans.append((name, stitch_plan))
+        plans.append((name + " + duplicates", with_duplicates(stitch_plan, rng)))
+    plans.extend((name, stitch_plan) for name, svg, stitch_plan in random_stitch_plans(args.random))
+
+    failed = False
+    for name, stitch_plan in plans:
+        original_time, expected = timed(lambda plan: [stitch_by_stitch_filter_duplicate_stitches(block) for block in plan], stitch_plan, args.repeat)
+        new_time, filtered = timed(StitchPlan.filter_duplicate_stitches, stitch_plan, args.repeat)
+        same = filtered.to_bytes() == expected.to_bytes()
+
+        original_summary_time, expected_summary = timed_summary(original_summary, expected, args.repeat)
+        summary_time, new_summary = timed_summary(summary, expected, args.repeat)
+        same = same and new_summary == expected_summary
+
+        failed = failed or not same
+        if name.startswith("random") and same:
+            continue
+
+        print("%-36s %9d %9d %9.3fs %9.3fs %9.3fs %9.3fs %s" % (
+            name, stitch_plan.num_stitches, stitch_plan.num_stitches - expected.num_stitches, original_time, new_time,
+            original_summary_time, summary_time, "yes" if same else "NO"))
+
+    print("%d random stitch plans: %s" % (args.random, "NO" if failed else "yes"))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,186 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""The documents that python -m benchmarks.pipeline runs through Ink/Stitch.
+
+Each entry of CORPUS builds a fresh inkex document.  They're generated
+instead of checked in as SVG files so that their size is easy to tune and
+each one is stated in a few lines.  The lettering document is put together
+from the glyphs of one of the fonts in fonts/.
+"""
+
+import json
+import math
+import os
+from copy import deepcopy
+
+import inkex
+from lxml import etree
+
+from lib.svg import PIXELS_PER_MM
+from lib.svg.tags import (INKSCAPE_GROUPMODE, INKSCAPE_LABEL, SVG_DEFS_TAG,
+                          SVG_GROUP_TAG)
+
+from .satin_rails import circle, rungs
+
+mm = PIXELS_PER_MM
+
+FONT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fonts", "dejavufont")
+LETTERING_TEXT = "Ink/Stitch Benchmark"
+
+SVG_TEMPLATE = ('<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+                'xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape" '
+                'xmlns:inkstitch="http://inkstitch.org/namespace" width="%(size)f" height="%(size)f" viewBox="0 0 %(size)f %(size)f">'
+                '<g inkscape:groupmode="layer" id="layer1">%(content)s</g></svg>')
+
+
+def make_document(content, size=800 * mm):
+    return inkex.load_svg((SVG_TEMPLATE % dict(size=size, content=content)).encode('utf-8'))
+
+
+def polygon(points):
+    return "M " + " L ".join("%f,%f" % point for point in points) + " Z"
+
+
+def regular_polygon(cx, cy, radius, sides, reverse=False):
+    angles = [2 * math.pi * i / sides for i in range(sides)]
+    if reverse:
+        angles.reverse()
+
+    return polygon([(cx + radius * math.cos(angle), cy + radius * math.sin(angle)) for angle in angles])
+
+
+def fill(d, color, **params):
+    attributes = "".join(' inkstitch:%s="%s"' % item for item in params.items())
+    return '<path style="fill:%s;stroke:none" d="%s"%s/>' % (color, d, attributes)
+
+
+def stroke(d, color, **params):
+    attributes = "".join(' inkstitch:%s="%s"' % item for item in params.items())
+    return '<path style="fill:none;stroke:%s;stroke-width:1" d="%s"%s/>' % (color, d, attributes)
+
+
+def satin(d, color, **params):
+    return stroke(d, color, satin_column="true", **params)
+
+
+def large_fills_with_holes():
+    """Large fills with many holes, the worst case for auto_fill."""
+
+    disc = regular_polygon(50 * mm, 50 * mm, 45 * mm, 128)
+    for i in range(6):
+        angle = 2 * math.pi * i / 6
+        disc += " " + regular_polygon(50 * mm + 25 * mm * math.cos(angle), 50 * mm + 25 * mm * math.sin(angle), 8 * mm, 48, reverse=True)
+
+    star = polygon([(150 * mm + (45 if i % 2 == 0 else 20) * mm * math.cos(math.pi * i / 8),
+                     50 * mm + (45 if i % 2 == 0 else 20) * mm * math.sin(math.pi * i / 8)) for i in range(16)])
+    star += " " + regular_polygon(150 * mm, 50 * mm, 10 * mm, 48, reverse=True)
+
+    grid = polygon([(5 * mm, 100 * mm), (95 * mm, 100 * mm), (95 * mm, 190 * mm), (5 * mm, 190 * mm)])
+    for row in range(4):
+        for column in range(4):
+            grid += " " + regular_polygon((17 + 22 * column) * mm, (112 + 22 * row) * mm, 6 * mm, 24, reverse=True)
+
+    return make_document(fill(disc, "#2c5aa0", fill_underlay="true") +
+                         fill(star, "#d40000", angle="30") +
+                         fill(grid, "#008000", fill_underlay="true", angle="45"))
+
+
+def long_satins():
+    """Satin borders and columns with all kinds of underlay."""
+
+    underlays = dict(center_walk_underlay="true", contour_underlay="true", zigzag_underlay="true", pull_compensation_mm="0.2")
+    content = ""
+    for i in range(3):
+        cx = (70 + 150 * i) * mm
+        content += satin(circle(cx, 70 * mm, 60 * mm) + " " + circle(cx, 70 * mm, 56 * mm) + rungs(cx, 70 * mm, 56 * mm, 60 * mm, 12),
+                         "#000080", **underlays)
+
+    for i in range(4):
+        y = (160 + 40 * i) * mm
+        content += satin("M 0,%f C %f,%f %f,%f %f,%f S %f,%f %f,%f M 0,%f C %f,%f %f,%f %f,%f S %f,%f %f,%f" % (
+            y, 30 * mm, y - 40 * mm, 70 * mm, y + 40 * mm, 100 * mm, y, 170 * mm, y - 40 * mm, 200 * mm, y,
+            y + 5 * mm, 30 * mm, y - 35 * mm, 70 * mm, y + 45 * mm, 100 * mm, y + 5 * mm, 170 * mm, y - 35 * mm, 200 * mm, y + 5 * mm),
+            "#aa0000", **underlays)
+
+    return make_document(content)
+
+
+def lettering():
+    """A line of text made of the glyphs of a font with satins and fills.
+
+    Like the Lettering extension, the glyphs are put side by side, and the
+    text is later run through auto_satin (see needs_auto_satin()).
+    """
+
+    with open(os.path.join(FONT_DIR, "font.json"), encoding="utf-8") as font_json:
+        metadata = json.load(font_json)
+
+    font = inkex.load_svg(os.path.join(FONT_DIR, "→.svg"))
+    glyphs = {layer.get(INKSCAPE_LABEL)[len("GlyphLayer-"):]: layer
+              for layer in font.getroot().iterchildren(SVG_GROUP_TAG) if layer.get(INKSCAPE_LABEL, "").startswith("GlyphLayer-")}
+
+    document = make_document("")
+    layer = document.getroot().find(SVG_GROUP_TAG)
+
+    # the command symbols used in the glyphs
+    document.getroot().insert(0, deepcopy(font.getroot().find(SVG_DEFS_TAG)))
+
+    # The font files are in mm, the advances in font.json in px.
+    x = 0
+    for character in LETTERING_TEXT:
+        if character in glyphs:
+            glyph = deepcopy(glyphs[character])
+            glyph.attrib.pop(INKSCAPE_GROUPMODE, None)
+            glyph.set("style", "display:inline")
+            letter = etree.SubElement(layer, SVG_GROUP_TAG, {"id": "letter%d" % len(layer), "transform": "translate(%f, 0) scale(%f)" % (x, mm)})
+            letter.append(glyph)
+        x += metadata["horiz_adv_x"].get(character, metadata["horiz_adv_x_default"])
+
+    return document
+
+
+def clones():
+    """A few objects, each cloned many times with different transforms."""
+
+    sources = (fill(regular_polygon(20 * mm, 20 * mm, 15 * mm, 32), "#ff6600").replace("<path ", '<path id="clone-source-fill" ') +
+               satin(circle(60 * mm, 20 * mm, 15 * mm) + " " + circle(60 * mm, 20 * mm, 12 * mm) + rungs(60 * mm, 20 * mm, 12 * mm, 15 * mm, 4),
+                     "#6600ff").replace("<path ", '<path id="clone-source-satin" '))
+
+    copies = "".join('<use xlink:href="#%s" transform="translate(%f,%f) rotate(%d)"/>' % (
+        source, (i % 6) * 80 * mm, (1 + i // 6) * 60 * mm, 15 * i) for i in range(12) for source in ("clone-source-fill", "clone-source-satin"))
+
+    return make_document(sources + copies)
+
+
+def patterns():
+    """Fills and running stitch with fill and stroke patterns applied."""
+
+    marker = ";marker-start:url(#inkstitch-pattern-marker)"
+    content = ""
+    for i in range(2):
+        x = i * 70 * mm
+        grid = " ".join("M %f,%f h %f" % (x, j * 10 * mm, 60 * mm) for j in range(7))
+        content += ('<g id="pattern-group%d">' % i +
+                    fill(polygon([(x, 0), (x + 60 * mm, 0), (x + 60 * mm, 60 * mm), (x, 60 * mm)]), "#336699") +
+                    stroke("M %f,0 %f,%f" % (x, x + 60 * mm, 60 * mm), "#996633", running_stitch_length_mm="2") +
+                    '<path style="fill:none;stroke:#000000%s" d="%s"/>' % (marker, grid) +
+                    '<path style="fill:#000000;stroke:none%s" d="%s"/>' % (marker, regular_polygon(x + 30 * mm, 30 * mm, 15 * mm, 32)) +
+                    '</g>')
+
+    return make_document(content)
+
+
+CORPUS = {
+    "large fills with holes": large_fills_with_holes,
+    "long satins": long_satins,
+    "lettering": lettering,
+    "clones": clones,
+    "patterns": patterns,
+}
+
+
+def needs_auto_satin(name):
+    return name == "lettering"
@@ -0,0 +1,246 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""Benchmark InkstitchExtension.get_nodes() against the recursive version.
+
+Run from the root of the git clone:
+
+    python -m benchmarks.descendants [--nodes N] [--repeat N]
+
+A document with about --nodes nodes is generated: nested groups in a few
+layers, with paths, clones, text and patterns, commands and their
+connectors, and things that are never embroidered: defs, masks, comments,
+hidden groups and objects (through style attributes, presentation
+attributes, a stylesheet and display:inherit), objects with an
+ignore_object command and a layer with an ignore_layer command.  Its
+nodes are found by get_nodes() and by the original implementation, which
+recursed into every node and looked up its commands with XPath, with
+nothing selected, with some groups and objects selected, and for the
+troubleshoot extension.  The nodes must be the same, in the same order.
+The same document without the stylesheet is only compared with nothing
+selected.  Times are the best of --repeat runs; the original takes a few
+minutes for 10000 nodes.
+"""
+
+import argparse
+import random
+import sys
+import time
+
+import inkex
+from lxml.etree import Comment
+
+from lib.commands import add_commands, add_layer_commands, is_command, layer_commands
+from lib.elements import EmbroideryElement, node_to_elements
+from lib.elements.clone import is_clone
+from lib.extensions.base import InkstitchExtension
+from lib.patterns import is_pattern
+from lib.svg.document_index import invalidate_document_index
+from lib.svg.tags import (CONNECTOR_TYPE, EMBROIDERABLE_TAGS, INKSCAPE_GROUPMODE,
+                          NOT_EMBROIDERABLE_TAGS, SVG_CLIPPATH_TAG, SVG_DEFS_TAG,
+                          SVG_GROUP_TAG, SVG_MASK_TAG)
+
+from .corpus import SVG_TEMPLATE, fill, mm, regular_polygon, stroke
+
+LAYERS = 4
+STYLESHEET = '<style>.hidden { display: none } .shown { display: inline }</style>'
+
+
+def original_descendants(extension, node, selected=False, troubleshoot=False):  # noqa: C901
+    """The original implementation."""
+
+    nodes = []
+
+    if node.tag == Comment:
+        return []
+
+    element = EmbroideryElement(node)
+
+    if element.has_command('ignore_object'):
+        return []
+
+    if node.tag == SVG_GROUP_TAG and node.get(INKSCAPE_GROUPMODE) == "layer":
+        if len(list(layer_commands(node, "ignore_layer"))):
+            return []
+
+    if (node.tag in EMBROIDERABLE_TAGS or node.tag == SVG_GROUP_TAG) and element.get_style('display', 'inline') is None:
+        return []
+
+    if node.tag in [SVG_DEFS_TAG, SVG_MASK_TAG, SVG_CLIPPATH_TAG]:
+        return []
+
+    if is_command(node) or node.get(CONNECTOR_TYPE):
+        return []
+
+    if extension.svg.selection:
+        if node.get("id") in extension.svg.selection:
+            selected = True
+    else:
+        selected = True
+
+    for child in node:
+        nodes.extend(original_descendants(extension, child, selected, troubleshoot))
+
+    if selected:
+        if node.tag == SVG_GROUP_TAG:
+            pass
+        elif (node.tag in EMBROIDERABLE_TAGS or is_clone(node)) and not is_pattern(node):
+            nodes.append(node)
+        elif troubleshoot and (node.tag in NOT_EMBROIDERABLE_TAGS or is_pattern(node)):
+            nodes.append(node)
+
+    return nodes
+
+
+class Generator(object):
+    def __init__(self, rng):
+        self.rng = rng
+        self.count = 0
+
+    def next_id(self, prefix):
+        self.count += 1
+        return "%s%d" % (prefix, self.count)
+
+    def hidden(self):
+        return self.rng.choice(['', '', '', '', '', ' style="display:none"', ' display="none"', ' class="hidden"'])
+
+    def shape(self):
+        x = self.rng.uniform(0, 500) * mm
+        y = self.rng.uniform(0, 500) * mm
+        kind = self.rng.random()
+        node_id = self.next_id("object")
+        if kind < 0.05:
+            return '<text id="%s" x="%f" y="%f">text</text>' % (node_id, x, y)
+        elif kind < 0.1:
+            return '<use id="%s" xlink:href="#object1" x="%f" y="%f"%s/>' % (node_id, x, y, self.hidden())
+        elif kind < 0.13:
+            return '<!-- a comment -->'
+
+        if kind < 0.55:
+            path = fill(regular_polygon(x, y, 5 * mm, 6), "#ff0000")
+        elif kind < 0.97:
+            path = stroke(regular_polygon(x, y, 5 * mm, 5), "#0000ff")
+        else:
+            path = stroke(regular_polygon(x, y, 5 * mm, 4), "#00ff00").replace('style="', 'style="marker-start:url(#inkstitch-pattern-marker);')
+
+        hidden = self.hidden()
+        if hidden and 'style="' in hidden:
+            path = path.replace('style="', 'style="display:none;')
+        elif hidden:
+            path = path.replace('<path ', '<path%s ' % hidden)
+
+        return path.replace('<path ', '<path id="%s" ' % node_id)
+
+    def group(self, size, depth):
+        content = []
+        while size > 0:
+            if depth < 4 and self.rng.random() < 0.1:
+                child_size = self.rng.randint(1, 50)
+                content.append(self.group(child_size, depth + 1))
+                size -= child_size
+            else:
+                content.append(self.shape())
+                size -= 1
+
+        attributes = self.hidden() if self.rng.random() < 0.1 else ''
+        if self.rng.random() < 0.1:
+            # children that take over their group's display
+            content.append('<g style="display:inherit">%s</g>' % self.shape())
+        return '<g id="%s"%s>%s</g>' % (self.next_id("group"), attributes, "".join(content))
+
+
+def build_document(nodes, stylesheet=True, seed=1):
+    rng = random.Random(seed)
+    generator = Generator(rng)
+
+    # commands and text add nodes of their own
+    shapes_per_layer = nodes // LAYERS // 3
+    layers = ['<defs><path id="in-defs" d="M 0,0 L 10,10" style="stroke:#000000"/></defs>', STYLESHEET if stylesheet else '',
+              '<mask id="mask"><path d="M 0,0 L 10,10" style="fill:#ffffff"/></mask>']
+    for layer in range(LAYERS):
+        layers.append('<g inkscape:groupmode="layer" id="layer%d">%s</g>' % (layer + 2, generator.group(shapes_per_layer, 0)))
+
+    # not make_document(): an ignore_layer command ignores all the layers
+    # it's in, including the one that make_document() puts around everything
+    template = SVG_TEMPLATE.replace('<g inkscape:groupmode="layer" id="layer1">%(content)s</g>', "%(content)s")
+    document = inkex.load_svg((template % dict(size=600 * mm, content="".join(layers))).encode('utf-8'))
+    root = document.getroot()
+
+    paths = [node for node in root.iter('{http://www.w3.org/2000/svg}path') if node.get('id', '').startswith('object')]
+    for i, node in enumerate(paths[::7]):
+        elements = node_to_elements(node)
+        if elements and not is_pattern(node):
+            add_commands(elements[0], ["ignore_object"] if i % 3 == 0 else ["trim"])
+    add_layer_commands(root.getElementById("layer3"), ["ignore_layer"])
+
+    return document
+
+
+def extension_for(document, selection=()):
+    extension = InkstitchExtension()
+    extension.document = document
+    extension.svg = document.getroot()
+    if selection:
+        extension.svg.selection.set(*selection)
+
+    return extension
+
+
+def timed(function, repeat):
+    duration = float('inf')
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        duration = min(duration, time.perf_counter() - start)
+
+    return duration, result
+
+
+def compare(name, extension, troubleshoot, repeat):
+    root = extension.document.getroot()
+
+    def original():
+        invalidate_document_index(root)
+        return original_descendants(extension, root, troubleshoot=troubleshoot)
+
+    original_time, expected = timed(original, repeat)
+    new_time, result = timed(lambda: extension.get_nodes(troubleshoot), repeat)
+    same = result == expected
+
+    print("%-28s %8d %9.3fs %9.3fs %7.1fx %s" % (
+        name, len(expected), original_time, new_time, original_time / max(new_time, 1e-9), "yes" if same else "NO"))
+
+    return same
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.descendants", description=__doc__.split("\n")[0])
+    parser.add_argument("--nodes", type=int, default=10000, help="about how many nodes the document has (default: 10000)")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per traversal, the best time counts (default: 1)")
+    args = parser.parse_args(args)
+
+    same = True
+    for stylesheet in (False, True):
+        document = build_document(args.nodes, stylesheet)
+        root = document.getroot()
+        print("%d nodes, %s" % (sum(1 for node in root.iter()), "with a stylesheet" if stylesheet else "no stylesheet"))
+        print("%-28s %8s %10s %10s %8s %s" % ("selection", "found", "original", "new", "speedup", "same"))
+
+        same = compare("nothing selected", extension_for(document), False, args.repeat) and same
+        if not stylesheet:
+            continue
+
+        same = compare("troubleshoot", extension_for(document), True, args.repeat) and same
+
+        rng = random.Random(2)
+        candidates = [node.get('id') for node in root.iter() if (node.get('id') or '').startswith(('object', 'group'))]
+        selection = rng.sample(candidates, len(candidates) // 20)
+        same = compare("%d selected" % len(selection), extension_for(document, selection), False, args.repeat) and same
+
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
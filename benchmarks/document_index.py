@@ -0,0 +1,151 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""Benchmark looking up commands and clone sources with the document index.
+
+Run from the root of the git clone:
+
+    python -m benchmarks.document_index [--objects N] [--repeat N]
+
+A document with --objects paths is generated.  Every fourth path gets a
+command or two through add_commands(), every tenth one is cloned and
+there are a few layers, one of them with an ignore_layer command.  Then
+the same lookups that InkstitchExtension.descendants() and embroidering do
+for each node are done with XPath, like the original did, and through the
+index: the node's commands, its ignore_layer commands if it's a layer and
+its clone source if it's a clone.  The results must be the same.  They're
+compared again after commands are added to and removed from the indexed
+document.  Times are the best of --repeat runs.
+"""
+
+import argparse
+import sys
+import time
+
+from lib.commands import add_commands, add_layer_commands, find_commands, layer_commands
+from lib.elements import node_to_elements
+from lib.elements.clone import get_clone_source, is_clone
+from lib.svg.document_index import build_document_index, find_connectors, get_document_index, invalidate_document_index
+from lib.svg.tags import INKSCAPE_GROUPMODE, SVG_GROUP_TAG
+
+from .corpus import fill, make_document, mm, regular_polygon, stroke
+
+COMMANDS = (["fill_start"], ["trim"], ["stop", "ignore_object"], ["fill_start", "fill_end"])
+LAYERS = 5
+
+
+def build_document(objects):
+    layers = []
+    for layer in range(LAYERS):
+        content = []
+        for i in range(layer, objects, LAYERS):
+            x = (i % 40) * 20 * mm
+            y = (i // 40) * 20 * mm
+            path = fill(regular_polygon(x, y, 8 * mm, 6), "#ff0000") if i % 2 else stroke(regular_polygon(x, y, 8 * mm, 5), "#0000ff")
+            content.append(path.replace("<path ", '<path id="object%d" ' % i))
+            if i % 10 == 0:
+                content.append('<use id="clone%d" xlink:href="#object%d" transform="translate(10,10)"/>' % (i, i))
+        layers.append('<g inkscape:groupmode="layer" id="layer%d">%s</g>' % (layer + 2, "".join(content)))
+
+    document = make_document("".join(layers))
+    root = document.getroot()
+    for i in range(0, objects, 4):
+        add_commands(node_to_elements(root.getElementById("object%d" % i))[0], COMMANDS[(i // 4) % len(COMMANDS)])
+    add_layer_commands(root.getElementById("layer3"), ["ignore_layer"])
+
+    return document
+
+
+def lookups(root):
+    """What descendants() and embroidering look up for each node."""
+
+    results = []
+    for node in root.iterdescendants():
+        if not isinstance(node.tag, str):
+            continue
+
+        commands = tuple((command.command, command.target.get('id'), tuple(command.target_point)) for command in find_commands(node))
+        result = [node.get('id'), commands]
+        if node.tag == SVG_GROUP_TAG and node.get(INKSCAPE_GROUPMODE) == "layer":
+            result.append(tuple(command.node.get('id') for command in layer_commands(node, "ignore_layer")))
+        if is_clone(node):
+            result.append(get_clone_source(node).get('id'))
+        results.append(tuple(result))
+
+    return results
+
+
+def timed(function, repeat):
+    duration = float('inf')
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        duration = min(duration, time.perf_counter() - start)
+
+    return duration, result
+
+
+def with_index(root):
+    build_document_index(root)
+    try:
+        return lookups(root)
+    finally:
+        invalidate_document_index(root)
+
+
+def compare(name, root, repeat):
+    invalidate_document_index(root)
+    xpath_time, expected = timed(lambda: lookups(root), repeat)
+    index_time, result = timed(lambda: with_index(root), repeat)
+    same = result == expected
+
+    print("%-32s %8d %9.3fs %9.3fs %7.1fx %s" % (
+        name, len(expected), xpath_time, index_time, xpath_time / max(index_time, 1e-9), "yes" if same else "NO"))
+
+    return same
+
+
+def change_document(root):
+    """Add and remove commands while the index is built, like an extension could."""
+
+    build_document_index(root)
+    add_commands(node_to_elements(root.getElementById("object1"))[0], ["trim"])
+    if get_document_index(root) is not None:
+        return False
+
+    build_document_index(root)
+    for connector in find_connectors(root.getElementById("object8")):
+        connector.getparent().remove(connector)
+    root.getElementById("object2").set('id', 'renamed2')
+
+    return True
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.document_index", description=__doc__.split("\n")[0])
+    parser.add_argument("--objects", type=int, default=1000, help="number of paths in the document (default: 1000)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per lookup, the best time counts (default: 3)")
+    args = parser.parse_args(args)
+
+    print("%-32s %8s %10s %10s %8s %s" % ("document", "nodes", "xpath", "index", "speedup", "same"))
+
+    same = True
+    for objects in sorted({args.objects // 10, args.objects}):
+        root = build_document(objects).getroot()
+        same = compare("%d objects" % objects, root, args.repeat) and same
+
+    # lookups through a stale index must still find what XPath finds
+    changed = change_document(root)
+    result = lookups(root)
+    invalidate_document_index(root)
+    expected = lookups(root)
+    stale_same = changed and result == expected
+    print("%-32s %8d %10s %10s %8s %s" % ("  after changes", len(result), "", "", "", "yes" if stale_same else "NO"))
+
+    return 0 if same and stale_same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
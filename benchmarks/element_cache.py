@@ -0,0 +1,122 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""Check that embroidery elements can be reused after their nodes change.
+
+Run from the root of the git clone:
+
+    python -m benchmarks.element_cache
+
+The elements of each document in benchmarks/corpus.py are embroidered
+twice (cold, then with everything the elements cached), and then again
+after each kind of change: params changed with set_param(), styles and
+transforms changed on the nodes directly.  Each time, the stitch plan
+must be the same as the one of freshly created elements.  Finally, the
+elements must be garbage once they're no longer used.
+"""
+
+import gc
+import json
+import re
+import sys
+import time
+import weakref
+
+from lib.elements import embroider_serially, nodes_to_elements
+from lib.stitch_plan import stitch_groups_to_stitch_plan
+from lib.utils.cache import method_cache_statistics
+
+from .corpus import CORPUS, needs_auto_satin
+from .pipeline import apply_auto_satin, embroiderable_nodes
+
+
+def load_elements(document):
+    return nodes_to_elements(embroiderable_nodes(document.getroot()))
+
+
+def stitch_plan_json(patches):
+    return json.dumps(stitch_groups_to_stitch_plan(patches), default=lambda obj: obj.__json__() if hasattr(obj, '__json__') else str(obj))
+
+
+def set_params(document, elements):
+    for element in elements:
+        element.set_param('row_spacing_mm', '0.3')
+        element.set_param('running_stitch_length_mm', '2.7')
+        element.set_param('zigzag_spacing_mm', '0.5')
+
+
+def change_styles(document, elements):
+    for element in elements:
+        style = element.node.get('style')
+        if style:
+            element.node.set('style', re.sub('#[0-9a-fA-F]{6}', '#123456', style, count=1))
+
+
+def change_transforms(document, elements):
+    for element in elements:
+        element.node.set('transform', ('translate(3, 2) ' + (element.node.get('transform') or '')).strip())
+
+
+CHANGES = [("set_param", set_params), ("style", change_styles), ("transform", change_transforms)]
+
+
+def timed_json(elements):
+    start = time.perf_counter()
+    patches = embroider_serially(elements)
+    return time.perf_counter() - start, stitch_plan_json(patches)
+
+
+def alive_after_use(document):
+    elements = load_elements(document)
+    embroider_serially(elements)
+    references = [weakref.ref(element) for element in elements]
+    del elements
+    gc.collect()
+
+    return sum(1 for reference in references if reference() is not None)
+
+
+def check_document(name, document):
+    elements = load_elements(document)
+    cold_time, cold = timed_json(elements)
+    warm_time, warm = timed_json(elements)
+    same = warm == cold
+    print("%-26s %8d %9.3fs %9.3fs %s" % (name, len(elements), cold_time, warm_time, "yes" if same else "NO"))
+
+    for change, apply_change in CHANGES:
+        apply_change(document, elements)
+        reused_time, reused = timed_json(elements)
+        fresh_time, fresh = timed_json(load_elements(document))
+        identical = reused == fresh
+        same = same and identical
+        print("%-26s %8s %9.3fs %9.3fs %s" % ("  after " + change, "", fresh_time, reused_time, "yes" if identical else "NO"))
+
+    alive = alive_after_use(document)
+    print("%-26s %8d" % ("  still alive after use", alive))
+
+    return same and alive == 0
+
+
+def main(args):
+    print("%-26s %8s %10s %10s %s" % ("document", "elements", "cold", "reused", "same"))
+
+    failed = False
+    for name, build in CORPUS.items():
+        document = build()
+        if needs_auto_satin(name):
+            apply_auto_satin(document)
+
+        failed = not check_document(name, document) or failed
+
+    print()
+    print("%-60s %10s %10s" % ("most used cached methods", "hits", "misses"))
+    for statistics in sorted(method_cache_statistics(), key=lambda statistics: -statistics.hits)[:10]:
+        print("%-60s %10d %10d" % (statistics.name, statistics.hits, statistics.misses))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
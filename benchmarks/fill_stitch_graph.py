@@ -0,0 +1,105 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""Benchmark FillStitchGraph against the networkx.MultiGraph it replaced.
+
+Run from the root of the git clone:
+
+    python -m benchmarks.fill_stitch_graph
+
+For each shape, the fill stitch graph is built once and then copied into a
+FillStitchGraph and a networkx.MultiGraph.  "memory" is what each copy
+allocates, "walk" is the time of the Eulerian walk that find_stitch_path()
+does (the networkx one is the original loop with graph.copy(), degree() and
+remove_edge()).  Both walks must visit the edges in exactly the same order.
+"""
+
+import math
+import time
+import tracemalloc
+
+import networkx
+
+from lib.stitches.auto_fill import build_fill_stitch_graph
+from lib.stitches.fill_stitch_graph import FillStitchGraph
+from lib.svg import PIXELS_PER_MM
+
+from .grating import shapes
+
+
+def networkx_walk(graph, start):
+    """The original traversal from find_stitch_path()."""
+
+    graph = graph.copy()
+    path = []
+    vertex_stack = [(start, None)]
+    last_vertex = None
+    last_key = None
+
+    while vertex_stack:
+        current_vertex, current_key = vertex_stack[-1]
+        if graph.degree(current_vertex) == 0:
+            if last_vertex:
+                path.append((last_vertex, current_vertex, last_key))
+            last_vertex, last_key = current_vertex, current_key
+            vertex_stack.pop()
+        else:
+            ignore, next_vertex, next_key = pick_edge(graph.edges(current_vertex, keys=True))
+            vertex_stack.append((next_vertex, next_key))
+            graph.remove_edge(current_vertex, next_vertex, next_key)
+
+    return path
+
+
+def pick_edge(edges):
+    for source, node, key in edges:
+        if key == 'segment':
+            return source, node, key
+
+    return list(edges)[0]
+
+
+def copy_into(graph, nodes, edges):
+    for node, data in nodes:
+        graph.add_node(node, **data)
+    for start, end, key, data in edges:
+        graph.add_edge(start, end, key=key, **data)
+
+    return graph
+
+
+def measure(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    duration = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return result, duration, memory
+
+
+def main():
+    print("%-18s %8s %8s %12s %12s %10s %10s %s" % ("shape", "nodes", "edges", "nx memory", "memory", "nx walk", "walk", "same"))
+
+    for name, shape in shapes():
+        built = build_fill_stitch_graph(shape, math.radians(30), 0.2 * PIXELS_PER_MM, None)
+        nodes = built.nodes(data=True)
+        edges = list(built.edges(keys=True, data=True))
+        start = next(iter(built))
+
+        reference, ignore, reference_memory = measure(copy_into, networkx.MultiGraph(), nodes, edges)
+        graph, ignore, memory = measure(copy_into, FillStitchGraph(), nodes, edges)
+
+        expected, reference_time, ignore = measure(networkx_walk, reference, start)
+        path, walk_time, ignore = measure(graph.walk, start, "segment")
+
+        print("%-18s %8d %8d %10.1fMB %10.1fMB %9.2fs %9.2fs %s" % (
+            name, len(graph), graph.number_of_edges(), reference_memory / 1e6, memory / 1e6,
+            reference_time, walk_time, "yes" if path == expected else "NO"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""Benchmark flattening bezier curves against inkex.bezier.cspsubdiv().
+
+Run from the root of the git clone:
+
+    python -m benchmarks.flatten [--random N]
+
+First, every subpath of the elements of each document in
+benchmarks/corpus.py and --random subpaths with all kinds of curves, lines
+and scales are flattened by lib.svg.flatten_subpath() and by cspsubdiv(),
+which the elements used to call.  The points must be identical.
+
+Then the elements are embroidered, once as they are and once flattening
+everything with cspsubdiv() again each time it's asked for, like they used
+to.  The stitch plans must be identical.  "subpaths" counts how many
+subpaths were flattened along the way.
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from contextlib import contextmanager
+from copy import deepcopy
+
+import numpy
+from inkex import bezier
+
+from lib.elements import EmbroideryElement, embroider_serially, nodes_to_elements
+from lib.stitch_plan import stitch_groups_to_stitch_plan
+from lib.svg import flatten_subpath
+
+from .corpus import CORPUS, needs_auto_satin
+from .pipeline import apply_auto_satin, embroiderable_nodes
+
+
+def cspsubdiv_flatten_subpath(subpath):
+    """The original implementation."""
+
+    path = [deepcopy(subpath)]
+    bezier.cspsubdiv(path, 0.1)
+
+    # the points it adds are tuples
+    return [list(point) for control_before, point, control_after in path[0]]
+
+
+def random_subpath(rng):
+    scale = rng.choice([0.01, 1, 10, 1000])
+    x = y = 0
+    subpath = []
+    for i in range(rng.choice([1, 2, 3, 10, 100])):
+        x += rng.uniform(-scale, scale)
+        y += rng.uniform(-scale, scale)
+        kind = rng.random()
+        if kind < 0.3:
+            # a corner
+            subpath.append([[x, y], [x, y], [x, y]])
+        elif kind < 0.4:
+            # almost a corner
+            subpath.append([[x + 1e-9, y], [x, y], [x, y + 1e-12]])
+        else:
+            subpath.append([[x + rng.uniform(-scale, scale), y + rng.uniform(-scale, scale)], [x, y],
+                            [x + rng.uniform(-scale, scale), y + rng.uniform(-scale, scale)]])
+
+    return subpath
+
+
+def load_documents():
+    for name, build in CORPUS.items():
+        document = build()
+        if needs_auto_satin(name):
+            apply_auto_satin(document)
+        yield name, document
+
+
+def load_elements(document):
+    return nodes_to_elements(embroiderable_nodes(document.getroot()))
+
+
+def compare_subpaths(name, subpaths):
+    start = time.perf_counter()
+    expected = [cspsubdiv_flatten_subpath(subpath) for subpath in subpaths]
+    original_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = [flatten_subpath(subpath).tolist() for subpath in subpaths]
+    new_time = time.perf_counter() - start
+
+    same = result == expected
+    print("%-34s %9d %9.3fs %9.3fs %7.1fx %s" % (
+        name, len(subpaths), original_time, new_time, original_time / max(new_time, 1e-9), "yes" if same else "NO"))
+
+    return same
+
+
+@contextmanager
+def counting_flattened_subpaths(original):
+    """Count the flattened subpaths, and flatten like the original did if asked to."""
+
+    count = [0]
+    element_module = sys.modules[EmbroideryElement.__module__]
+    cached_methods = (EmbroideryElement.flattened_path, EmbroideryElement.flattened_subpath)
+
+    def counted_flatten_subpath(subpath):
+        count[0] += 1
+        if original:
+            return numpy.array(cspsubdiv_flatten_subpath(subpath))
+        return flatten_subpath(subpath)
+
+    # the elements call lib.svg.path.flatten_subpath() through this name
+    element_module.flatten_subpath = counted_flatten_subpath
+    if original:
+        # no cache: each subpath is flattened every time it's needed
+        EmbroideryElement.flattened_path = lambda self: self.flatten(self.parse_path())
+        EmbroideryElement.flattened_subpath = lambda self, index: self.flatten_subpath(self.parse_path()[index])
+
+    try:
+        yield count
+    finally:
+        element_module.flatten_subpath = flatten_subpath
+        EmbroideryElement.flattened_path, EmbroideryElement.flattened_subpath = cached_methods
+
+
+def embroider(document, original):
+    with counting_flattened_subpaths(original) as count:
+        start = time.perf_counter()
+        patches = embroider_serially(load_elements(document))
+        duration = time.perf_counter() - start
+
+    stitch_plan = stitch_groups_to_stitch_plan(patches)
+    return duration, count[0], json.dumps(stitch_plan, default=lambda obj: obj.__json__() if hasattr(obj, '__json__') else str(obj))
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.flatten", description=__doc__.split("\n")[0])
+    parser.add_argument("--random", type=int, default=500, help="number of random subpaths (default: 500)")
+    args = parser.parse_args(args)
+
+    documents = list(load_documents())
+
+    print("%-34s %9s %10s %10s %8s %s" % ("subpaths of", "subpaths", "cspsubdiv", "new", "speedup", "same"))
+    same = True
+    for name, document in documents:
+        subpaths = [subpath for element in load_elements(document) for subpath in element.parse_path()]
+        same = compare_subpaths(name, subpaths) and same
+
+    rng = random.Random(1)
+    same = compare_subpaths("random", [random_subpath(rng) for i in range(args.random)]) and same
+
+    print()
+    print("%-34s %9s %10s %9s %10s %s" % ("embroider", "subpaths", "original", "subpaths", "new", "same"))
+    for name, document in documents:
+        original_time, original_count, expected = embroider(document, original=True)
+        new_time, new_count, result = embroider(document, original=False)
+        identical = result == expected
+        same = same and identical
+        print("%-34s %9d %9.3fs %9d %9.3fs %s" % (name, original_count, original_time, new_count, new_time, "yes" if identical else "NO"))
+
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
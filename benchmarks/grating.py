@@ -0,0 +1,143 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""Benchmark intersect_region_with_grating() against the per-row shapely version.
+
+Run from the root of the git clone:
+
+    python -m benchmarks.grating
+
+The shapes are synthetic jacket-back sized fills (about 300 mm across) with and
+without holes, stitched at 0.2 mm row spacing.  "max diff px" is the largest
+distance between corresponding run endpoints of the two implementations ("inf"
+if the number of runs differs).  The rows and runs are the same, but the
+coordinates are computed differently and differ by rounding error, around
+1e-9 px.  Downstream, that can break ties differently in auto_fill, so the
+output is equivalent to the shapely version's, not identical.
+"""
+
+import math
+import sys
+import time
+
+import shapely.affinity
+from shapely import geometry as shgeo
+
+from lib.stitches.fill import intersect_region_with_grating
+from lib.svg import PIXELS_PER_MM
+from lib.utils import Point as InkstitchPoint
+
+
+def shapely_grating(shape, angle, row_spacing, end_row_spacing=None, flip=False):
+    """The original implementation: one LineString intersection per row."""
+
+    (minx, miny, maxx, maxy) = shape.bounds
+    upper_left = InkstitchPoint(minx, miny)
+    lower_right = InkstitchPoint(maxx, maxy)
+    length = (upper_left - lower_right).length()
+    half_length = length / 2.0
+
+    direction = InkstitchPoint(1, 0).rotate(-angle)
+    normal = direction.rotate(math.pi / 2)
+    center = InkstitchPoint((minx + maxx) / 2.0, (miny + maxy) / 2.0)
+
+    _, start, _, end = shapely.affinity.rotate(shape, angle, origin='center', use_radians=True).bounds
+    start -= center.y
+    end -= center.y
+    height = abs(end - start)
+    start -= (start + normal * center) % row_spacing
+
+    rows = []
+    current_row_y = start
+
+    while current_row_y < end:
+        p0 = center + normal * current_row_y + direction * half_length
+        p1 = center + normal * current_row_y - direction * half_length
+        grating_line = shgeo.LineString([p0.as_tuple(), p1.as_tuple()])
+
+        res = grating_line.intersection(shape)
+
+        if isinstance(res, (shgeo.MultiLineString, shgeo.GeometryCollection)):
+            runs = [line_string.coords for line_string in res.geoms if isinstance(line_string, shgeo.LineString)]
+        elif res.is_empty or len(res.coords) == 1:
+            runs = []
+        else:
+            runs = [res.coords]
+
+        if runs:
+            runs.sort(key=lambda seg: (InkstitchPoint(*seg[0]) - upper_left).length())
+
+            if flip:
+                runs.reverse()
+                runs = [tuple(reversed(run)) for run in runs]
+
+            rows.append(runs)
+
+        if end_row_spacing:
+            current_row_y += row_spacing + (end_row_spacing - row_spacing) * ((current_row_y - start) / height)
+        else:
+            current_row_y += row_spacing
+
+    return rows
+
+
+def star(center, outer_radius, inner_radius, points=24):
+    coords = []
+    for i in range(points * 2):
+        radius = outer_radius if i % 2 == 0 else inner_radius
+        theta = math.pi * i / points
+        coords.append((center[0] + radius * math.cos(theta), center[1] + radius * math.sin(theta)))
+    return coords
+
+
+def shapes():
+    size = 300 * PIXELS_PER_MM
+
+    yield "square", shgeo.MultiPolygon([shgeo.box(0, 0, size, size)])
+
+    disc = shgeo.Point(size / 2, size / 2).buffer(size / 2, 256)
+    yield "disc", shgeo.MultiPolygon([disc])
+
+    holes = [star((size * x / 4, size * y / 4), size / 12, size / 20) for x in (1, 2, 3) for y in (1, 2, 3)]
+    yield "disc with holes", shgeo.MultiPolygon([(disc.exterior.coords, holes)])
+
+    yield "star", shgeo.MultiPolygon([shgeo.Polygon(star((size / 2, size / 2), size / 2, size / 5, 64))])
+
+
+def time_it(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def max_difference(rows1, rows2):
+    if len(rows1) != len(rows2) or any(len(row1) != len(row2) for row1, row2 in zip(rows1, rows2)):
+        return float('inf')
+
+    difference = 0
+    for row1, row2 in zip(rows1, rows2):
+        for run1, run2 in zip(row1, row2):
+            for point1, point2 in zip(run1, run2):
+                difference = max(difference, math.hypot(point1[0] - point2[0], point1[1] - point2[1]))
+    return difference
+
+
+def main():
+    row_spacing = 0.2 * PIXELS_PER_MM
+    print("%-18s %6s %8s %14s %14s %8s %12s" % ("shape", "angle", "rows", "before rows/s", "after rows/s", "speedup", "max diff px"))
+
+    for name, shape in shapes():
+        for angle in (0, math.radians(30), math.radians(90)):
+            before, expected = time_it(shapely_grating, shape, angle, row_spacing)
+            after, rows = time_it(intersect_region_with_grating, shape, angle, row_spacing)
+
+            print("%-18s %6.1f %8d %14.0f %14.0f %7.1fx %12.2g" % (
+                name, math.degrees(angle), len(rows), len(expected) / before, len(rows) / after,
+                before / after, max_difference(expected, rows)))
+            sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""Measure how long inkstitch.py takes to import what an extension needs.
+
+Run from the root of the git clone:
+
+    python -m benchmarks.import_time [--repeat 5] [--top 15] [Output Zip ...]
+
+For each extension class (default: Output and Zip), a fresh Python process
+does the imports that inkstitch.py does and looks up the extension class in
+lib.extensions, with python -X importtime.  The same is done for all
+extensions at once, which is what the startup cost was before extensions
+were imported lazily.  Extensions that can't be imported (for example
+without wxPython) are listed and left out of that measurement.
+
+The total is the best of --repeat runs of the time spent importing, as
+reported by -X importtime, without Python's own startup (site).  The report
+lists the modules imported by the best run that took the longest,
+including their own imports.
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the imports at the top of inkstitch.py, then the extension class lookup
+CHILD = """
+import sys
+from inkex import errormsg
+from lxml.etree import XMLSyntaxError
+import lib.debug as debug
+from lib import extensions
+from lib.i18n import _
+from lib.utils import restore_stderr, save_stderr, version
+
+names = sys.argv[1:] or extensions.__all__
+for name in names:
+    try:
+        extensions.get_extension_class(name)
+    except ImportError as error:
+        print("%s: %s" % (name, error))
+"""
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+# imported by Python itself before any of our code runs
+STARTUP_MODULES = ("site", "encodings", "zipimport", "_frozen_importlib_external", "codecs", "io", "abc")
+
+
+def parse_import_time(stderr):
+    """Return [(module, depth, cumulative microseconds), ...] from -X importtime output."""
+
+    imports = []
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            imports.append((match.group(4), len(match.group(3)) // 2, int(match.group(2))))
+
+    return imports
+
+
+def total_seconds(imports):
+    return sum(cumulative for module, depth, cumulative in imports
+               if depth == 0 and module.split('.')[0] not in STARTUP_MODULES) / 1e6
+
+
+def measure(names):
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD] + names,
+                             cwd=ROOT, capture_output=True, text=True, check=True)
+    imports = parse_import_time(process.stderr)
+
+    return total_seconds(imports), imports, process.stdout.splitlines()
+
+
+def best_of(names, repeat):
+    return min((measure(names) for i in range(repeat)), key=lambda result: result[0])
+
+
+def print_report(label, seconds, imports, failures, top):
+    print("%s: %.3fs" % (label, seconds))
+    for failure in failures:
+        print("    not imported: %s" % failure)
+
+    slowest = sorted((item for item in imports if item[0].split('.')[0] not in STARTUP_MODULES), key=lambda item: item[2], reverse=True)
+    for module, depth, cumulative in slowest[:top]:
+        print("    %8.1f ms  %s" % (cumulative / 1e3, module))
+    print()
+
+
+def parse_arguments(args):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.import_time", description=__doc__.split("\n")[0])
+    parser.add_argument("extensions", nargs="*", default=["Output", "Zip"], help="extension class names (default: Output Zip)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement, the best one counts (default: 5)")
+    parser.add_argument("--top", type=int, default=15, help="number of slowest imports to list (default: 15)")
+
+    return parser.parse_args(args)
+
+
+def main(args):
+    args = parse_arguments(args)
+
+    all_seconds, imports, failures = best_of([], args.repeat)
+    print_report("all extensions", all_seconds, imports, failures, args.top)
+
+    print("%-24s %10s %10s" % ("extension", "seconds", "vs. all"))
+    results = []
+    for name in args.extensions:
+        seconds, imports, failures = best_of([name], args.repeat)
+        results.append((name, seconds, imports, failures))
+        print("%-24s %9.3fs %9.0f%%" % (name, seconds, 100.0 * seconds / all_seconds))
+    print()
+
+    for name, seconds, imports, failures in results:
+        print_report(name, seconds, imports, failures, args.top)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,88 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""Benchmark write_embroidery_files() against one write_embroidery_file() per format.
+
+Run from the root of the git clone:
+
+    python -m benchmarks.multi_format [--formats pec,pes,...] [--threads N]
+
+The stitch plan of each document in benchmarks/corpus.py is written in all
+of the --formats (by default all embroidery formats pyembroidery can write,
+like the Zip extension with everything selected), once file by file and
+once by write_embroidery_files(), which normalizes the pattern once for
+each distinct set of encoder settings.  The files must be byte for byte the
+same.  Times are the best of --repeat bundles.
+"""
+
+import argparse
+import os
+import sys
+import time
+from tempfile import TemporaryDirectory
+
+import pyembroidery
+
+from lib.output import (get_origin, plan_files, write_embroidery_file,
+                        write_embroidery_files)
+
+from .output import SETTINGS, stitch_plans
+
+FORMATS = [format['extension'] for format in pyembroidery.supported_formats() if 'writer' in format and format['category'] == 'embroidery']
+
+
+def write_one_by_one(file_paths, stitch_plan, svg, settings, max_workers):
+    for file_path in file_paths:
+        write_embroidery_file(file_path, stitch_plan, svg, dict(settings))
+
+
+def timed_bundle(write, output_dir, formats, stitch_plan, svg, repeat, max_workers):
+    file_paths = [os.path.join(output_dir, "bundle.%s" % extension) for extension in formats]
+
+    duration = float('inf')
+    for i in range(repeat):
+        start = time.perf_counter()
+        write(file_paths, stitch_plan, svg, dict(SETTINGS), max_workers=max_workers)
+        duration = min(duration, time.perf_counter() - start)
+
+    outputs = []
+    for file_path in file_paths:
+        with open(file_path, "rb") as output_file:
+            outputs.append(output_file.read())
+
+    return duration, outputs
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.multi_format", description=__doc__.split("\n")[0])
+    parser.add_argument("--formats", type=lambda formats: formats.split(","), default=FORMATS,
+                        help="comma-separated file formats (default: %s)" % ",".join(FORMATS))
+    parser.add_argument("--threads", type=int, default=None, help="maximum number of writer threads (default: Python's default)")
+    parser.add_argument("--repeat", type=int, default=3, help="bundles per document, the best time counts (default: 3)")
+    args = parser.parse_args(args)
+
+    print("%-26s %9s %9s %10s %10s %8s %s" % ("document", "stitches", "encodings", "one by one", "bundle", "speedup", "same"))
+
+    failed = False
+    with TemporaryDirectory() as output_dir:
+        for name, document, stitch_plan in stitch_plans():
+            svg = document.getroot()
+            origin = get_origin(svg, stitch_plan.bounding_box)
+            encodings = len(plan_files(["bundle.%s" % extension for extension in args.formats], origin, SETTINGS)[1])
+
+            one_by_one_time, expected = timed_bundle(write_one_by_one, output_dir, args.formats, stitch_plan, svg, args.repeat, args.threads)
+            bundle_time, outputs = timed_bundle(write_embroidery_files, output_dir, args.formats, stitch_plan, svg, args.repeat, args.threads)
+
+            different = [extension for extension, output, expected_output in zip(args.formats, outputs, expected) if output != expected_output]
+            failed = failed or bool(different)
+            print("%-26s %9d %9d %9.3fs %9.3fs %7.1fx %s" % (
+                name, stitch_plan.num_stitches, encodings, one_by_one_time, bundle_time, one_by_one_time / max(bundle_time, 1e-9),
+                "NO: " + ",".join(different) if different else "yes"))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
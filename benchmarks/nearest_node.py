@@ -0,0 +1,81 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""Benchmark the spatial lookups in auto_fill against the linear versions.
+
+Run from the root of the git clone:
+
+    python -m benchmarks.nearest_node
+
+For the fill stitch graph of a large disc with holes, this times tagging every
+node with its outline and projection, and looking up the nearest node for a
+number of points.  Both must give the same answers as the original code.
+"""
+
+import math
+import time
+
+from shapely import geometry as shgeo
+
+from lib.stitches.auto_fill import Outlines, build_fill_stitch_graph, nearest_node
+from lib.svg import PIXELS_PER_MM
+
+from .grating import shapes
+
+
+def linear_which_outline(shape, coords):
+    point = shgeo.Point(*coords)
+    outlines = list(shape.boundary)
+    outline_indices = list(range(len(outlines)))
+    return min(outline_indices, key=lambda index: outlines[index].distance(point))
+
+
+def linear_project(shape, coords, outline_index):
+    outline = list(shape.boundary)[outline_index]
+    return outline.project(shgeo.Point(*coords))
+
+
+def linear_nearest_node(nodes, point):
+    point = shgeo.Point(*point)
+    return min(nodes, key=lambda node: shgeo.Point(*node).distance(point))
+
+
+def main():
+    queries = 20
+    print("%-18s %8s %12s %12s %14s %14s %s" % ("shape", "nodes", "tag before", "tag after", "nearest before", "nearest after", "same"))
+
+    for name, shape in shapes():
+        graph = build_fill_stitch_graph(shape, math.radians(30), 0.2 * PIXELS_PER_MM, None)
+        nodes = list(graph)
+
+        start = time.perf_counter()
+        expected = [(linear_which_outline(shape, node), linear_project(shape, node, linear_which_outline(shape, node))) for node in nodes]
+        tag_before = time.perf_counter() - start
+
+        start = time.perf_counter()
+        outlines = Outlines(shape)
+        tags = [(outlines.which_outline(node), outlines.project(node, outlines.which_outline(node))) for node in nodes]
+        tag_after = time.perf_counter() - start
+
+        minx, miny, maxx, maxy = shape.bounds
+        points = [(minx + (maxx - minx) * i / queries, miny + (maxy - miny) * (i * 7 % queries) / queries) for i in range(queries)]
+        # a point exactly between two nodes
+        points.append(tuple((a + b) / 2 for a, b in zip(nodes[0], nodes[1])))
+
+        start = time.perf_counter()
+        expected_nearest = [linear_nearest_node(graph, point) for point in points]
+        nearest_before = time.perf_counter() - start
+
+        start = time.perf_counter()
+        nearest = [nearest_node(graph, point) for point in points]
+        nearest_after = time.perf_counter() - start
+
+        same = tags == expected and nearest == expected_nearest
+        print("%-18s %8d %11.2fs %11.2fs %13.2fs %13.2fs %s" % (
+            name, len(nodes), tag_before, tag_after, nearest_before, nearest_after, "yes" if same else "NO"))
+
+
+if __name__ == "__main__":
+    main()
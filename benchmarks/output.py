@@ -0,0 +1,150 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""Benchmark write_embroidery_file() against the stitch-by-stitch version.
+
+Run from the root of the git clone:
+
+    python -m benchmarks.output [--formats dst,exp,jef,pes]
+
+The stitch plan of each document in benchmarks/corpus.py is written in each
+format, by write_embroidery_file() and by the original implementation,
+which adds one stitch at a time to the EmbPattern and lets pyembroidery
+write it.  One document also gets STOPs and a stop_position command.  The
+files must be byte for byte the same.  Times are the best of --repeat
+writes.
+"""
+
+import argparse
+import os
+import sys
+import time
+from tempfile import TemporaryDirectory
+
+import pyembroidery
+from lxml import etree
+
+from lib.elements import embroider_serially, nodes_to_elements
+from lib.output import get_origin, write_embroidery_file
+from lib.stitch_plan import Stitch, stitch_groups_to_stitch_plan
+from lib.svg import PIXELS_PER_MM
+from lib.svg.tags import SVG_DEFS_TAG, SVG_SYMBOL_TAG, SVG_USE_TAG, XLINK_HREF
+
+from .corpus import CORPUS, needs_auto_satin
+from .pipeline import apply_auto_satin, embroiderable_nodes
+
+# JefWriter writes the current time into the file.
+SETTINGS = {"date": "20200101000000"}
+
+
+def get_command(stitch):
+    if stitch.jump:
+        return pyembroidery.JUMP
+    elif stitch.trim:
+        return pyembroidery.TRIM
+    elif stitch.color_change:
+        return pyembroidery.COLOR_CHANGE
+    elif stitch.stop:
+        return pyembroidery.STOP
+    else:
+        return pyembroidery.NEEDLE_AT
+
+
+def stitch_by_stitch_write_embroidery_file(file_path, stitch_plan, svg, settings):
+    """The original implementation."""
+
+    from lib.commands import global_command
+
+    origin = get_origin(svg, stitch_plan.bounding_box)
+
+    pattern = pyembroidery.EmbPattern()
+    stitch = Stitch(0, 0)
+
+    for color_block in stitch_plan:
+        pattern.add_thread(color_block.color.pyembroidery_thread)
+
+        for stitch in color_block:
+            if stitch.stop:
+                stop_position = global_command(svg, "stop_position")
+                if stop_position:
+                    pattern.add_stitch_absolute(pyembroidery.JUMP, stop_position.point.x, stop_position.point.y)
+            pattern.add_stitch_absolute(get_command(stitch), stitch.x, stitch.y)
+
+    pattern.add_stitch_absolute(pyembroidery.END, stitch.x, stitch.y)
+
+    scale = 10 / PIXELS_PER_MM
+    settings.update({"translate": -origin, "scale": (scale, scale), "full_jump": True})
+
+    if file_path.endswith('.csv'):
+        settings['max_stitch'] = float('inf')
+        settings['max_jump'] = float('inf')
+        settings['explicit_trim'] = False
+
+    pyembroidery.write(pattern, file_path, settings)
+
+
+def add_stops(document, stitch_plan):
+    defs = document.getroot().find(SVG_DEFS_TAG)
+    if defs is None:
+        defs = etree.SubElement(document.getroot(), SVG_DEFS_TAG)
+    etree.SubElement(defs, SVG_SYMBOL_TAG, {"id": "inkstitch_stop_position"})
+    etree.SubElement(document.getroot(), SVG_USE_TAG, {XLINK_HREF: "#inkstitch_stop_position", "x": "-50", "y": "-30"})
+
+    for color_block in stitch_plan:
+        color_block.add_stitch(stop=True)
+
+
+def stitch_plans():
+    for name, build in CORPUS.items():
+        document = build()
+        if needs_auto_satin(name):
+            apply_auto_satin(document)
+        elements = nodes_to_elements(embroiderable_nodes(document.getroot()))
+        stitch_plan = stitch_groups_to_stitch_plan(embroider_serially(elements))
+        yield name, document, stitch_plan
+
+        if name == "long satins":
+            add_stops(document, stitch_plan)
+            yield name + " + stops", document, stitch_plan
+
+
+def timed_write(write, path, stitch_plan, svg, repeat):
+    duration = float('inf')
+    for i in range(repeat):
+        start = time.perf_counter()
+        write(path, stitch_plan, svg, dict(SETTINGS))
+        duration = min(duration, time.perf_counter() - start)
+
+    with open(path, "rb") as output_file:
+        return duration, output_file.read()
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.output", description=__doc__.split("\n")[0])
+    parser.add_argument("--formats", type=lambda formats: formats.split(","), default=["dst", "exp", "jef", "pes", "vp3", "csv"],
+                        help="comma-separated file formats (default: dst,exp,jef,pes,vp3,csv)")
+    parser.add_argument("--repeat", type=int, default=3, help="writes per file, the best time counts (default: 3)")
+    args = parser.parse_args(args)
+
+    print("%-26s %-6s %9s %10s %10s %8s %s" % ("document", "format", "stitches", "original", "new", "speedup", "same"))
+
+    failed = False
+    with TemporaryDirectory() as output_dir:
+        for name, document, stitch_plan in stitch_plans():
+            for extension in args.formats:
+                path = os.path.join(output_dir, "output.%s" % extension)
+                original_time, expected = timed_write(stitch_by_stitch_write_embroidery_file, path, stitch_plan, document.getroot(), args.repeat)
+                new_time, output = timed_write(write_embroidery_file, path, stitch_plan, document.getroot(), args.repeat)
+
+                same = output == expected
+                failed = failed or not same
+                print("%-26s %-6s %9d %9.3fs %9.3fs %7.1fx %s" % (
+                    name, extension, stitch_plan.num_stitches, original_time, new_time, original_time / max(new_time, 1e-9), "yes" if same else "NO"))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
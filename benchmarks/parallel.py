@@ -0,0 +1,99 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""Check that parallel embroidery gives exactly the same result as serial.
+
+Run from the root of the git clone:
+
+    python -m benchmarks.parallel [file.svg ...]
+
+Every embroiderable path in each document is embroidered serially and with
+embroider_in_parallel().  The resulting stitch plans must be identical down to
+the last bit.  Without arguments, a synthetic document with fills, fills with
+holes, running stitch and satins is used.
+"""
+
+import json
+import math
+import random
+import sys
+import time
+
+import inkex
+
+from lib.elements import (embroider_in_parallel, embroider_serially,
+                          nodes_to_elements)
+from lib.stitch_plan import stitch_groups_to_stitch_plan
+from lib.svg.tags import EMBROIDERABLE_TAGS
+
+
+def synthetic_document(num_objects=40, seed=1):
+    random.seed(seed)
+    paths = []
+
+    for i in range(num_objects):
+        x, y = random.uniform(0, 600), random.uniform(0, 600)
+        size = random.uniform(20, 80)
+        color = "#%06x" % random.randint(0, 0xffffff)
+        curve = "M %f,%f c %f,%f %f,%f %f,%f" % (x, y, size, -size, 2 * size, size, 3 * size, 0)
+
+        if i % 4 == 0:
+            points = ["%f,%f" % (x + size * math.cos(t * math.pi / 10) * (1 + 0.3 * (t % 2)),
+                                 y + size * math.sin(t * math.pi / 10)) for t in range(20)]
+            paths.append('<path style="fill:%s" d="M %s Z"/>' % (color, " L ".join(points)))
+        elif i % 4 == 1:
+            paths.append('<path style="fill:%s;fill-rule:evenodd" d="M %f,%f h %f v %f h %f Z m %f,%f h %f v %f h %f Z"/>' %
+                         (color, x, y, 2 * size, 2 * size, -2 * size, size / 2, size / 2, size, size, -size))
+        elif i % 4 == 2:
+            paths.append('<path style="fill:none;stroke:%s;stroke-width:1" d="%s"/>' % (color, curve))
+        else:
+            paths.append('<path style="fill:none;stroke:%s;stroke-width:1" inkstitch:satin_column="true" d="%s %s"/>' %
+                         (color, curve, curve.replace("M %f,%f" % (x, y), "M %f,%f" % (x, y + 15))))
+
+    for i, path in enumerate(paths):
+        paths[i] = path.replace("<path ", '<path id="path%d" ' % i)
+
+    return inkex.load_svg(
+        ('<svg xmlns="http://www.w3.org/2000/svg" xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape" '
+         'xmlns:inkstitch="http://inkstitch.org/namespace" width="800" height="800" viewBox="0 0 800 800">'
+         '<g inkscape:groupmode="layer" id="layer1">%s</g></svg>' % "".join(paths)).encode('utf-8'))
+
+
+def load_elements(document):
+    return nodes_to_elements([node for node in document.getroot().iter() if node.tag in EMBROIDERABLE_TAGS])
+
+
+def stitch_plan_json(patches):
+    stitch_plan = stitch_groups_to_stitch_plan(patches)
+    return json.dumps(stitch_plan, default=lambda obj: obj.__json__() if hasattr(obj, '__json__') else str(obj))
+
+
+def main(paths):
+    if paths:
+        documents = [(path, lambda path=path: inkex.load_svg(path)) for path in paths]
+    else:
+        documents = [("synthetic", synthetic_document)]
+
+    failed = False
+    for name, load in documents:
+        # Load the document twice so that nothing cached on the elements in
+        # the serial run can leak into the parallel run.
+        start = time.perf_counter()
+        serial = stitch_plan_json(embroider_serially(load_elements(load())))
+        serial_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parallel = stitch_plan_json(embroider_in_parallel(load_elements(load())))
+        parallel_time = time.perf_counter() - start
+
+        identical = serial == parallel
+        failed = failed or not identical
+        print("%s: serial %.2fs, parallel %.2fs, %s" % (name, serial_time, parallel_time, "identical" if identical else "DIFFERENT"))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,331 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""Run documents through the whole stitch generation pipeline and measure each stage.
+
+Run from the root of the git clone:
+
+    python -m benchmarks.pipeline [--output run.json] [file.svg ...]
+    python -m benchmarks.pipeline --compare before.json after.json
+
+Without files, the documents in benchmarks/corpus.py are used.  Each document
+goes through the same stages as the Ink/Stitch output extensions, without
+Inkscape or a GUI:
+
+    load         build or parse the SVG document
+    auto_satin   (lettering only) run auto_satin on the text
+    elements     find the embroiderable nodes and call nodes_to_elements()
+    embroider    embroider_serially()
+    stitch_plan  stitch_groups_to_stitch_plan()
+    write        write_embroidery_file() for each of the --formats
+
+To see where the time goes inside the stages, set INKSTITCH_PROFILE to a file
+name (see Debug.enable_profiling() in lib/debug.py).
+
+The wall time of each stage is the best of --repeat runs.  Peak memory is
+measured in a separate run with tracemalloc, because tracing slows Python
+down a lot.  The results are written as JSON, along with the stitch counts
+of the stitch plan.
+
+--compare reads two such JSON files and flags regressions: stages that got
+more than --threshold slower or use that much more memory, ignoring tiny
+absolute differences.  Changed stitch counts are flagged too, because
+performance work shouldn't change the output.  (auto_satin's result depends
+on the order of a set of objects, so the lettering counts may change from
+one process to the next.  Compared to a run from before the vectorized fill
+grating, fill documents may change by a few stitches: its coordinates differ
+from shapely's by rounding error, which can break ties in auto_fill
+differently.)  The exit status is 1 if there's a regression.
+Timings are only comparable between runs on the same machine with the same
+--repeat.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from tempfile import TemporaryDirectory
+
+import inkex
+from lxml.etree import Comment
+
+from lib.commands import is_command
+from lib.elements import EmbroideryElement, embroider_serially, nodes_to_elements
+from lib.elements.clone import is_clone
+from lib.output import write_embroidery_file
+from lib.patterns import is_pattern
+from lib.stitch_plan import stitch_groups_to_stitch_plan
+from lib.stitches.auto_satin import auto_satin
+from lib.svg.tags import (CONNECTOR_TYPE, EMBROIDERABLE_TAGS, SVG_CLIPPATH_TAG,
+                          SVG_DEFS_TAG, SVG_GROUP_TAG, SVG_MASK_TAG,
+                          SVG_PATH_TAG)
+
+from .corpus import CORPUS, needs_auto_satin
+
+FORMAT_VERSION = 1
+STAGES = ("load", "auto_satin", "elements", "embroider", "stitch_plan", "write")
+
+# Differences below these are noise, no matter how large they are relative
+# to the baseline.
+MIN_SECONDS_DIFFERENCE = 0.1
+MIN_MEMORY_DIFFERENCE = 1024 * 1024
+
+
+def embroiderable_nodes(node):
+    """Like InkstitchExtension.descendants() with nothing selected.
+
+    The extensions can't be imported without wxPython, so this is the part
+    of it that matters for the documents we benchmark.
+    """
+
+    if node.tag == Comment or node.tag in (SVG_DEFS_TAG, SVG_MASK_TAG, SVG_CLIPPATH_TAG):
+        return []
+
+    if is_command(node) or node.get(CONNECTOR_TYPE):
+        return []
+
+    element = EmbroideryElement(node)
+    if (node.tag in EMBROIDERABLE_TAGS or node.tag == SVG_GROUP_TAG) and element.get_style('display', 'inline') is None:
+        return []
+
+    nodes = []
+    for child in node:
+        nodes.extend(embroiderable_nodes(child))
+
+    if (node.tag in EMBROIDERABLE_TAGS or is_clone(node)) and not is_pattern(node):
+        nodes.append(node)
+
+    return nodes
+
+
+def apply_auto_satin(document):
+    # like Font._apply_auto_satin() on a line of text
+    for layer in document.getroot().iterchildren(SVG_GROUP_TAG):
+        elements = nodes_to_elements(layer.iterdescendants(SVG_PATH_TAG))
+        if elements:
+            auto_satin(elements, preserve_order=True, trim=True)
+
+
+def reset_peak_memory():
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    else:
+        # Python < 3.9.  Memory allocated before the stage isn't traced any
+        # more, so freeing it doesn't lower the stage's peak.
+        tracemalloc.stop()
+        tracemalloc.start()
+
+
+class Measurements(object):
+    """Collects the time and peak memory of each stage of one run."""
+
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.seconds = {}
+        self.peak_memory = {}
+
+    @contextmanager
+    def stage(self, name):
+        if self.trace_memory:
+            reset_peak_memory()
+            memory_before = tracemalloc.get_traced_memory()[0]
+
+        start = time.perf_counter()
+        yield
+        self.seconds[name] = time.perf_counter() - start
+
+        if self.trace_memory:
+            self.peak_memory[name] = tracemalloc.get_traced_memory()[1] - memory_before
+
+
+def run_pipeline(load, run_auto_satin, formats, measurements):
+    with measurements.stage("load"):
+        document = load()
+
+    if run_auto_satin:
+        with measurements.stage("auto_satin"):
+            apply_auto_satin(document)
+
+    with measurements.stage("elements"):
+        elements = nodes_to_elements(embroiderable_nodes(document.getroot()))
+
+    with measurements.stage("embroider"):
+        stitch_groups = embroider_serially(elements)
+
+    with measurements.stage("stitch_plan"):
+        stitch_plan = stitch_groups_to_stitch_plan(stitch_groups)
+
+    with measurements.stage("write"), TemporaryDirectory() as output_dir:
+        for extension in formats:
+            write_embroidery_file(os.path.join(output_dir, "benchmark.%s" % extension), stitch_plan, document.getroot(), {})
+
+    return {
+        "elements": len(elements),
+        "stitch_groups": len(stitch_groups),
+        "color_blocks": stitch_plan.num_color_blocks,
+        "stitches": stitch_plan.num_stitches,
+        "trims": stitch_plan.num_trims,
+        "stops": stitch_plan.num_stops,
+    }
+
+
+def benchmark_document(load, run_auto_satin, formats, repeat, trace_memory):
+    best = {}
+    for i in range(repeat):
+        measurements = Measurements(trace_memory=False)
+        counts = run_pipeline(load, run_auto_satin, formats, measurements)
+        for stage, seconds in measurements.seconds.items():
+            best[stage] = min(seconds, best.get(stage, seconds))
+
+    stages = {stage: {"seconds": seconds} for stage, seconds in best.items()}
+
+    if trace_memory:
+        measurements = Measurements(trace_memory=True)
+        tracemalloc.start()
+        try:
+            run_pipeline(load, run_auto_satin, formats, measurements)
+        finally:
+            tracemalloc.stop()
+
+        for stage, peak_memory in measurements.peak_memory.items():
+            stages[stage]["peak_memory"] = peak_memory
+
+    return {
+        "stages": stages,
+        "total_seconds": sum(best.values()),
+        "counts": counts,
+    }
+
+
+def documents(paths):
+    if paths:
+        return [(os.path.basename(path), lambda path=path: inkex.load_svg(path), False) for path in paths]
+    else:
+        return [(name, build, needs_auto_satin(name)) for name, build in CORPUS.items()]
+
+
+def run(args):
+    results = {
+        "format_version": FORMAT_VERSION,
+        "created": datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "formats": args.formats,
+        "documents": {},
+    }
+
+    for name, load, run_auto_satin in documents(args.files):
+        result = benchmark_document(load, run_auto_satin, args.formats, args.repeat, not args.no_memory)
+        results["documents"][name] = result
+        print_result(name, result)
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    return 0
+
+
+def print_result(name, result):
+    # The JSON may go to stdout, so the table goes to stderr.
+    print("%s: %.2fs, %d stitches" % (name, result["total_seconds"], result["counts"]["stitches"]), file=sys.stderr)
+    for stage in STAGES:
+        if stage in result["stages"]:
+            measurement = result["stages"][stage]
+            memory = "%8.1f MB" % (measurement["peak_memory"] / 1e6) if "peak_memory" in measurement else ""
+            print("    %-12s %8.3fs %s" % (stage, measurement["seconds"], memory), file=sys.stderr)
+
+
+def compare_stage(old, new, threshold):
+    problems = []
+
+    if new["seconds"] - old["seconds"] > max(MIN_SECONDS_DIFFERENCE, old["seconds"] * threshold):
+        problems.append("slower")
+
+    if "peak_memory" in old and "peak_memory" in new:
+        if new["peak_memory"] - old["peak_memory"] > max(MIN_MEMORY_DIFFERENCE, old["peak_memory"] * threshold):
+            problems.append("more memory")
+
+    return problems
+
+
+def compare(old_path, new_path, threshold):
+    with open(old_path) as old_file, open(new_path) as new_file:
+        old_results = json.load(old_file)
+        new_results = json.load(new_file)
+
+    regressions = 0
+    print("%-24s %-12s %10s %10s %8s %10s %10s  %s" % ("document", "stage", "old s", "new s", "change", "old MB", "new MB", ""))
+
+    for name, new in new_results["documents"].items():
+        old = old_results["documents"].get(name)
+        if old is None:
+            print("%-24s (not in %s)" % (name, old_path))
+            continue
+
+        for stage in STAGES:
+            if stage not in new["stages"] or stage not in old["stages"]:
+                continue
+
+            old_stage = old["stages"][stage]
+            new_stage = new["stages"][stage]
+            problems = compare_stage(old_stage, new_stage, threshold)
+            regressions += bool(problems)
+
+            print("%-24s %-12s %10.3f %10.3f %+7.0f%% %10s %10s  %s" % (
+                name, stage, old_stage["seconds"], new_stage["seconds"],
+                100.0 * (new_stage["seconds"] - old_stage["seconds"]) / max(old_stage["seconds"], 1e-9),
+                format_memory(old_stage), format_memory(new_stage), "REGRESSION: " + ", ".join(problems) if problems else ""))
+
+        for count, value in new["counts"].items():
+            if old["counts"].get(count) != value:
+                print("%-24s %s changed from %s to %s" % (name, count, old["counts"].get(count), value))
+
+    print("%d regression(s)" % regressions)
+    return 1 if regressions else 0
+
+
+def format_memory(measurement):
+    if "peak_memory" in measurement:
+        return "%.1f" % (measurement["peak_memory"] / 1e6)
+    else:
+        return "-"
+
+
+def parse_arguments(args):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.pipeline", description=__doc__.split("\n")[0])
+    parser.add_argument("files", nargs="*", help="SVG files to run instead of the built-in corpus")
+    parser.add_argument("--output", "-o", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per document, the best time counts (default: 3)")
+    parser.add_argument("--formats", type=lambda formats: formats.split(","), default=["dst", "pes"],
+                        help="comma-separated file formats to write (default: dst,pes)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the memory measurement run")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two JSON results instead of running")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative increase in time or memory that counts as a regression (default: 0.2)")
+
+    return parser.parse_args(args)
+
+
+def main(args):
+    args = parse_arguments(args)
+
+    if args.compare:
+        return compare(args.compare[0], args.compare[1], args.threshold)
+    else:
+        return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
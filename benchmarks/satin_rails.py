@@ -0,0 +1,189 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""Benchmark SatinColumn.plot_points_on_rails() against the step-by-step version.
+
+Run from the root of the git clone:
+
+    python -m benchmarks.satin_rails
+
+Each satin is plotted with the settings that satin stitch, zigzag underlay
+and contour underlay use.  "max diff mm" is the largest distance between
+corresponding points of the two implementations ("inf" if the number of
+points differs); it must stay below 0.01 mm.
+"""
+
+import math
+import sys
+import time
+
+import inkex
+from shapely import geometry as shgeo
+
+from lib.svg import PIXELS_PER_MM
+
+from .parallel import load_elements
+
+
+def walk(path, start_pos, start_index, distance):
+    pos = start_pos
+    index = start_index
+    last_index = len(path) - 1
+    distance_remaining = distance
+
+    while True:
+        if index >= last_index:
+            return pos, index
+
+        segment_end = path[index + 1]
+        segment = segment_end - pos
+        segment_length = segment.length()
+
+        if segment_length > distance_remaining:
+            return pos + segment.unit() * distance_remaining, index
+        else:
+            index += 1
+            distance_remaining -= segment_length
+            pos = segment_end
+
+
+def stepping_plot_points_on_rails(satin, spacing, offset):  # noqa: C901
+    """The original implementation: step 0.05 px at a time along both rails."""
+
+    def add_pair(pos0, pos1):
+        pos0, pos1 = satin.offset_points(pos0, pos1, offset)
+        points[0].append(pos0)
+        points[1].append(pos1)
+
+    points = [[], []]
+    to_travel = 0
+
+    for section0, section1 in satin.flattened_sections:
+        pos0 = section0[0]
+        pos1 = section1[0]
+
+        len0 = shgeo.LineString(section0).length
+        len1 = shgeo.LineString(section1).length
+
+        last_index0 = len(section0) - 1
+        last_index1 = len(section1) - 1
+
+        if len0 == 0:
+            continue
+
+        ratio = len1 / len0
+
+        index0 = 0
+        index1 = 0
+
+        while index0 < last_index0 and index1 < last_index1:
+            old_center = shgeo.Point(x/2 for x in (pos0 + pos1))
+
+            while to_travel > 0 and index0 < last_index0 and index1 < last_index1:
+                pos0, index0 = walk(section0, pos0, index0, 0.05)
+                pos1, index1 = walk(section1, pos1, index1, 0.05 * ratio)
+
+                new_center = shgeo.Point(x/2 for x in (pos0 + pos1))
+                to_travel -= new_center.distance(old_center)
+                old_center = new_center
+
+            if to_travel <= 0:
+                add_pair(pos0, pos1)
+                to_travel = spacing
+
+    if to_travel > 0:
+        add_pair(pos0, pos1)
+
+    return points
+
+
+def circle(cx, cy, radius, start_angle=0):
+    # four cubic beziers
+    k = 0.5522847498 * radius
+    points = []
+    for i in range(4):
+        angle = start_angle + i * math.pi / 2
+        cos, sin = math.cos(angle), math.sin(angle)
+        points.append(((cx + radius * cos, cy + radius * sin), (-sin * k, cos * k)))
+
+    d = "M %f,%f" % points[0][0]
+    for (start, start_tangent), (end, end_tangent) in zip(points, points[1:] + points[:1]):
+        d += " C %f,%f %f,%f %f,%f" % (start[0] + start_tangent[0], start[1] + start_tangent[1],
+                                       end[0] - end_tangent[0], end[1] - end_tangent[1], end[0], end[1])
+
+    return d + " Z"
+
+
+def rungs(cx, cy, inner, outer, count):
+    d = ""
+    for i in range(count):
+        angle = (i + 0.5) * 2 * math.pi / count
+        cos, sin = math.cos(angle), math.sin(angle)
+        d += " M %f,%f L %f,%f" % (cx + (inner - 5) * cos, cy + (inner - 5) * sin, cx + (outer + 5) * cos, cy + (outer + 5) * sin)
+
+    return d
+
+
+def satins():
+    mm = PIXELS_PER_MM
+    paths = {
+        # a border around a 120 mm circle
+        "ring border": circle(0, 0, 60 * mm) + " " + circle(0, 0, 56 * mm) + rungs(0, 0, 56 * mm, 60 * mm, 12),
+        # a letter O: the outer rail is much longer than the inner one
+        "letter O": circle(0, 0, 20 * mm) + " " + circle(0, 0, 8 * mm) + rungs(0, 0, 8 * mm, 20 * mm, 4),
+        # a letter V, where the rails are far longer than the center line
+        "letter V": "M 0,0 L %f,%f L %f,0 M %f,0 L %f,%f L %f,0" % (
+            20 * mm, 80 * mm, 40 * mm, 6 * mm, 20 * mm, 70 * mm, 34 * mm),
+        # a wavy 200 mm column
+        "wave": "M 0,0 C %f,%f %f,%f %f,0 S %f,%f %f,0 M 0,%f C %f,%f %f,%f %f,%f S %f,%f %f,%f" % (
+            30 * mm, -40 * mm, 70 * mm, 40 * mm, 100 * mm, 170 * mm, -40 * mm, 200 * mm,
+            5 * mm, 30 * mm, -35 * mm, 70 * mm, 45 * mm, 100 * mm, 5 * mm, 170 * mm, -35 * mm, 200 * mm, 5 * mm),
+    }
+
+    svg = ('<svg xmlns="http://www.w3.org/2000/svg" xmlns:inkstitch="http://inkstitch.org/namespace" width="2000" height="2000">%s</svg>' %
+           "".join('<path id="%s" style="fill:none;stroke:#000000" inkstitch:satin_column="true" d="%s"/>' % (name, d)
+                   for name, d in paths.items()))
+
+    return zip(paths, load_elements(inkex.load_svg(svg.encode('utf-8'))))
+
+
+def max_difference(points, expected):
+    if [len(side) for side in points] != [len(side) for side in expected]:
+        return float('inf')
+
+    return max((point - expected_point).length() for side, expected_side in zip(points, expected)
+               for point, expected_point in zip(side, expected_side)) / PIXELS_PER_MM
+
+
+def main():
+    print("%-14s %-16s %8s %10s %10s %8s %12s" % ("satin", "settings", "points", "stepping", "numpy", "speedup", "max diff mm"))
+
+    failed = False
+    for name, satin in satins():
+        settings = [
+            ("satin", satin.zigzag_spacing, satin.pull_compensation),
+            ("zigzag underlay", satin.zigzag_underlay_spacing / 2.0, -satin.zigzag_underlay_inset),
+            ("contour underlay", satin.contour_underlay_stitch_length, -satin.contour_underlay_inset),
+        ]
+
+        for label, spacing, offset in settings:
+            start = time.perf_counter()
+            expected = stepping_plot_points_on_rails(satin, spacing, offset)
+            stepping_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            points = satin.plot_points_on_rails(spacing, offset)
+            numpy_time = time.perf_counter() - start
+
+            difference = max_difference(points, expected)
+            failed = failed or not difference < 0.01
+            print("%-14s %-16s %8d %9.2fs %9.3fs %7.0fx %12.6f" % (
+                name, label, len(expected[0]), stepping_time, numpy_time, stepping_time / max(numpy_time, 1e-9), difference))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
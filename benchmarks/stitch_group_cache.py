@@ -0,0 +1,78 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""Check that the stitch group cache gives exactly the same result as embroidering.
+
+Run from the root of the git clone:
+
+    python -m benchmarks.stitch_group_cache [file.svg ...]
+
+Each document is embroidered without the cache, then twice with an empty
+temporary cache (cold and warm), and finally once more after changing a
+single object, which should be the only cache miss.  All stitch plans must
+be identical to the uncached one.
+"""
+
+import sys
+import time
+from tempfile import TemporaryDirectory
+
+import inkex
+
+from lib.elements import embroider_serially
+from lib.stitch_plan import StitchGroupCache
+
+from .parallel import load_elements, stitch_plan_json, synthetic_document
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def change_one_object(document):
+    for node in document.getroot().iter():
+        if node.get('style', '').startswith('fill:#'):
+            node.set('style', node.get('style').replace('fill:#', 'fill:#1', 1)[:12])
+            return
+
+
+def main(paths):
+    if paths:
+        documents = [(path, lambda path=path: inkex.load_svg(path)) for path in paths]
+    else:
+        documents = [("synthetic", synthetic_document)]
+
+    failed = False
+    for name, load in documents:
+        with TemporaryDirectory() as cache_dir:
+            uncached_time, uncached = timed(embroider_serially, load_elements(load()))
+            uncached = stitch_plan_json(uncached)
+            print("%s: uncached %.2fs" % (name, uncached_time))
+
+            for run in ("cold", "warm"):
+                cache = StitchGroupCache(100 * 1024 * 1024, cache_dir)
+                run_time, patches = timed(embroider_serially, load_elements(load()), cache=cache)
+                identical = stitch_plan_json(patches) == uncached
+                failed = failed or not identical
+                print("    %s cache %.2fs, %d hits, %d misses, %s" % (
+                    run, run_time, cache.hits, cache.misses, "identical" if identical else "DIFFERENT"))
+
+            document = load()
+            change_one_object(document)
+            cache = StitchGroupCache(100 * 1024 * 1024, cache_dir)
+            run_time, patches = timed(embroider_serially, load_elements(document), cache=cache)
+            expected = stitch_plan_json(embroider_serially(load_elements(document)))
+            identical = stitch_plan_json(patches) == expected
+            failed = failed or not identical
+            print("    one object changed %.2fs, %d hits, %d misses, %s" % (
+                run_time, cache.hits, cache.misses, "identical" if identical else "DIFFERENT"))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,157 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""Compare the binary stitch plan format with JSON.
+
+Run from the root of the git clone:
+
+    python -m benchmarks.stitch_plan_format [--copies N] [--node]
+
+The stitch plan of each document in benchmarks/corpus.py, and one with
+--copies of all of them (about 200k stitches by default), is encoded as JSON
+like the /stitch_plan API does it and with StitchPlan.to_bytes(), then
+decoded again.  The decoded stitch plan must give the same JSON as the
+original.  The uncompressed format is also read from a memory-mapped file.
+
+With --node, electron/src/lib/stitch_plan.js decodes the binary format
+too, and its result must equal the JSON.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import subprocess
+import sys
+import time
+from tempfile import TemporaryDirectory
+
+from lib.stitch_plan import StitchPlan
+from lib.stitch_plan.binary import COMPRESSIONS, _zstandard
+from lib.utils.json import InkStitchJSONEncoder
+
+from .output import stitch_plans
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+NODE_DECODER = """
+const fs = require('fs')
+const stitchPlan = require(process.argv[1])
+const buffer = fs.readFileSync(process.argv[2])
+const decoded = stitchPlan.decode(buffer.buffer.slice(buffer.byteOffset, buffer.byteOffset + buffer.length))
+fs.writeFileSync(process.argv[3], JSON.stringify(decoded))
+"""
+
+
+def to_json(stitch_plan):
+    return json.dumps(stitch_plan, cls=InkStitchJSONEncoder)
+
+
+def normalized_json(data):
+    # Python and JavaScript write some floats differently; round trip
+    # through the parser so that only the values are compared.
+    return json.loads(data if isinstance(data, str) else json.dumps(data))
+
+
+def combined_stitch_plan(stitch_plans, copies):
+    stitch_plan = StitchPlan()
+    for i in range(copies):
+        for plan in stitch_plans:
+            stitch_plan.color_blocks.extend(plan.color_blocks)
+
+    return stitch_plan
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def compressions():
+    try:
+        _zstandard()
+        return list(COMPRESSIONS)
+    except ValueError:
+        return [compression for compression in COMPRESSIONS if compression != "zstd"]
+
+
+def check_node(encoded, expected, output_dir):
+    binary_path = os.path.join(output_dir, "plan.bin")
+    json_path = os.path.join(output_dir, "plan.json")
+    with open(binary_path, "wb") as binary_file:
+        binary_file.write(encoded)
+
+    subprocess.run(["node", "-e", NODE_DECODER, os.path.join(ROOT, "electron", "src", "lib", "stitch_plan.js"), binary_path, json_path],
+                   check=True)
+    with open(json_path) as json_file:
+        return normalized_json(json_file.read()) == expected
+
+
+def check_mmap(encoded, expected, output_dir):
+    path = os.path.join(output_dir, "plan.bin")
+    with open(path, "wb") as binary_file:
+        binary_file.write(encoded)
+
+    with open(path, "rb") as binary_file:
+        mapped = mmap.mmap(binary_file.fileno(), 0, access=mmap.ACCESS_READ)
+        stitch_plan = StitchPlan.from_bytes(mapped)
+        same = normalized_json(to_json(stitch_plan)) == expected
+
+        # the arrays are views of the mmap, so they have to go first
+        del stitch_plan
+        mapped.close()
+
+    return same
+
+
+def benchmark(name, stitch_plan, args, output_dir):
+    json_encode_time, encoded_json = timed(to_json, stitch_plan)
+    json_decode_time, decoded_json = timed(json.loads, encoded_json)
+    expected = normalized_json(encoded_json)
+    print("%-24s %-6s %9d %10.1f %9.3fs %9.3fs" % (
+        name, "json", stitch_plan.num_stitches, len(encoded_json) / 1e6, json_encode_time, json_decode_time))
+
+    failed = False
+    for compression in compressions():
+        encode_time, encoded = timed(stitch_plan.to_bytes, compression)
+        decode_time, decoded = timed(StitchPlan.from_bytes, encoded)
+
+        same = normalized_json(to_json(decoded)) == expected
+        if compression is None:
+            same = same and check_mmap(encoded, expected, output_dir)
+            if args.node:
+                same = same and check_node(encoded, expected, output_dir)
+
+        failed = failed or not same
+        print("%-24s %-6s %9d %10.1f %9.3fs %9.3fs %s" % (
+            name, compression or "binary", stitch_plan.num_stitches, len(encoded) / 1e6, encode_time, decode_time, "yes" if same else "NO"))
+
+    return failed
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.stitch_plan_format", description=__doc__.split("\n")[0])
+    parser.add_argument("--copies", type=int, default=2, help="copies of the whole corpus in the combined stitch plan (default: 2)")
+    parser.add_argument("--node", action="store_true", help="also decode with electron/src/lib/stitch_plan.js in Node.js")
+    args = parser.parse_args(args)
+
+    print("%-24s %-6s %9s %10s %10s %10s %s" % ("document", "format", "stitches", "size MB", "encode", "decode", "same"))
+
+    plans = []
+    failed = False
+    with TemporaryDirectory() as output_dir:
+        for name, document, stitch_plan in stitch_plans():
+            plans.append(stitch_plan)
+            failed = benchmark(name, stitch_plan, args, output_dir) or failed
+
+        combined = combined_stitch_plan(plans, args.copies)
+        failed = benchmark("all x %d" % args.copies, combined, args, output_dir) or failed
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,197 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""Benchmark add_ties() against the stitch-by-stitch version.
+
+Run from the root of the git clone:
+
+    python -m benchmarks.ties [--random N] [--repeat N]
+
+The stitch plan of each document in benchmarks/corpus.py is built without
+ties, and then gets its ties from add_ties() and from the original
+implementation, which walks the Stitch objects one by one.  So do --random
+stitch plans with all kinds of jumps, trims, stops, tie modes, manual
+stitches, tags, stitch colors and short stitches.  The stitch plans must be
+identical and give byte for byte the same DST file.  Times are the best of
+--repeat runs.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from copy import deepcopy
+from tempfile import TemporaryDirectory
+
+from lib.elements import embroider_serially, nodes_to_elements
+from lib.output import write_embroidery_file
+from lib.stitch_plan import Stitch, StitchPlan, stitch_groups_to_stitch_plan
+from lib.stitch_plan.ties import add_ties
+from lib.svg import PIXELS_PER_MM
+
+from .corpus import CORPUS, make_document, needs_auto_satin
+from .pipeline import apply_auto_satin, embroiderable_nodes
+
+
+def add_tie(stitches, tie_path):
+    if len(tie_path) < 2 or tie_path[0].no_ties:
+        return
+
+    to_previous = tie_path[1] - tie_path[0]
+    length = to_previous.length()
+    if length > 0.5 * PIXELS_PER_MM:
+        length = min(length, 1.5 * PIXELS_PER_MM)
+
+        direction = to_previous.unit()
+        for delta in (0.5, 1.0, 0.5, 0):
+            stitches.append(Stitch(tie_path[0] + delta * length * direction))
+    else:
+        for i in (1, 0, 1, 0):
+            stitches.append(deepcopy(tie_path[i]))
+
+
+def add_tie_off(stitches):
+    if stitches[-1].tie_modus not in [1, 3] or stitches[-1].force_lock_stitches:
+        add_tie(stitches, stitches[-1:-3:-1])
+
+
+def add_tie_in(stitches, upcoming_stitches):
+    if stitches[0].tie_modus not in [2, 3]:
+        add_tie(stitches, upcoming_stitches)
+
+
+def stitch_by_stitch_add_ties(stitch_plan):
+    """The original implementation."""
+
+    need_tie_in = True
+    for color_block in stitch_plan:
+        stitches = color_block.stitches
+        new_stitches = []
+        for i, stitch in enumerate(stitches):
+            is_special = stitch.trim or stitch.jump or stitch.color_change or stitch.stop
+
+            if is_special and not need_tie_in:
+                add_tie_off(new_stitches)
+                new_stitches.append(stitch)
+                need_tie_in = True
+            elif need_tie_in and not is_special:
+                new_stitches.append(stitch)
+                add_tie_in(new_stitches, upcoming_stitches=stitches[i:i + 2])
+                need_tie_in = False
+            else:
+                new_stitches.append(stitch)
+
+        color_block.replace_stitches(new_stitches)
+
+    if not need_tie_in:
+        stitches = color_block.stitches
+        add_tie_off(stitches)
+        color_block.replace_stitches(stitches)
+
+
+def corpus_stitch_plans():
+    for name, build in CORPUS.items():
+        document = build()
+        if needs_auto_satin(name):
+            apply_auto_satin(document)
+        elements = nodes_to_elements(embroiderable_nodes(document.getroot()))
+        yield name, document.getroot(), stitch_groups_to_stitch_plan(embroider_serially(elements), disable_ties=True)
+
+
+def random_stitch(rng, x, y):
+    # mostly regular stitches, some of them too short for a tie that travels
+    step = rng.choice([0.05, 0.3, 1, 3]) * PIXELS_PER_MM
+    return Stitch(x + rng.uniform(-step, step), y + rng.uniform(-step, step),
+                  color=rng.choice([None] * 9 + ["#ff0000"]),
+                  jump=rng.random() < 0.05,
+                  trim=rng.random() < 0.05,
+                  stop=rng.random() < 0.01,
+                  color_change=rng.random() < 0.01,
+                  tie_modus=rng.choice([0, 0, 0, 1, 2, 3]),
+                  force_lock_stitches=rng.random() < 0.1,
+                  no_ties=rng.random() < 0.05,
+                  tags=rng.choice([None, None, ["satin_column"], ["fill_row_start", "ties"]]))
+
+
+def random_stitch_plans(count):
+    rng = random.Random(1)
+    svg = make_document("").getroot()
+    for i in range(count):
+        stitch_plan = StitchPlan()
+        x = y = 0
+        for block in range(rng.randint(1, 4)):
+            stitches = []
+            for j in range(rng.choice([1, 2, 3, 10, 200])):
+                stitch = random_stitch(rng, x, y)
+                x, y = stitch.x, stitch.y
+                stitches.append(stitch)
+            # like generate_color_blocks(), every block but the last ends with a color change
+            stitches.append(Stitch(x, y, color_change=True))
+            stitch_plan.new_color_block(rng.choice(["#000000", "#00ff00", "#0000ff"]), stitches)
+        stitch_plan.color_blocks[-1].replace_stitches(stitch_plan.color_blocks[-1].stitches[:-1])
+
+        yield "random %d" % i, svg, stitch_plan
+
+
+def copy_stitch_plan(stitch_plan):
+    return StitchPlan.from_bytes(stitch_plan.to_bytes())
+
+
+def timed_ties(add, stitch_plan, repeat):
+    duration = float('inf')
+    for i in range(repeat):
+        copy = copy_stitch_plan(stitch_plan)
+        start = time.perf_counter()
+        add(copy)
+        duration = min(duration, time.perf_counter() - start)
+
+    return duration, copy
+
+
+def dst(path, stitch_plan, svg):
+    write_embroidery_file(path, stitch_plan, svg, {})
+    with open(path, "rb") as dst_file:
+        return dst_file.read()
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.ties", description=__doc__.split("\n")[0])
+    parser.add_argument("--random", type=int, default=500, help="number of random stitch plans (default: 500)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stitch plan, the best time counts (default: 3)")
+    args = parser.parse_args(args)
+
+    print("%-26s %9s %10s %10s %8s %s" % ("document", "stitches", "original", "new", "speedup", "same"))
+
+    failed = False
+    random_failures = 0
+    original_total = new_total = 0
+    with TemporaryDirectory() as output_dir:
+        path = os.path.join(output_dir, "ties.dst")
+        for name, svg, stitch_plan in list(corpus_stitch_plans()) + list(random_stitch_plans(args.random)):
+            original_time, expected = timed_ties(stitch_by_stitch_add_ties, stitch_plan, args.repeat)
+            new_time, result = timed_ties(add_ties, stitch_plan, args.repeat)
+
+            same = result.to_bytes() == expected.to_bytes() and dst(path, result, svg) == dst(path, expected, svg)
+            failed = failed or not same
+            if name.startswith("random"):
+                original_total += original_time
+                new_total += new_time
+                random_failures += not same
+                if same:
+                    continue
+
+            print("%-26s %9d %9.3fs %9.3fs %7.1fx %s" % (
+                name, expected.num_stitches, original_time, new_time, original_time / max(new_time, 1e-9), "yes" if same else "NO"))
+
+    print("%-26s %9s %9.3fs %9.3fs %7.1fx %s" % (
+        "%d random" % args.random, "", original_total, new_total, original_total / max(new_total, 1e-9),
+        "NO: %d" % random_failures if random_failures else "yes"))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
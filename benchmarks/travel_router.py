@@ -0,0 +1,100 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""Benchmark TravelRouter against networkx.shortest_path() on the travel graph.
+
+Run from the root of the git clone:
+
+    python -m benchmarks.travel_router
+
+For each shape (50 mm across), the whole auto-fill stitch path is routed
+twice: once with networkx on the travel graph (the original implementation)
+and once with TravelRouter.  "different" counts the travel paths that differ;
+they must never be longer than the networkx ones, only differ where two paths
+are equally short.
+"""
+
+import math
+import time
+
+import networkx
+from shapely.affinity import scale
+
+from lib.stitches.auto_fill import (build_fill_stitch_graph, build_travel_graph,
+                                    find_stitch_path, path_to_stitches)
+from lib.stitches.travel_router import TravelRouter
+from lib.svg import PIXELS_PER_MM
+
+from .grating import shapes
+
+
+class NetworkxRouter(object):
+    """The original implementation, with the TravelRouter interface."""
+
+    def __init__(self, graph):
+        self.graph = graph.copy()
+        self.searches = self.expanded_nodes = self.removed_edges = 0
+        self.routing_time = 0.0
+
+    def remove_edges(self, edges):
+        self.graph.remove_edges_from(edges)
+
+    def shortest_path(self, start, end):
+        start_time = time.perf_counter()
+        self.searches += 1
+        path = networkx.shortest_path(self.graph, start, end, weight='weight')
+        self.routing_time += time.perf_counter() - start_time
+        return path
+
+    def cost(self, path):
+        return sum(min(data.get('weight', 1) for data in self.graph[start][end].values()) for start, end in zip(path, path[1:]))
+
+
+class ComparingRouter(TravelRouter):
+    def __init__(self, graph):
+        TravelRouter.__init__(self, graph)
+        self.reference = NetworkxRouter(graph)
+        self.different = 0
+        self.longer = 0
+
+    def remove_edges(self, edges):
+        edges = list(edges)
+        TravelRouter.remove_edges(self, edges)
+        self.reference.remove_edges(edges)
+
+    def shortest_path(self, start, end):
+        path = TravelRouter.shortest_path(self, start, end)
+        expected = self.reference.shortest_path(start, end)
+
+        if path != expected:
+            self.different += 1
+            if self.reference.cost(path) > self.reference.cost(expected) * (1 + 1e-9):
+                self.longer += 1
+
+        return path
+
+
+def main():
+    angle = math.radians(30)
+    row_spacing = 0.25 * PIXELS_PER_MM
+    print("%-18s %8s %8s %12s %12s %8s %10s %7s" % ("shape", "nodes", "searches", "networkx", "router", "speedup", "different", "longer"))
+
+    for name, shape in shapes():
+        # 50 mm across; the graphs of the 300 mm shapes take ages to build
+        shape = scale(shape, 1 / 6.0, 1 / 6.0)
+        fill_stitch_graph = build_fill_stitch_graph(shape, angle, row_spacing, None)
+        travel_graph = build_travel_graph(fill_stitch_graph, shape, angle, True)
+        path = find_stitch_path(fill_stitch_graph, travel_graph)
+
+        router = ComparingRouter(travel_graph)
+        path_to_stitches(path, router, fill_stitch_graph, angle, row_spacing, 3 * PIXELS_PER_MM, 1.5 * PIXELS_PER_MM, 4, True)
+
+        print("%-18s %8d %8d %11.2fs %11.2fs %7.1fx %10d %7d" % (
+            name, len(router.nodes), router.searches, router.reference.routing_time, router.routing_time,
+            router.reference.routing_time / max(router.routing_time, 1e-9), router.different, router.longer))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+/*
+ * Authors: see git history
+ *
+ * Copyright (c) 2010 Authors
+ * Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+ *
+ */
+
+// Reads the binary stitch plan format that the API sends if we ask for it.
+// The layout is described in lib/stitch_plan/binary.py.  Only uncompressed
+// stitch plans are supported, which is what the API sends.
+
+const MIMETYPE = 'application/x-inkstitch-stitch-plan'
+// the binary form of /stitch_plan/stream, see lib/api/stitch_plan.py
+const STREAM_MIMETYPE = `${MIMETYPE}-stream`
+const FRAME_LENGTH_SIZE = 4
+const MAGIC = 'INKSTPLN'
+const FORMAT_VERSION = 1
+const HEADER_SIZE = 24
+
+// stitch flags, see lib/stitch_plan/stitch.py
+const JUMP = 1
+const TRIM = 2
+const STOP = 4
+const COLOR_CHANGE = 8
+const FORCE_LOCK_STITCHES = 16
+const NO_TIES = 32
+const TIE_MODUS_SHIFT = 6
+
+function tagNames (low, high, names) {
+  let tags = []
+  for (let bit = 0; bit < names.length; bit++) {
+    let word = bit < 32 ? low : high
+    if ((word >>> (bit % 32)) & 1) {
+      tags.push(names[bit])
+    }
+  }
+  return tags
+}
+
+// Decode an ArrayBuffer into the same structure as the JSON stitch plan.
+function decode (buffer) {
+  let view = new DataView(buffer)
+  let magic = String.fromCharCode(...new Uint8Array(buffer, 0, MAGIC.length))
+  if (buffer.byteLength < HEADER_SIZE || magic !== MAGIC) {
+    throw new Error('not an Ink/Stitch stitch plan')
+  }
+
+  let version = view.getUint16(8, true)
+  let compression = view.getUint16(10, true)
+  let metadataLength = view.getUint32(12, true)
+  if (version > FORMAT_VERSION) {
+    throw new Error(`stitch plan format version ${version} is not supported`)
+  }
+  if (compression !== 0) {
+    throw new Error('compressed stitch plans are not supported')
+  }
+
+  let metadata = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, HEADER_SIZE, metadataLength)))
+  let threads = metadata.threads
+  let thread = index => (index === null || index === undefined) ? null : threads[index]
+
+  // The columns are aligned to 8 bytes in the buffer, so they can be read
+  // through typed arrays.  Typed arrays use the byte order of the machine,
+  // which is little-endian on everything Electron runs on.
+  let offset = HEADER_SIZE + metadataLength
+  let colorBlocks = metadata.color_blocks.map(block => {
+    let count = block.stitches
+    let x = new Float64Array(buffer, offset, count)
+    offset += count * 8
+    let y = new Float64Array(buffer, offset, count)
+    offset += count * 8
+    let tags = new Uint32Array(buffer, offset, count * 2)
+    offset += count * 8
+    let flags = new Uint8Array(buffer, offset, count)
+    offset += count + (8 - count % 8) % 8
+
+    let stitches = new Array(count)
+    for (let i = 0; i < count; i++) {
+      stitches[i] = {
+        x: x[i],
+        y: y[i],
+        color: thread(block.stitch_threads[i]),
+        jump: Boolean(flags[i] & JUMP),
+        trim: Boolean(flags[i] & TRIM),
+        stop: Boolean(flags[i] & STOP),
+        color_change: Boolean(flags[i] & COLOR_CHANGE),
+        force_lock_stitches: Boolean(flags[i] & FORCE_LOCK_STITCHES),
+        tie_modus: flags[i] >> TIE_MODUS_SHIFT,
+        no_ties: Boolean(flags[i] & NO_TIES),
+        tags: tagNames(tags[2 * i], tags[2 * i + 1], metadata.tags)
+      }
+    }
+
+    return {color: thread(block.thread), stitches: stitches}
+  })
+
+  return Object.assign({color_blocks: colorBlocks}, metadata.summary)
+}
+
+function decodeFrame (frame) {
+  let magic = String.fromCharCode(...frame.subarray(0, MAGIC.length))
+  if (magic === MAGIC) {
+    // a stitch plan with one color block.  Copy it, so that its columns
+    // are aligned in their own buffer.
+    let colorBlock = decode(frame.slice().buffer).color_blocks[0]
+    return {type: 'color_block', color_block: colorBlock}
+  } else {
+    return JSON.parse(new TextDecoder().decode(frame))
+  }
+}
+
+// Splits the chunks of a STREAM_MIMETYPE response into its messages.  Each
+// frame is a uint32 length (little-endian) and then either a color block in
+// the binary format or a message as JSON.  The messages are the same as the
+// lines of the newline-delimited JSON stream.
+class FrameReader {
+  constructor () {
+    this.buffered = new Uint8Array(0)
+  }
+
+  // Add a chunk (Uint8Array) and return the messages it completes.
+  push (chunk) {
+    let buffered = new Uint8Array(this.buffered.length + chunk.length)
+    buffered.set(this.buffered)
+    buffered.set(chunk, this.buffered.length)
+
+    let messages = []
+    let offset = 0
+    while (buffered.length - offset >= FRAME_LENGTH_SIZE) {
+      let length = new DataView(buffered.buffer, offset, FRAME_LENGTH_SIZE).getUint32(0, true)
+      let end = offset + FRAME_LENGTH_SIZE + length
+      if (end > buffered.length) {
+        break
+      }
+
+      messages.push(decodeFrame(buffered.subarray(offset + FRAME_LENGTH_SIZE, end)))
+      offset = end
+    }
+
+    this.buffered = buffered.slice(offset)
+    return messages
+  }
+}
+
+module.exports = {
+  MIMETYPE,
+  STREAM_MIMETYPE,
+  decode,
+  FrameReader
+}
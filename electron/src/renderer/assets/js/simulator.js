@@ -7,6 +7,7 @@
  */
 
 const inkStitch = require("../../../lib/api")
+const stitchPlanFormat = require("../../../lib/stitch_plan")
 const Mousetrap = require("mousetrap")
 import { SVG } from '@svgdotjs/svg.js'
 require('@svgdotjs/svg.panzoom.js/src/svg.panzoom.js')
@@ -34,6 +35,7 @@ export default {
   data: function () {
     return {
       loading: false,
+      error: null,
       controlsExpanded: true,
       infoExpanded: false,
       infoMaxHeight: 0,
@@ -391,6 +393,132 @@ export default {
         this.scaleLabel.text(`${mm} mm`)
       }, 100, {leading: true, trailing: true}
     ),
+    loadStitchPlan() {
+      // The stitch plan arrives one color block at a time (see
+      // lib/api/stitch_plan.py), so we can show and animate the first
+      // colors while the rest is still being embroidered.  We ask for the
+      // binary form, which is much smaller and faster to decode than JSON.
+      let headers = {Accept: `${stitchPlanFormat.STREAM_MIMETYPE}, application/x-ndjson;q=0.5`}
+      let finished = false
+      fetch(`${inkStitch.defaults.baseURL}stitch_plan/stream`, {headers: headers}).then(response => {
+        if (!response.ok) {
+          return response.text().then(text => {
+            throw new Error(text || `${response.status} ${response.statusText}`)
+          })
+        }
+
+        let reader = response.body.getReader()
+        let split = null
+        if ((response.headers.get('content-type') || '').startsWith(stitchPlanFormat.STREAM_MIMETYPE)) {
+          let frames = new stitchPlanFormat.FrameReader()
+          split = value => frames.push(value)
+        } else {
+          split = this.ndjsonSplitter()
+        }
+
+        let read = () => reader.read().then(({done, value}) => {
+          if (done) {
+            if (!finished) {
+              throw new Error("The stitch plan ended before it was complete.")
+            }
+            return
+          }
+
+          split(value).forEach(message => {
+            finished = finished || message.type === "end" || message.type === "cancelled"
+            this.handleStitchPlanMessage(message)
+          })
+
+          return read()
+        })
+
+        return read()
+      }).catch(error => {
+        this.loading = false
+        this.error = error.message || String(error)
+      })
+    },
+    ndjsonSplitter() {
+      let decoder = new TextDecoder()
+      let buffered = ""
+
+      return value => {
+        buffered += decoder.decode(value, {stream: true})
+        let lines = buffered.split("\n")
+        buffered = lines.pop()
+        return lines.filter(line => line).map(line => JSON.parse(line))
+      }
+    },
+    handleStitchPlanMessage(message) {
+      if (message.type === "color_block") {
+        this.addColorBlock(message.color_block)
+      } else if (message.type === "end") {
+        delete message.type
+        Object.assign(this.stitchPlan, message)
+        this.loading = false
+      }
+    },
+    addColorBlock(color_block) {
+      this.stitchPlan.color_blocks.push(color_block)
+
+      let color = `${color_block.color.visible_on_white.hex}`
+      let path_attrs = {fill: "none", stroke: color, "stroke-width": 0.3}
+      let marker = this.generateMarker(color)
+
+      let stitching = false
+      let prevStitch = null
+      color_block.stitches.forEach(stitch => {
+        let path = null
+        if (stitching && prevStitch) {
+          path = this.simulation.path(`M${prevStitch.x},${prevStitch.y} ${stitch.x},${stitch.y}`).attr(path_attrs).hide()
+        } else {
+          path = this.simulation.path(`M${stitch.x},${stitch.y} ${stitch.x},${stitch.y}`).attr(path_attrs).hide()
+        }
+        path.marker('end', marker)
+        this.stitchPaths.push(path)
+        this.stitches.push(stitch)
+
+        if (stitch.trim || stitch.color_change) {
+          stitching = false
+        } else if (!stitch.jump) {
+          stitching = true
+        }
+
+        prevStitch = stitch
+      })
+
+      if (this.realisticPreview !== null) {
+        this.generateRealisticBlockPaths(color_block)
+      }
+
+      let reachedEnd = this.currentStitch >= this.numStitches
+      this.numStitches = this.stitches.length - 1
+      this.generateMarks()
+      this.sliderColorSections = []
+      this.generateColorSections()
+      this.fitViewbox(color_block)
+
+      if (this.loading) {
+        // the first color block
+        this.loading = false
+        this.resizeCursor()
+        this.start()
+      } else if (reachedEnd && this.direction > 0) {
+        // the animation caught up with us
+        this.start()
+      }
+    },
+    fitViewbox(color_block) {
+      // The stitches aren't moved, the view box grows to include them.
+      color_block.stitches.forEach(stitch => {
+        this.bounds.minx = Math.min(this.bounds.minx, stitch.x)
+        this.bounds.miny = Math.min(this.bounds.miny, stitch.y)
+        this.bounds.maxx = Math.max(this.bounds.maxx, stitch.x)
+        this.bounds.maxy = Math.max(this.bounds.maxy, stitch.y)
+      })
+
+      this.svg.viewbox(this.bounds.minx, this.bounds.miny, this.bounds.maxx - this.bounds.minx, this.bounds.maxy - this.bounds.miny)
+    },
     generateMarks() {
       this.commandList = Array()
       for (let i = 1; i < this.stitches.length; i++) {
@@ -467,46 +595,47 @@ export default {
       // Create realistic paths in it's own group and move it behind the cursor
       this.realisticPreview = this.svg.group({id: 'realistic'}).backward()
 
-      this.stitchPlan.color_blocks.forEach(color_block => {
-        let color = `${color_block.color.visible_on_white.hex}`
-        let realistic_path_attrs = {fill: color, stroke: "none", filter: this.filter}
+      this.stitchPlan.color_blocks.forEach(this.generateRealisticBlockPaths)
+    },
+    generateRealisticBlockPaths(color_block) {
+      let color = `${color_block.color.visible_on_white.hex}`
+      let realistic_path_attrs = {fill: color, stroke: "none", filter: this.filter}
 
-        let stitching = false
-        let prevStitch = null
-        color_block.stitches.forEach(stitch => {
+      let stitching = false
+      let prevStitch = null
+      color_block.stitches.forEach(stitch => {
 
-          let realisticPath = null
-          if (stitching && prevStitch) {
+        let realisticPath = null
+        if (stitching && prevStitch) {
 
-            // Position
-            let stitch_center = []
-            stitch_center.x = (prevStitch.x + stitch.x) / 2.0
-            stitch_center.y = (prevStitch.y + stitch.y) / 2.0
+          // Position
+          let stitch_center = []
+          stitch_center.x = (prevStitch.x + stitch.x) / 2.0
+          stitch_center.y = (prevStitch.y + stitch.y) / 2.0
 
-            // Angle
-            var stitch_angle = Math.atan2(stitch.y - prevStitch.y, stitch.x - prevStitch.x) * (180 / Math.PI)
+          // Angle
+          var stitch_angle = Math.atan2(stitch.y - prevStitch.y, stitch.x - prevStitch.x) * (180 / Math.PI)
 
-            // Length
-            let path_length = Math.hypot(stitch.x - prevStitch.x, stitch.y - prevStitch.y)
+          // Length
+          let path_length = Math.hypot(stitch.x - prevStitch.x, stitch.y - prevStitch.y)
 
-            var path = `M0,0 c 0.4,0,0.4,0.3,0.4,0.6 c 0,0.3,-0.1,0.6,-0.4,0.6 v 0.2,-0.2 h -${path_length} c -0.4,0,-0.4,-0.3,-0.4,-0.6 c 0,-0.3,0.1,-0.6,0.4,-0.6 v -0.2,0.2 z`
-            path = svgpath(path).rotate(stitch_angle).toString()
+          var path = `M0,0 c 0.4,0,0.4,0.3,0.4,0.6 c 0,0.3,-0.1,0.6,-0.4,0.6 v 0.2,-0.2 h -${path_length} c -0.4,0,-0.4,-0.3,-0.4,-0.6 c 0,-0.3,0.1,-0.6,0.4,-0.6 v -0.2,0.2 z`
+          path = svgpath(path).rotate(stitch_angle).toString()
 
-            realisticPath = this.realisticPreview.path(path).attr(realistic_path_attrs).center(stitch_center.x, stitch_center.y).hide()
+          realisticPath = this.realisticPreview.path(path).attr(realistic_path_attrs).center(stitch_center.x, stitch_center.y).hide()
 
-          } else {
-            realisticPath = this.realisticPreview.rect(0, 1).attr(realistic_path_attrs).center(stitch.x, stitch.y).hide()
-          }
+        } else {
+          realisticPath = this.realisticPreview.rect(0, 1).attr(realistic_path_attrs).center(stitch.x, stitch.y).hide()
+        }
 
-          this.realisticPaths.push(realisticPath)
+        this.realisticPaths.push(realisticPath)
 
-          if (stitch.trim || stitch.color_change) {
-            stitching = false
-          } else if (!stitch.jump) {
-            stitching = true
-          }
-          prevStitch = stitch
-        })
+        if (stitch.trim || stitch.color_change) {
+          stitching = false
+        } else if (!stitch.jump) {
+          stitching = true
+        }
+        prevStitch = stitch
       })
     }
   },
@@ -530,6 +659,7 @@ export default {
     this.jumpMarks = {}
     this.needlePenetrationPoints = []
     this.cursor = null
+    this.bounds = {minx: Infinity, miny: Infinity, maxx: -Infinity, maxy: -Infinity}
   },
   mounted: function () {
     this.svg = SVG().addTo(this.$refs.simulator).size('100%', '100%').panZoom({zoomMin: 0.1})
@@ -538,67 +668,23 @@ export default {
 
     this.loading = true
 
-    inkStitch.get('stitch_plan').then(response => {
-      this.stitchPlan = response.data
-      let [minx, miny, maxx, maxy] = this.stitchPlan.bounding_box
-      let width = maxx - minx
-      let height = maxy - miny
-      this.svg.viewbox(0, 0, width, height);
+    this.stitchPlan = {color_blocks: []}
+    this.generateScale()
+    this.generateCursor()
 
-      this.stitchPlan.color_blocks.forEach(color_block => {
-        let color = `${color_block.color.visible_on_white.hex}`
-        let path_attrs = {fill: "none", stroke: color, "stroke-width": 0.3}
-        let marker = this.generateMarker(color)
-
-        let stitching = false
-        let prevStitch = null
-        color_block.stitches.forEach(stitch => {
-          stitch.x -= minx
-          stitch.y -= miny
-
-          let path = null
-          if (stitching && prevStitch) {
-            path = this.simulation.path(`M${prevStitch.x},${prevStitch.y} ${stitch.x},${stitch.y}`).attr(path_attrs).hide()
-          } else {
-            path = this.simulation.path(`M${stitch.x},${stitch.y} ${stitch.x},${stitch.y}`).attr(path_attrs).hide()
-          }
-          path.marker('end', marker)
-          this.stitchPaths.push(path)
-          this.stitches.push(stitch)
-
-          if (stitch.trim || stitch.color_change) {
-            stitching = false
-          } else if (!stitch.jump) {
-            stitching = true
-          }
+    // v-on:keydown doesn't seem to work, maybe an Electron issue?
+    Mousetrap.bind("up", this.animationSpeedUp)
+    Mousetrap.bind("down", this.animationSlowDown)
+    Mousetrap.bind("left", this.animationReverse)
+    Mousetrap.bind("right", this.animationForward)
+    Mousetrap.bind("pagedown", this.animationPreviousCommand)
+    Mousetrap.bind("pageup", this.animationNextCommand)
+    Mousetrap.bind("space", this.toggleAnimation)
+    Mousetrap.bind("+", this.animationForwardOneStitch)
+    Mousetrap.bind("-", this.animationBackwardOneStitch)
 
-          prevStitch = stitch
-        })
-      })
+    this.svg.on('zoom', this.resizeCursor)
 
-      this.numStitches = this.stitches.length - 1
-      this.generateMarks()
-      this.generateColorSections()
-      this.generateScale()
-      this.generateCursor()
-
-      this.loading = false
-
-      // v-on:keydown doesn't seem to work, maybe an Electron issue?
-      Mousetrap.bind("up", this.animationSpeedUp)
-      Mousetrap.bind("down", this.animationSlowDown)
-      Mousetrap.bind("left", this.animationReverse)
-      Mousetrap.bind("right", this.animationForward)
-      Mousetrap.bind("pagedown", this.animationPreviousCommand)
-      Mousetrap.bind("pageup", this.animationNextCommand)
-      Mousetrap.bind("space", this.toggleAnimation)
-      Mousetrap.bind("+", this.animationForwardOneStitch)
-      Mousetrap.bind("-", this.animationBackwardOneStitch)
-
-      this.svg.on('zoom', this.resizeCursor)
-      this.resizeCursor()
-
-      this.start()
-    })
+    this.loadStitchPlan()
   }
 }
@@ -21,6 +21,14 @@ if getattr(sys, 'frozen', None) is None:
     sys.path.remove(extensions_path)
     sys.path.append(extensions_path)
 
+# If the render daemon is running, let it do the work, before we spend any
+# time on imports.  See lib/daemon.py.
+if not os.path.exists(os.path.join(os.path.dirname(os.path.realpath(__file__)), "DEBUG")) and not (hasattr(sys, 'gettrace') and sys.gettrace()):
+    from lib.daemon import forward_to_daemon
+    exit_status = forward_to_daemon(sys.argv[1:])
+    if exit_status is not None:
+        sys.exit(exit_status)
+
 from inkex import errormsg
 from lxml.etree import XMLSyntaxError
 
@@ -45,17 +53,23 @@ logger.addHandler(ch)
 
 parser = ArgumentParser()
 parser.add_argument("--extension")
+parser.add_argument("--daemon", action="store_true")
 my_args, remaining_args = parser.parse_known_args()
 
 if os.path.exists(os.path.join(os.path.dirname(os.path.realpath(__file__)), "DEBUG")):
     debug.enable()
 
+if my_args.daemon:
+    from lib.daemon import serve
+    sys.exit(serve())
+
 extension_name = my_args.extension
 
 # example: foo_bar_baz -> FooBarBaz
 extension_class_name = extension_name.title().replace("_", "")
 
-extension_class = getattr(extensions, extension_class_name)
+# only imports the modules this extension needs
+extension_class = extensions.get_extension_class(extension_class_name)
 extension = extension_class()
 
 if hasattr(sys, 'gettrace') and sys.gettrace():
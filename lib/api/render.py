@@ -0,0 +1,152 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+import os
+import sys
+import traceback
+from base64 import b64decode, b64encode
+from io import BytesIO, StringIO, TextIOWrapper
+from tempfile import TemporaryDirectory
+from threading import Lock
+
+from flask import Blueprint, abort, jsonify, request
+from inkex import errormsg
+from lxml.etree import XMLSyntaxError
+
+from ..extensions import get_extension_class
+from ..i18n import _
+from ..utils import clear_document_caches, version
+from .server import APIServer
+
+render = Blueprint('render', __name__)
+
+# The extensions the render daemon runs.  The others show a GUI, which has
+# to run in the process Inkscape started.
+HEADLESS_EXTENSIONS = {
+    'input',
+    'output',
+    'zip',
+    'stitch_plan_preview',
+    'auto_satin',
+    'break_apart',
+    'cleanup',
+    'convert_to_satin',
+    'convert_to_stroke',
+    'cut_satin',
+    'flip',
+    'remove_embroidery_settings',
+}
+
+TOKEN_HEADER = 'X-Inkstitch-Token'
+
+# Extensions use sys.stdout, sys.stderr and the environment, so only one can
+# run at a time.
+_render_lock = Lock()
+
+
+class RenderServer(APIServer):
+    """The render daemon's server.
+
+    It only serves /ping and /render, not the simulator's and the install
+    dialog's blueprints, which expect an extension and would let anyone on
+    this machine write files.  Every request but /ping must carry the token.
+    """
+
+    def __init__(self, token):
+        self.token = token
+        APIServer.__init__(self, None)
+
+    def register_blueprints(self):
+        self.app.register_blueprint(render, url_prefix="/render")
+        self.app.before_request(self.check_token)
+
+    def check_token(self):
+        # /ping tells inkstitch.py and start_server() that we're up
+        if request.endpoint != 'ping' and request.headers.get(TOKEN_HEADER) != self.token:
+            abort(403)
+
+
+def extension_class_name(extension_name):
+    # example: foo_bar_baz -> FooBarBaz, like inkstitch.py
+    return extension_name.title().replace("_", "")
+
+
+@render.route('/', methods=['POST'])
+def render_document():
+    """Run an extension on an SVG document.
+
+    The request is a JSON object with the extension name, its command line
+    arguments without the input file, the base64-encoded SVG document and
+    the DOCUMENT_PATH Inkscape set, if any.  The response has the exit
+    status and what the extension wrote to stdout (base64-encoded) and
+    stderr.
+    """
+
+    job = request.get_json()
+    if job['extension'] not in HEADLESS_EXTENSIONS:
+        return jsonify(error="%s can't run in the render daemon" % job['extension']), 409
+
+    with _render_lock, TemporaryDirectory() as temp_dir:
+        svg_path = os.path.join(temp_dir, os.path.basename(job.get('file_name') or 'document.svg'))
+        with open(svg_path, 'wb') as svg_file:
+            svg_file.write(b64decode(job['svg']))
+
+        exit_status, stdout, stderr = run_extension(job['extension'], job['args'] + [svg_path], job.get('document_path'))
+
+    return jsonify(exit_status=exit_status, stdout=b64encode(stdout).decode('ascii'), stderr=stderr)
+
+
+def exit_status_of(exit):
+    # like the interpreter handles an uncaught SystemExit
+    if exit.code is None or isinstance(exit.code, int):
+        return exit.code or 0
+    else:
+        print(exit.code, file=sys.stderr)
+        return 1
+
+
+def run_extension(extension_name, args, document_path=None):
+    """Run an extension like inkstitch.py does and capture its output.
+
+    returns: (exit status, stdout bytes, stderr text)
+    """
+
+    stdout = TextIOWrapper(BytesIO(), encoding='utf-8')
+    stderr = StringIO()
+    saved_stdout, saved_stderr = sys.stdout, sys.stderr
+    saved_document_path = os.environ.pop('DOCUMENT_PATH', None)
+    if document_path is not None:
+        os.environ['DOCUMENT_PATH'] = document_path
+
+    exit_status = 0
+    sys.stdout, sys.stderr = stdout, stderr
+    try:
+        extension = get_extension_class(extension_class_name(extension_name))()
+        extension.run(args=args)
+    except SystemExit as exit:
+        exit_status = exit_status_of(exit)
+    except XMLSyntaxError:
+        msg = _("Ink/Stitch cannot read your SVG file. "
+                "This is often the case when you use a file which has been created with Adobe Illustrator.")
+        msg += "\n\n"
+        msg += _("Try to import the file into Inkscape through 'File > Import...' (Ctrl+I)")
+        errormsg(msg)
+    except Exception:
+        errormsg(_("Ink/Stitch experienced an unexpected error.") + "\n")
+        errormsg(_("If you'd like to help, please file an issue at "
+                   "https://github.com/inkstitch/inkstitch/issues "
+                   "and include the entire error description below:") + "\n")
+        errormsg(version.get_inkstitch_version() + "\n")
+        errormsg(traceback.format_exc())
+        exit_status = 1
+    finally:
+        stdout.flush()
+        sys.stdout, sys.stderr = saved_stdout, saved_stderr
+        os.environ.pop('DOCUMENT_PATH', None)
+        if saved_document_path is not None:
+            os.environ['DOCUMENT_PATH'] = saved_document_path
+        clear_document_caches()
+
+    return exit_status, stdout.buffer.getvalue(), stderr.getvalue()
@@ -8,10 +8,10 @@ import logging
 import socket
 import sys
 import time
-from threading import Thread
+from threading import Lock, Thread
 
 import requests
-from flask import Flask, g
+from flask import Flask, g, request
 from werkzeug.serving import make_server
 
 from ..utils.json import InkStitchJSONEncoder
@@ -19,6 +19,15 @@ from .install import install
 from .simulator import simulator
 from .stitch_plan import stitch_plan
 
+# The server is threaded so that a new request can cancel a stitch plan
+# that's still streaming (see stitch_plan.py).  These endpoints handle that
+# themselves.  All others were written for a single-threaded server and
+# share g.extension, so they're handled one at a time.
+CONCURRENT_ENDPOINTS = {
+    'stitch_plan.stream_stitch_plan',
+    'stitch_plan.cancel_stitch_plan',
+}
+
 
 class APIServer(Thread):
     def __init__(self, *args, **kwargs):
@@ -30,6 +39,8 @@ class APIServer(Thread):
         self.port = None
         self.ready = False
 
+        self.request_lock = Lock()
+
         self.__setup_app()
         self.flask_server = None
         self.server_thread = None
@@ -42,9 +53,18 @@ class APIServer(Thread):
         self.app = Flask(__name__)
         self.app.json_encoder = InkStitchJSONEncoder
 
-        self.app.register_blueprint(simulator, url_prefix="/simulator")
-        self.app.register_blueprint(stitch_plan, url_prefix="/stitch_plan")
-        self.app.register_blueprint(install, url_prefix="/install")
+        @self.app.before_request
+        def serialize_requests():
+            if request.endpoint not in CONCURRENT_ENDPOINTS:
+                self.request_lock.acquire()
+                g.holds_request_lock = True
+
+        @self.app.teardown_request
+        def release_request_lock(exception):
+            if g.pop('holds_request_lock', False):
+                self.request_lock.release()
+
+        self.register_blueprints()
 
         @self.app.before_request
         def store_extension():
@@ -56,6 +76,11 @@ class APIServer(Thread):
         def ping():
             return "pong"
 
+    def register_blueprints(self):
+        self.app.register_blueprint(simulator, url_prefix="/simulator")
+        self.app.register_blueprint(stitch_plan, url_prefix="/stitch_plan")
+        self.app.register_blueprint(install, url_prefix="/install")
+
     def stop(self):
         self.flask_server.shutdown()
         self.server_thread.join()
@@ -71,7 +96,8 @@ class APIServer(Thread):
 
         while True:
             try:
-                self.flask_server = make_server(self.host, self.port, self.app)
+                # threaded, see CONCURRENT_ENDPOINTS
+                self.flask_server = make_server(self.host, self.port, self.app, threaded=True)
                 self.server_thread = Thread(target=self.flask_server.serve_forever)
                 self.server_thread.start()
             except socket.error as e:
@@ -3,22 +3,169 @@
 # Copyright (c) 2010 Authors
 # Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
 
-from flask import Blueprint, g, jsonify
+import json
+import struct
+from threading import Event, Lock
 
-from ..stitch_plan import stitch_groups_to_stitch_plan
+from flask import Blueprint, Response, g, jsonify, request
+
+from ..stitch_plan import (StitchPlan, generate_color_blocks,
+                           stitch_groups_to_stitch_plan)
+from ..stitch_plan.binary import MIMETYPE
+from ..utils.json import InkStitchJSONEncoder
 
 
 stitch_plan = Blueprint('stitch_plan', __name__)
 
+# Only one stitch plan is generated at a time.  Each request cancels the one
+# in progress, if any: the simulator only wants the newest one.
+_generation_lock = Lock()
+_cancel_lock = Lock()
+_current_cancel = None
+
+# the binary form of /stitch_plan/stream
+STREAM_MIMETYPE = MIMETYPE + "-stream"
+FRAME_LENGTH = struct.Struct("<I")
+
+
+def cancel_generation():
+    """Cancel the stitch plan in progress and return an Event to cancel the next one."""
+
+    global _current_cancel
+
+    with _cancel_lock:
+        if _current_cancel is not None:
+            _current_cancel.set()
+        _current_cancel = Event()
+
+        return _current_cancel
+
+
+def wants_binary():
+    # JSON comes first, so that clients that accept anything get JSON.  The
+    # binary format is only sent to clients that prefer it explicitly.
+    return request.accept_mimetypes.best_match(['application/json', MIMETYPE]) == MIMETYPE
+
 
 @stitch_plan.route('')
 def get_stitch_plan():
-    if not g.extension.get_elements():
-        return dict(colors=[], stitch_blocks=[], commands=[])
+    """Send the whole stitch plan at once.
 
-    metadata = g.extension.get_inkstitch_metadata()
-    collapse_len = metadata['collapse_len_mm']
-    patches = g.extension.elements_to_stitch_groups(g.extension.elements)
-    stitch_plan = stitch_groups_to_stitch_plan(patches, collapse_len=collapse_len)
+    Clients that prefer MIMETYPE get it in the binary format (see
+    lib/stitch_plan/binary.py and electron/src/lib/stitch_plan.js), everyone
+    else gets JSON.
+    """
+
+    cancel_generation()
+
+    with _generation_lock:
+        if not g.extension.get_elements():
+            if wants_binary():
+                return Response(StitchPlan().to_bytes(), mimetype=MIMETYPE)
+            return dict(colors=[], stitch_blocks=[], commands=[])
+
+        metadata = g.extension.get_inkstitch_metadata()
+        collapse_len = metadata['collapse_len_mm']
+        patches = g.extension.elements_to_stitch_groups(g.extension.elements)
+        stitch_plan = stitch_groups_to_stitch_plan(patches, collapse_len=collapse_len)
+
+    if wants_binary():
+        return Response(stitch_plan.to_bytes(), mimetype=MIMETYPE)
 
     return jsonify(stitch_plan)
+
+
+@stitch_plan.route('/stream')
+def stream_stitch_plan():
+    """Send the color blocks of the stitch plan as soon as each one is done.
+
+    The response is newline-delimited JSON.  Each line is an object with a
+    "type":
+
+        color_block  "color_block" is the next ColorBlock, as in the JSON stitch plan
+        end          the rest of the JSON stitch plan (bounding_box etc.)
+        cancelled    another request cancelled this one
+
+    Clients that prefer STREAM_MIMETYPE, like the simulator, get the same
+    messages in frames instead: a uint32 (little-endian) length and then
+    either a color block as a stitch plan in the binary format (see
+    lib/stitch_plan/binary.py) or one of the other messages as JSON.
+
+    The elements are embroidered one by one while the response is sent, so
+    the first colors arrive long before the last element is done.
+    """
+
+    cancel = cancel_generation()
+
+    # NDJSON comes first, so that clients that accept anything get it.
+    if request.accept_mimetypes.best_match(['application/x-ndjson', STREAM_MIMETYPE]) == STREAM_MIMETYPE:
+        return Response(generate_messages(g.extension, cancel, binary_frame), mimetype=STREAM_MIMETYPE)
+    else:
+        return Response(generate_messages(g.extension, cancel, json_line), mimetype='application/x-ndjson')
+
+
+@stitch_plan.route('/cancel', methods=['POST'])
+def cancel_stitch_plan():
+    cancel_generation()
+    return "cancelled"
+
+
+def json_line(message):
+    return json.dumps(message, cls=InkStitchJSONEncoder) + "\n"
+
+
+def binary_frame(message):
+    if message['type'] == "color_block":
+        stitch_plan = StitchPlan()
+        stitch_plan.add_color_block(message['color_block'])
+        data = stitch_plan.to_bytes()
+    else:
+        data = json.dumps(message, cls=InkStitchJSONEncoder).encode('utf-8')
+
+    return FRAME_LENGTH.pack(len(data)) + data
+
+
+def until_cancelled(stitch_groups, cancel):
+    try:
+        for stitch_group in stitch_groups:
+            if cancel.is_set():
+                return
+            yield stitch_group
+    finally:
+        # stops the embroidery workers, if any
+        stitch_groups.close()
+
+
+def generate_messages(extension, cancel, encode):
+    """Embroider the elements and yield each message of the stream, encoded by encode()."""
+
+    with _generation_lock:
+        if cancel.is_set():
+            yield encode(dict(type="cancelled"))
+            return
+
+        stitch_plan = StitchPlan()
+        if extension.get_elements():
+            collapse_len = extension.get_inkstitch_metadata()['collapse_len_mm']
+            stitch_groups = until_cancelled(extension.generate_stitch_groups(extension.elements), cancel)
+            color_blocks = generate_color_blocks(stitch_groups, collapse_len=collapse_len)
+
+            try:
+                for color_block in color_blocks:
+                    if cancel.is_set():
+                        break
+
+                    stitch_plan.add_color_block(color_block)
+                    yield encode(dict(type="color_block", color_block=color_block))
+            finally:
+                color_blocks.close()
+                stitch_groups.close()
+
+        if cancel.is_set():
+            yield encode(dict(type="cancelled"))
+        elif stitch_plan.color_blocks:
+            summary = stitch_plan.__json__()
+            del summary['color_blocks']
+            yield encode(dict(type="end", **summary))
+        else:
+            yield encode(dict(type="end"))
@@ -0,0 +1,218 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""Export many SVG files to embroidery files without Inkscape.
+
+Run from the root of the git clone:
+
+    python -m lib.batch --formats dst,pes --output-dir out/ designs/ more.svg
+    python -m lib.batch --formats dst --output-dir out/ --manifest nightly.txt
+
+Inputs are SVG files and directories, which are searched for SVG files
+recursively.  A manifest is a text file with one SVG file per line,
+relative to the manifest; empty lines and lines starting with # are
+skipped.  The embroidery files are written to --output-dir, keeping the
+directory structure below each input directory.
+
+Each document is embroidered like the Zip extension does it: the stitch
+plan is computed once and then written in all formats, straight to the
+output files.  The documents are spread over a pool of --jobs worker
+processes.  A line per document is printed as it finishes, and --report
+writes the status, stitch count, time of each stage and messages of each
+document as JSON.  The exit status is 1 if any document failed.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
+from io import StringIO
+from multiprocessing import get_all_start_methods, get_context
+
+import pyembroidery
+
+from .elements import embroider_serially
+from .extensions.base import InkstitchExtension
+from .output import write_embroidery_files
+from .stitch_plan import stitch_groups_to_stitch_plan
+from .utils import clear_document_caches
+
+
+class BatchDocument(InkstitchExtension):
+    """An SVG file loaded like Inkscape would pass it to an extension."""
+
+    def __init__(self, svg_path):
+        InkstitchExtension.__init__(self)
+        self.parse_arguments([svg_path])
+        self.load_raw()
+        self.clean_up()
+
+    def elements_to_stitch_groups(self, elements):
+        # The worker processes already keep all processors busy.
+        return embroider_serially(elements)
+
+    def stitch_plan(self):
+        if not self.get_elements():
+            return None
+
+        metadata = self.get_inkstitch_metadata()
+        patches = self.elements_to_stitch_groups(self.elements)
+        return stitch_groups_to_stitch_plan(patches, collapse_len=metadata['collapse_len_mm'])
+
+
+def embroidery_formats():
+    return [format['extension'] for format in pyembroidery.supported_formats() if 'writer' in format]
+
+
+def export_document(svg_path, output_base, formats):
+    """Write svg_path as output_base.<format> for each of the formats.
+
+    Runs in a worker process.  Errors are reported in the result instead of
+    raised, like extensions report them: on stderr and with sys.exit().
+    """
+
+    result = dict(file=svg_path, status="ok", seconds={}, stitches=0, outputs=[], messages="")
+    stderr = sys.stderr
+    sys.stderr = StringIO()
+
+    try:
+        start = time.perf_counter()
+        document = BatchDocument(svg_path)
+        result['seconds']['load'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        stitch_plan = document.stitch_plan()
+        result['seconds']['stitch_plan'] = time.perf_counter() - start
+
+        if stitch_plan is None:
+            result['status'] = "empty"
+            return result
+
+        result['stitches'] = stitch_plan.num_stitches
+        os.makedirs(os.path.dirname(output_base) or ".", exist_ok=True)
+        start = time.perf_counter()
+        output_paths = ["%s.%s" % (output_base, format) for format in formats]
+        write_embroidery_files(output_paths, stitch_plan, document.svg, {})
+        result['outputs'].extend(output_paths)
+        result['seconds']['write'] = time.perf_counter() - start
+    except SystemExit:
+        result['status'] = "error"
+    except Exception:
+        result['status'] = "error"
+        print(traceback.format_exc(), file=sys.stderr)
+    finally:
+        result['messages'] = sys.stderr.getvalue()
+        sys.stderr = stderr
+        # a worker exports many documents
+        clear_document_caches()
+
+    return result
+
+
+def find_documents(inputs, manifest, output_dir):
+    """Return (svg path, output base path) for each document to export."""
+
+    documents = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for svg_path in sorted(glob(os.path.join(path, "**", "*.svg"), recursive=True)):
+                documents.append((svg_path, os.path.join(output_dir, os.path.splitext(os.path.relpath(svg_path, path))[0])))
+        else:
+            documents.append((path, os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0])))
+
+    if manifest:
+        manifest_dir = os.path.dirname(manifest)
+        with open(manifest, encoding="utf-8") as manifest_file:
+            for line in manifest_file:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    svg_path = os.path.join(manifest_dir, line)
+                    documents.append((svg_path, os.path.join(output_dir, os.path.splitext(os.path.basename(svg_path))[0])))
+
+    return documents
+
+
+def run_jobs(documents, formats, jobs):
+    """Export the documents and yield the results as they come in."""
+
+    if jobs == 1:
+        for svg_path, output_base in documents:
+            yield export_document(svg_path, output_base, formats)
+        return
+
+    # Forked workers don't have to import Ink/Stitch again.
+    mp_context = get_context('fork') if 'fork' in get_all_start_methods() else None
+    with ProcessPoolExecutor(jobs, mp_context=mp_context) as executor:
+        futures = [executor.submit(export_document, svg_path, output_base, formats) for svg_path, output_base in documents]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def print_result(result, file=sys.stderr):
+    seconds = sum(result['seconds'].values())
+    print("%-5s %8.2fs %10d stitches  %s" % (result['status'], seconds, result['stitches'], result['file']), file=file)
+    for line in result['messages'].strip().splitlines():
+        print("      %s" % line, file=file)
+
+
+def parse_arguments(args):
+    parser = argparse.ArgumentParser(prog="python -m lib.batch", description=__doc__.split("\n")[0])
+    parser.add_argument("inputs", nargs="*", help="SVG files and directories of SVG files")
+    parser.add_argument("--manifest", help="a text file listing SVG files, one per line")
+    parser.add_argument("--formats", required=True, type=lambda formats: formats.split(","), help="comma-separated file formats, e.g. dst,pes")
+    parser.add_argument("--output-dir", "-o", required=True, help="where to write the embroidery files")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count(), help="number of worker processes (default: number of processors)")
+    parser.add_argument("--report", help="write a JSON report of all documents to this file")
+
+    args = parser.parse_args(args)
+
+    unknown = set(args.formats) - set(embroidery_formats())
+    if unknown:
+        parser.error("pyembroidery can't write these formats: %s" % ", ".join(sorted(unknown)))
+
+    args.documents = find_documents(args.inputs, args.manifest, args.output_dir)
+    if not args.documents:
+        parser.error("no SVG files given")
+
+    output_bases = [output_base for svg_path, output_base in args.documents]
+    if len(set(output_bases)) != len(output_bases):
+        parser.error("several SVG files would be written to the same output files")
+
+    return args
+
+
+def main(args=None):
+    args = parse_arguments(args)
+
+    # like in releases (see inkstitch.py): the deprecation warnings of our
+    # dependencies would drown out the real messages
+    warnings.filterwarnings('ignore')
+
+    start = time.perf_counter()
+    results = []
+    for result in run_jobs(args.documents, args.formats, args.jobs):
+        print_result(result)
+        results.append(result)
+
+    order = {svg_path: i for i, (svg_path, output_base) in enumerate(args.documents)}
+    results.sort(key=lambda result: order[result['file']])
+    failed = sum(1 for result in results if result['status'] == "error")
+    seconds = time.perf_counter() - start
+    print("%d documents, %d failed, %.1fs" % (len(results), failed, seconds), file=sys.stderr)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as report_file:
+            json.dump(dict(formats=args.formats, seconds=seconds, documents=results), report_file, indent=2)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
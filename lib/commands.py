@@ -14,10 +14,12 @@ from shapely import geometry as shgeo
 from .i18n import N_, _
 from .svg import (apply_transforms, generate_unique_id,
                   get_correction_transform, get_document, get_node_transform)
+from .svg.document_index import (find_command_symbols, find_connectors,
+                                 find_node_by_id, invalidate_document_index)
 from .svg.tags import (CONNECTION_END, CONNECTION_START, CONNECTOR_TYPE,
                        INKSCAPE_LABEL, INKSTITCH_ATTRIBS, SVG_SYMBOL_TAG,
                        SVG_USE_TAG, XLINK_HREF)
-from .utils import Point, cache, get_bundled_dir
+from .utils import Point, cache, cached_method, document_cache, get_bundled_dir
 
 COMMANDS = {
     # L10N command attached to an object
@@ -65,7 +67,7 @@ class CommandParseError(Exception):
 
 class BaseCommand(object):
     @property
-    @cache
+    @cached_method
     def description(self):
         return get_command_description(self.command)
 
@@ -91,10 +93,15 @@ class BaseCommand(object):
         id = url[1:]
 
         try:
-            return self.svg.xpath(".//*[@id='%s']" % id)[0]
-        except (IndexError, AttributeError):
+            node = find_node_by_id(self.svg, id)
+        except AttributeError:
+            node = None
+
+        if node is None:
             raise CommandParseError("could not find node by url %s" % id)
 
+        return node
+
 
 class Command(BaseCommand):
     def __init__(self, connector):
@@ -108,11 +115,10 @@ class Command(BaseCommand):
         return apply_transforms(path, self.connector)
 
     def parse_command(self):
-        path = self.parse_connector_path()
-
+        # the index of the end of the connector path at the target
         neighbors = [
-            (self.get_node_by_url(self.connector.get(CONNECTION_START)), path[0][0][1]),
-            (self.get_node_by_url(self.connector.get(CONNECTION_END)), path[0][-1][1])
+            (self.get_node_by_url(self.connector.get(CONNECTION_START)), 0),
+            (self.get_node_by_url(self.connector.get(CONNECTION_END)), -1)
         ]
 
         if neighbors[0][0].tag != SVG_USE_TAG:
@@ -127,7 +133,14 @@ class Command(BaseCommand):
         self.parse_symbol()
 
         self.target = neighbors[1][0]
-        self.target_point = neighbors[1][1]
+        self.target_end = neighbors[1][1]
+
+    @property
+    @cached_method
+    def target_point(self):
+        # Only a few commands need it, and parsing the connector is slow.
+        path = self.parse_connector_path()
+        return path[0][self.target_end][1]
 
     def __repr__(self):
         return "Command('%s', %s)" % (self.command, self.target_point)
@@ -149,7 +162,7 @@ class StandaloneCommand(BaseCommand):
         self.parse_symbol()
 
     @property
-    @cache
+    @cached_method
     def point(self):
         pos = [float(self.node.get("x", 0)), float(self.node.get("y", 0))]
         transform = get_node_transform(self.node)
@@ -166,8 +179,7 @@ def find_commands(node):
     """Find the symbols this node is connected to and return them as Commands"""
 
     # find all paths that have this object as a connection
-    xpath = ".//*[@inkscape:connection-start='#%(id)s' or @inkscape:connection-end='#%(id)s']" % dict(id=node.get('id'))
-    connectors = node.getroottree().getroot().xpath(xpath, namespaces=inkex.NSS)
+    connectors = find_connectors(node)
 
     # try to turn them into commands
     commands = []
@@ -197,7 +209,7 @@ def global_commands(svg, command):
             yield standalone_command
 
 
-@cache
+@document_cache
 def global_command(svg, command):
     """Find a single command of the specified type.
 
@@ -226,10 +238,7 @@ def global_command(svg, command):
 def _standalone_commands(svg):
     """Find all unconnected command symbols in the SVG."""
 
-    xpath = ".//svg:use[starts-with(@xlink:href, '#inkstitch_')]"
-    symbols = svg.xpath(xpath, namespaces=inkex.NSS)
-
-    for symbol in symbols:
+    for symbol in find_command_symbols(svg):
         try:
             yield StandaloneCommand(symbol)
         except CommandParseError:
@@ -264,11 +273,11 @@ def symbol_defs():
     return symbols_svg().defs
 
 
-@cache
+@document_cache
 def ensure_symbol(svg, command):
     """Make sure the command's symbol definition exists in the <svg:defs> tag."""
 
-    # using @cache really just makes sure that we don't bother ensuring the
+    # using @document_cache really just makes sure that we don't bother ensuring the
     # same symbol is there twice, which would be wasted work
 
     path = "./*[@id='inkstitch_%s']" % command
@@ -385,6 +394,8 @@ def add_commands(element, commands):
         symbol = add_symbol(svg, group, command, pos)
         add_connector(svg, symbol, element)
 
+    invalidate_document_index(svg)
+
 
 def add_layer_commands(layer, commands):
     svg = layer.root
@@ -402,3 +413,5 @@ def add_layer_commands(layer, commands):
             "y": "-10",
             "transform": correction_transform
         }))
+
+    invalidate_document_index(svg)
@@ -0,0 +1,236 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""An optional long-lived process that runs extensions for inkstitch.py.
+
+Start it with:
+
+    inkstitch.py --daemon
+
+Each extension Inkscape runs is a new process that imports everything,
+parses the SVG file and loads the thread palettes again.  The daemon does
+the imports once and keeps the thread catalog loaded.  While it's running,
+inkstitch.py sends the extension name, arguments and SVG file to it over
+HTTP on localhost and writes out the result, instead of running the
+extension itself.  Extensions with a GUI always run in-process (see
+HEADLESS_EXTENSIONS in lib/api/render.py), and so does everything if the
+daemon isn't running or can't be reached.
+
+The daemon writes its address and a random token to a new file in the
+temp directory that only the current user can read, and only accepts
+requests with that token.  inkstitch.py ignores the file unless the
+current user owns it and nobody else can read or write it.  The daemon
+removes the file when it's stopped with Ctrl+C or SIGTERM.
+
+The client side of this module is imported before anything else in
+inkstitch.py, so it only uses the standard library.
+"""
+
+import getpass
+import http.client
+import json
+import os
+import signal
+import sys
+import tempfile
+from base64 import b64decode, b64encode
+
+LIB_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# The daemon is usually already listening when the connection is made, so
+# this only has to cover a busy machine.
+CONNECT_TIMEOUT = 2
+
+
+def state_file_path():
+    return os.path.join(tempfile.gettempdir(), "inkstitch-daemon-%s.json" % getpass.getuser())
+
+
+def read_state():
+    try:
+        file_descriptor = os.open(state_file_path(), os.O_RDONLY | getattr(os, 'O_NOFOLLOW', 0))
+    except OSError:
+        return None
+
+    with os.fdopen(file_descriptor, encoding='utf-8') as state_file:
+        # Anyone can create files in the temp directory.  Don't send SVG
+        # files to a daemon that another user told us about.
+        if not is_private(os.fstat(file_descriptor)):
+            return None
+
+        try:
+            state = json.load(state_file)
+        except (OSError, ValueError):
+            return None
+
+    # A daemon started from another copy of Ink/Stitch would run different
+    # code.
+    if state.get('lib_dir') != LIB_DIR:
+        return None
+
+    return state
+
+
+def is_private(stat):
+    """Whether only the current user can have written the state file."""
+
+    if not hasattr(os, 'getuid'):
+        # Windows: the temp directory is in the user's profile
+        return True
+
+    return stat.st_uid == os.getuid() and stat.st_mode & 0o077 == 0
+
+
+def write_state(state):
+    # O_EXCL: never write the token into a file someone else created
+    remove_state()
+    path = state_file_path()
+    file_descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_NOFOLLOW', 0), 0o600)
+    with os.fdopen(file_descriptor, 'w', encoding='utf-8') as state_file:
+        json.dump(state, state_file)
+
+
+def remove_state():
+    try:
+        os.remove(state_file_path())
+    except OSError:
+        pass
+
+
+def split_input_file(args):
+    """Split the SVG file that Inkscape passes last off the arguments.
+
+    returns: (other arguments, path), or (args, None) if the SVG comes in on
+             stdin
+    """
+
+    if args and not args[-1].startswith('-') and os.path.isfile(args[-1]):
+        return args[:-1], args[-1]
+    else:
+        return args, None
+
+
+def extension_name(args):
+    for arg in args:
+        if arg.startswith('--extension='):
+            return arg.split('=', 1)[1]
+
+    return None
+
+
+def forward_to_daemon(args):
+    """Run an extension in the daemon, if it's running.
+
+    args: inkstitch.py's command line arguments
+
+    returns: the exit status, or None if the extension must run in this
+             process
+    """
+
+    name = extension_name(args)
+    state = read_state()
+    args, svg_path = split_input_file([arg for arg in args if not arg.startswith('--extension=')])
+    if name is None or state is None or svg_path is None:
+        return None
+
+    with open(svg_path, 'rb') as svg_file:
+        job = dict(extension=name, args=args, svg=b64encode(svg_file.read()).decode('ascii'),
+                   file_name=os.path.basename(svg_path), document_path=os.environ.get('DOCUMENT_PATH'))
+
+    response = send_request(state, 'POST', '/render/', job)
+    if response is None:
+        return None
+
+    result = json.loads(response)
+
+    if sys.platform == "win32":
+        # The daemon's output is already what the extension would have
+        # written, line endings and all.  Don't translate them again.
+        import msvcrt
+        msvcrt.setmode(sys.stdout.fileno(), os.O_BINARY)
+
+    sys.stdout.buffer.write(b64decode(result['stdout']))
+    sys.stdout.flush()
+    sys.stderr.write(result['stderr'])
+
+    return result['exit_status']
+
+
+def send_request(state, method, path, data=None):
+    """Send a request to the daemon.
+
+    returns: the response body, or None if the daemon can't be reached or
+             didn't handle the request
+    """
+
+    connection = http.client.HTTPConnection(state['host'], state['port'], timeout=CONNECT_TIMEOUT)
+    try:
+        connection.connect()
+        # rendering takes as long as it takes
+        connection.sock.settimeout(None)
+
+        headers = {'X-Inkstitch-Token': state['token']}
+        if data is not None:
+            headers['Content-Type'] = 'application/json'
+            data = json.dumps(data)
+        connection.request(method, path, body=data, headers=headers)
+        response = connection.getresponse()
+        body = response.read()
+    except ConnectionRefusedError:
+        # the daemon was killed without cleaning up
+        remove_state()
+        return None
+    except (OSError, http.client.HTTPException):
+        return None
+    finally:
+        connection.close()
+
+    if response.status != 200:
+        return None
+
+    return body
+
+
+def serve():
+    """Run the daemon until it's interrupted."""
+
+    from .api.render import HEADLESS_EXTENSIONS, RenderServer, extension_class_name
+    from .extensions import get_extension_class
+    from .threads import ThreadCatalog
+
+    state = read_state()
+    if state is not None and send_request(state, 'GET', '/ping') is not None:
+        print("The Ink/Stitch render daemon is already running.", file=sys.stderr)
+        return 1
+
+    # the work every inkstitch.py process would otherwise do
+    for name in HEADLESS_EXTENSIONS:
+        get_extension_class(extension_class_name(name))
+    ThreadCatalog()
+
+    token = b64encode(os.urandom(24)).decode('ascii')
+    server = RenderServer(token)
+    port = server.start_server()
+
+    try:
+        write_state(dict(host=server.host, port=port, token=token, pid=os.getpid(), lib_dir=LIB_DIR))
+    except OSError as error:
+        print("Can't write %s: %s" % (state_file_path(), error), file=sys.stderr)
+        server.stop()
+        return 1
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print("Ink/Stitch render daemon listening on %s:%s" % (server.host, port), file=sys.stderr)
+
+    try:
+        while server.server_thread.is_alive():
+            server.server_thread.join(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        remove_state()
+        server.stop()
+
+    return 0
@@ -4,11 +4,13 @@
 # Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
 
 import atexit
+import json
 import os
 import socket
 import sys
+import threading
 import time
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
 
 import inkex
@@ -26,6 +28,33 @@ def check_enabled(func):
     return decorated
 
 
+# Set this environment variable to a file name to write a profile of the run
+# to that file.  See Debug.enable_profiling().
+PROFILE_ENV_VAR = "INKSTITCH_PROFILE"
+
+# returned by Debug.span() if profiling is disabled
+NO_SPAN = nullcontext()
+
+
+class Span(object):
+    """A timed section of code in the profile.  See Debug.span()."""
+
+    def __init__(self, debug, name, args):
+        self.debug = debug
+        self.name = name
+        self.args = args
+        self.counters = {}
+        self.start = None
+
+    def __enter__(self):
+        self.debug.span_stack().append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.debug.end_span(self, time.perf_counter())
+
+
 class Debug(object):
     def __init__(self):
         self.enabled = False
@@ -33,6 +62,13 @@ class Debug(object):
         self.current_layer = None
         self.group_stack = []
 
+        self.profiling = False
+        self.profile_file = None
+        self.profile_start = None
+        self.profile_events = []
+        self.profile_counters = {}
+        self.profile_spans = threading.local()
+
     def enable(self):
         self.enabled = True
         self.init_log()
@@ -126,11 +162,15 @@ class Debug(object):
 
     def time(self, func):
         def decorated(*args, **kwargs):
+            if not (self.enabled or self.profiling):
+                return func(*args, **kwargs)
+
             if self.enabled:
                 self.raw_log("entering %s()", func.__name__)
                 start = time.time()
 
-            result = func(*args, **kwargs)
+            with self.span(func.__name__):
+                result = func(*args, **kwargs)
 
             if self.enabled:
                 end = time.time()
@@ -177,7 +217,7 @@ class Debug(object):
     def log_graph(self, graph, name="Graph", color=None):
         d = ""
 
-        for edge in graph.edges:
+        for edge in graph.edges():
             d += "M%s,%s %s,%s" % (edge[0] + edge[1])
 
         self.log_svg_element(etree.Element("path", {
@@ -192,14 +232,124 @@ class Debug(object):
             start = time.time()
             self.raw_log("begin %s", label)
 
-        yield
+        with self.span(label):
+            yield
 
         if self.enabled:
             self.raw_log("completed %s, duration = %s", label, time.time() - start)
 
+    def enable_profiling(self, profile_file):
+        """Record spans and counters and write them to profile_file at exit.
+
+        The file is in Chrome's trace event format, which chrome://tracing,
+        Perfetto (ui.perfetto.dev) and speedscope (speedscope.app) can open.
+        Each span is an event, nested in the spans that were open when it
+        started.  The counters of a span (including those counted in the
+        spans nested in it) are in its "counters" argument, and the totals
+        are in "otherData".
+        """
+
+        self.profiling = True
+        self.profile_file = os.path.abspath(profile_file)
+        self.profile_start = time.perf_counter()
+        atexit.register(self.save_profile)
+
+    def span(self, name, **args):
+        """Time a section of code: with debug.span("name", key=value): ...
+
+        The keyword arguments are shown with the span.  If profiling is
+        disabled, this does nothing, so it can be used in hot code.
+        """
+
+        if not self.profiling:
+            return NO_SPAN
+
+        return Span(self, name, args)
+
+    def span_stack(self):
+        try:
+            return self.profile_spans.stack
+        except AttributeError:
+            self.profile_spans.stack = []
+            return self.profile_spans.stack
+
+    def end_span(self, span, end):
+        stack = self.span_stack()
+        stack.remove(span)
+
+        self.add_counters(span.counters, stack)
+        args = dict(span.args)
+        if span.counters:
+            args["counters"] = span.counters
+
+        self.profile_events.append({
+            "name": span.name,
+            "ph": "X",
+            "ts": (span.start - self.profile_start) * 1e6,
+            "dur": (end - span.start) * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        })
+
+    def count(self, name, amount=1):
+        """Add amount to a counter in the current span."""
+
+        if self.profiling:
+            self.add_counters({name: amount}, self.span_stack())
+
+    def add_counters(self, counters, stack):
+        if stack:
+            totals = stack[-1].counters
+        else:
+            totals = self.profile_counters
+
+        for name, amount in counters.items():
+            totals[name] = totals.get(name, 0) + amount
+
+    def profile_mark(self):
+        """Return a mark to pass to take_profile_events() later."""
+
+        return len(self.profile_events)
+
+    def take_profile_events(self, mark):
+        """Remove and return the events recorded since mark.
+
+        Worker processes use this to send their spans to the main process,
+        which adds them with add_profile_events().
+        """
+
+        events = self.profile_events[mark:]
+        del self.profile_events[mark:]
+        return events
+
+    def add_profile_events(self, events):
+        self.profile_events.extend(events)
+
+        # The outermost span ends last.  Its counters include those of the
+        # spans inside it.
+        if events:
+            self.add_counters(events[-1]["args"].get("counters", {}), self.span_stack())
+
+    def save_profile(self):
+        pids = sorted(set(event["pid"] for event in self.profile_events) | {os.getpid()})
+        metadata = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "inkstitch" if pid == os.getpid() else "inkstitch worker"}}
+                    for pid in pids]
+
+        with open(self.profile_file, "w") as profile_file:
+            json.dump({
+                "traceEvents": metadata + self.profile_events,
+                "displayTimeUnit": "ms",
+                "otherData": {"counters": self.profile_counters},
+            }, profile_file)
+
 
 debug = Debug()
 
 
 def enable():
     debug.enable()
+
+
+if os.environ.get(PROFILE_ENV_VAR):
+    debug.enable_profiling(os.environ[PROFILE_ENV_VAR])
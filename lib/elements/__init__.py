@@ -9,6 +9,8 @@ from .element import EmbroideryElement
 from .empty_d_object import EmptyDObject
 from .fill import Fill
 from .image import ImageObject
+from .parallel import (embroider_in_parallel, embroider_serially,
+                       generate_in_parallel, generate_serially)
 from .polyline import Polyline
 from .satin_column import SatinColumn
 from .stroke import Stroke
@@ -16,7 +16,7 @@ from ..i18n import _
 from ..stitch_plan import StitchGroup
 from ..stitches import auto_fill
 from ..svg.tags import INKSCAPE_LABEL
-from ..utils import cache, version
+from ..utils import cached_method, version
 
 
 class SmallShapeWarning(ValidationWarning):
@@ -47,12 +47,12 @@ class AutoFill(Fill):
         return self.get_boolean_param('auto_fill', True)
 
     @property
-    @cache
+    @cached_method
     def outline(self):
         return self.shape.boundary[0]
 
     @property
-    @cache
+    @cached_method
     def outline_length(self):
         return self.outline.length
 
@@ -82,7 +82,7 @@ class AutoFill(Fill):
            unit='deg',
            group=_('AutoFill Underlay'),
            type='float')
-    @cache
+    @cached_method
     def fill_underlay_angle(self):
         underlay_angles = self.get_param('fill_underlay_angle', None)
         default_value = [self.angle + math.pi / 2.0]
@@ -104,7 +104,7 @@ class AutoFill(Fill):
            unit='mm',
            group=_('AutoFill Underlay'),
            type='float')
-    @cache
+    @cached_method
     def fill_underlay_row_spacing(self):
         return self.get_float_param("fill_underlay_row_spacing_mm") or self.row_spacing * 3
 
@@ -114,7 +114,7 @@ class AutoFill(Fill):
            tooltip=_('default: equal to fill max stitch length'),
            unit='mm',
            group=_('AutoFill Underlay'), type='float')
-    @cache
+    @cached_method
     def fill_underlay_max_stitch_length(self):
         return self.get_float_param("fill_underlay_max_stitch_length_mm") or self.max_stitch_length
 
@@ -207,6 +207,9 @@ class AutoFill(Fill):
         else:
             return None
 
+    def uses_last_patch(self):
+        return not self.get_command('fill_start')
+
     def get_ending_point(self):
         if self.get_command('fill_end'):
             return self.get_command('fill_end').target_point
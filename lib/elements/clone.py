@@ -8,10 +8,10 @@ from math import atan, degrees
 from ..commands import is_command, is_command_symbol
 from ..i18n import _
 from ..svg.path import get_node_transform
-from ..svg.svg import find_elements
+from ..svg.document_index import find_node_by_id
 from ..svg.tags import (EMBROIDERABLE_TAGS, INKSTITCH_ATTRIBS,
                         SVG_POLYLINE_TAG, SVG_USE_TAG, XLINK_HREF)
-from ..utils import cache
+from ..utils import cached_method
 from .auto_fill import AutoFill
 from .element import EmbroideryElement, param
 from .fill import Fill
@@ -63,7 +63,7 @@ class Clone(EmbroideryElement):
            tooltip=_("This setting will apply a custom fill angle for the clone."),
            unit='deg',
            type='float')
-    @cache
+    @cached_method
     def clone_fill_angle(self):
         return self.get_float_param('angle', 0)
 
@@ -125,6 +125,15 @@ class Clone(EmbroideryElement):
 
         return patches
 
+    def uses_last_patch(self):
+        # The cloned elements are only created in to_stitch_groups(), so we
+        # can't ask them.
+        return True
+
+    def stitch_group_cache_key(self, last_patch):
+        # The stitches depend on the clone source, which isn't part of the key.
+        return None
+
     def get_clone_style(self, style_name, node, default=None):
         style = node.style[style_name] or default
         return style
@@ -158,6 +167,7 @@ def is_embroiderable_clone(node):
 
 def get_clone_source(node):
     source_id = node.get(XLINK_HREF)[1:]
-    xpath = ".//*[@id='%s']" % (source_id)
-    source_node = find_elements(node, xpath)[0]
+    source_node = find_node_by_id(node, source_id)
+    if source_node is None:
+        raise IndexError("clone source not found: %s" % source_id)
     return source_node
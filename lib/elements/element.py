@@ -4,18 +4,17 @@
 # Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
 
 import sys
-from copy import deepcopy
+from hashlib import sha256
 
 import inkex
-from inkex import bezier
 
 from ..commands import find_commands
 from ..i18n import _
-from ..patterns import apply_patterns
+from ..patterns import apply_patterns, get_pattern_nodes
 from ..svg import (PIXELS_PER_MM, apply_transforms, convert_length,
-                   get_node_transform)
-from ..svg.tags import INKSCAPE_LABEL, INKSTITCH_ATTRIBS
-from ..utils import Point, cache
+                   flatten_subpath, get_node_transform)
+from ..svg.tags import INKSCAPE_LABEL, INKSTITCH_ATTRIBS, INKSTITCH_NAMESPACE
+from ..utils import Point, cached_method, invalidate_cache
 
 
 class Param(object):
@@ -90,12 +89,12 @@ class EmbroideryElement(object):
         self.set_param(param[10:], value)
         del self.node.attrib[param]
 
-    @cache
+    @cached_method
     def get_param(self, param, default):
         value = self.node.get(INKSTITCH_ATTRIBS[param], "").strip()
         return value or default
 
-    @cache
+    @cached_method
     def get_boolean_param(self, param, default=None):
         value = self.get_param(param, default)
 
@@ -104,7 +103,7 @@ class EmbroideryElement(object):
         else:
             return value and (value.lower() in ('yes', 'y', 'true', 't', '1'))
 
-    @cache
+    @cached_method
     def get_float_param(self, param, default=None):
         try:
             value = float(self.get_param(param, default))
@@ -119,7 +118,7 @@ class EmbroideryElement(object):
 
         return value
 
-    @cache
+    @cached_method
     def get_int_param(self, param, default=None):
         try:
             value = int(self.get_param(param, default))
@@ -134,8 +133,40 @@ class EmbroideryElement(object):
     def set_param(self, name, value):
         param = INKSTITCH_ATTRIBS[name]
         self.node.set(param, str(value))
+        self.invalidate_cache()
 
-    @cache
+    def invalidate_cache(self):
+        """Forget the cached params, style, path, shape etc. of this element.
+
+        set_param() does this.  Call it after changing the node in any other
+        way, unless the next thing you do is embroider the element:
+        embroider() drops the cache by itself if the node's attributes (or
+        the style or transform of its ancestors) have changed.  Commands and
+        patterns aren't checked.
+        """
+
+        invalidate_cache(self)
+        self._cached_node_state = None
+
+    def _node_state(self):
+        return (tuple(self.node.attrib.items()),
+                tuple((ancestor.get('style'), ancestor.get('transform')) for ancestor in self.node.iterancestors()))
+
+    def refresh_cache(self):
+        """Drop the cached values if the node changed since they were computed.
+
+        Only embroider() and stitch_group_cache_key() call this.  Anything
+        else that reads a cached property like shape or stroke_width after
+        changing the node's style or transform must call invalidate_cache()
+        first, or it gets the old values.
+        """
+
+        node_state = self._node_state()
+        if node_state != getattr(self, '_cached_node_state', None):
+            invalidate_cache(self)
+            self._cached_node_state = node_state
+
+    @cached_method
     def _get_specified_style(self):
         # We want to cache this, because it's quite expensive to generate.
         return self.node.specified_style()
@@ -150,7 +181,7 @@ class EmbroideryElement(object):
         return self._get_style_raw(style_name) is not None
 
     @property
-    @cache
+    @cached_method
     def stroke_scale(self):
         # How wide is the stroke, after the transforms are applied?
         #
@@ -187,7 +218,7 @@ class EmbroideryElement(object):
         return node_scale
 
     @property
-    @cache
+    @cached_method
     def stroke_width(self):
         width = self.get_style("stroke-width", "1.0")
         width = convert_length(width)
@@ -203,7 +234,7 @@ class EmbroideryElement(object):
            options=[_("Both"), _("Before"), _("After"), _("Neither")],
            default=0,
            sort_index=4)
-    @cache
+    @cached_method
     def ties(self):
         return self.get_int_param("ties", 0)
 
@@ -215,7 +246,7 @@ class EmbroideryElement(object):
            type='boolean',
            default=False,
            sort_index=5)
-    @cache
+    @cached_method
     def force_lock_stitches(self):
         return self.get_boolean_param('force_lock_stitches', False)
 
@@ -258,7 +289,7 @@ class EmbroideryElement(object):
 
         return inkex.paths.Path(d).to_superpath()
 
-    @cache
+    @cached_method
     def parse_path(self):
         return apply_transforms(self.path, self.node)
 
@@ -267,19 +298,19 @@ class EmbroideryElement(object):
         raise NotImplementedError("INTERNAL ERROR: %s must implement shape()", self.__class__)
 
     @property
-    @cache
+    @cached_method
     def commands(self):
         return find_commands(self.node)
 
-    @cache
+    @cached_method
     def get_commands(self, command):
         return [c for c in self.commands if c.command == command]
 
-    @cache
+    @cached_method
     def has_command(self, command):
         return len(self.get_commands(command)) > 0
 
-    @cache
+    @cached_method
     def get_command(self, command):
         commands = self.get_commands(command)
 
@@ -294,16 +325,24 @@ class EmbroideryElement(object):
     def flatten(self, path):
         """approximate a path containing beziers with a series of points"""
 
-        path = deepcopy(path)
-        bezier.cspsubdiv(path, 0.1)
-
-        return [self.strip_control_points(subpath) for subpath in path]
+        return [flatten_subpath(subpath).tolist() for subpath in path]
 
     def flatten_subpath(self, subpath):
-        path = [deepcopy(subpath)]
-        bezier.cspsubdiv(path, 0.1)
+        return flatten_subpath(subpath).tolist()
+
+    @cached_method
+    def _flattened_subpaths(self):
+        return tuple(flatten_subpath(subpath) for subpath in self.parse_path())
+
+    def flattened_path(self):
+        """Like self.flatten(self.parse_path()), but each subpath is only flattened once."""
+
+        return [points.tolist() for points in self._flattened_subpaths()]
+
+    def flattened_subpath(self, index):
+        """Like self.flatten_subpath(self.parse_path()[index]), but each subpath is only flattened once."""
 
-        return self.strip_control_points(path[0])
+        return self._flattened_subpaths()[index].tolist()
 
     @property
     def trim_after(self):
@@ -316,7 +355,53 @@ class EmbroideryElement(object):
     def to_stitch_groups(self, last_patch):
         raise NotImplementedError("%s must implement to_stitch_groups()" % self.__class__.__name__)
 
+    def uses_last_patch(self):
+        """Return True if to_stitch_groups() depends on the last_patch argument.
+
+        Elements that don't can be embroidered independently of the ones that
+        come before them (see embroider_in_parallel()).
+        """
+        return False
+
+    def stitch_group_cache_key(self, last_patch):
+        """Return a digest of everything embroider() depends on.
+
+        Two elements with the same key produce the same stitches, which lets
+        StitchGroupCache skip embroidering an element that hasn't changed.
+        Return None if the result of embroider() must not be cached.
+        """
+
+        self.refresh_cache()
+        key = sha256()
+
+        def add(value):
+            key.update(repr(value).encode('utf-8'))
+            key.update(b'\0')
+
+        add(self.__class__.__name__)
+        add(self.parse_path())
+        add(str(get_node_transform(self.node)))
+        add(sorted(self._get_specified_style().items()))
+
+        # all params, including the ones not shown in the Params dialog
+        add(sorted((name, value) for name, value in self.node.attrib.items() if name.startswith(INKSTITCH_NAMESPACE)))
+
+        add(sorted((command.command, list(command.target_point)) for command in self.commands))
+
+        for pattern in get_pattern_nodes(self.node):
+            add(sorted((name, value) for name, value in pattern.attrib.items() if name != 'id'))
+            add(str(get_node_transform(pattern)))
+
+        if self.uses_last_patch():
+            if last_patch and last_patch.stitches:
+                add(last_patch.stitches[-1].as_tuple())
+            else:
+                add(None)
+
+        return key.digest()
+
     def embroider(self, last_patch):
+        self.refresh_cache()
         self.validate()
 
         patches = self.to_stitch_groups(last_patch)
@@ -16,7 +16,7 @@ from ..i18n import _
 from ..stitch_plan import StitchGroup
 from ..stitches import legacy_fill
 from ..svg import PIXELS_PER_MM
-from ..utils import cache
+from ..utils import cached_method
 
 
 class UnconnectedError(ValidationError):
@@ -60,7 +60,7 @@ class Fill(EmbroideryElement):
            unit='deg',
            type='float',
            default=0)
-    @cache
+    @cached_method
     def angle(self):
         return math.radians(self.get_float_param('angle', 0))
 
@@ -125,9 +125,9 @@ class Fill(EmbroideryElement):
         return max(self.get_int_param("staggers", 4), 1)
 
     @property
-    @cache
+    @cached_method
     def paths(self):
-        paths = self.flatten(self.parse_path())
+        paths = self.flattened_path()
         # ensure path length
         for i, path in enumerate(paths):
             if len(path) < 3:
@@ -135,7 +135,7 @@ class Fill(EmbroideryElement):
         return paths
 
     @property
-    @cache
+    @cached_method
     def shape(self):
         # shapely's idea of "holes" are to subtract everything in the second set
         # from the first. So let's at least make sure the "first" thing is the
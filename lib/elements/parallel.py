@@ -0,0 +1,163 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from multiprocessing import get_all_start_methods, get_context
+from threading import Lock, active_count
+
+from ..debug import debug
+
+# The elements being embroidered by embroider_in_parallel().  Worker processes
+# are forked, so they inherit the elements (and everything already cached on
+# them) and we only need to send them an index.  Only one caller at a time
+# can use them; the others embroider serially.
+_elements = None
+_cache = None
+_elements_lock = Lock()
+
+
+def can_embroider_in_parallel():
+    # Without fork(), workers would have to re-import inkstitch.py, which
+    # would run the extension all over again.  Forking a process with
+    # several threads (e.g. the API server or the render daemon) can leave
+    # the workers waiting for a lock that another thread held.
+    return 'fork' in get_all_start_methods() and active_count() == 1
+
+
+def embroider_element(element, last_patch, cache=None):
+    with debug.span("%s %s" % (element.__class__.__name__, element.node.get('id'))):
+        if cache is None:
+            patches = element.embroider(last_patch)
+        else:
+            patches = cache.embroider(element, last_patch)
+
+        if debug.profiling:
+            debug.count("stitch groups", len(patches))
+            debug.count("stitches", sum(len(patch.stitches) for patch in patches))
+
+    return patches
+
+
+def embroider_serially(elements, cache=None):
+    """Embroider elements one after the other.
+
+    If a StitchGroupCache is given, elements that haven't changed since they
+    were last embroidered are taken from the cache.
+    """
+
+    patches = []
+    for element_patches in generate_serially(elements, cache):
+        patches.extend(element_patches)
+
+    return patches
+
+
+def generate_serially(elements, cache=None):
+    """Like embroider_serially(), but yield the StitchGroups of each element as soon as it's done."""
+
+    last_patch = None
+    for element in elements:
+        patches = embroider_element(element, last_patch, cache)
+        if patches:
+            last_patch = patches[-1]
+
+        yield patches
+
+
+def embroider_in_parallel(elements, processes=None, cache=None):
+    """Embroider elements in a pool of worker processes.
+
+    The result is exactly the same as from embroider_serially(): the same
+    StitchGroups in the same order.
+
+    Most elements ignore last_patch, so they're all sent off to the workers
+    right away.  An element that uses it (see uses_last_patch()) is sent
+    once the results of all elements before it are in, so that it gets the
+    same last_patch it would have gotten when embroidering serially.
+    Meanwhile, the workers keep going on the independent elements.
+    """
+
+    patches = []
+    for element_patches in generate_in_parallel(elements, processes, cache):
+        patches.extend(element_patches)
+
+    return patches
+
+
+def generate_in_parallel(elements, processes=None, cache=None):
+    """Like embroider_in_parallel(), but yield the StitchGroups of each element in order as soon as they're in.
+
+    Closing the generator early cancels the elements that haven't been
+    started yet.
+    """
+
+    global _elements, _cache
+
+    if not can_embroider_in_parallel() or len(elements) < 2 or not _elements_lock.acquire(blocking=False):
+        yield from generate_serially(elements, cache)
+        return
+
+    _elements = elements
+    _cache = cache
+    executor = ProcessPoolExecutor(processes or os.cpu_count(), mp_context=get_context('fork'))
+    futures = [None] * len(elements)
+
+    try:
+        for i, element in enumerate(elements):
+            if not element.uses_last_patch():
+                futures[i] = executor.submit(_embroider, i, None)
+
+        last_patch = None
+        for i in range(len(elements)):
+            if futures[i] is None:
+                futures[i] = executor.submit(_embroider, i, last_patch)
+
+            patches = _result(futures[i])
+            if patches:
+                last_patch = patches[-1]
+
+            yield patches
+    finally:
+        # If an element failed or we were stopped, don't wait for the rest.
+        for future in futures:
+            if future is not None:
+                future.cancel()
+        executor.shutdown()
+        _elements = None
+        _cache = None
+        _elements_lock.release()
+
+
+def _embroider(index, last_patch):
+    # Runs in the worker.  Errors are reported by writing to stderr and
+    # calling sys.exit() (see EmbroideryElement.fatal()), so we send both
+    # back to the main process, along with the spans recorded if profiling
+    # is enabled.
+    stderr = sys.stderr
+    sys.stderr = StringIO()
+    profile_mark = debug.profile_mark()
+
+    try:
+        return embroider_element(_elements[index], last_patch, _cache), sys.stderr.getvalue(), None, debug.take_profile_events(profile_mark)
+    except SystemExit as exit:
+        return None, sys.stderr.getvalue(), exit.code, debug.take_profile_events(profile_mark)
+    finally:
+        sys.stderr = stderr
+
+
+def _result(future):
+    patches, messages, exit_code, profile_events = future.result()
+    debug.add_profile_events(profile_events)
+
+    if messages:
+        sys.stderr.write(messages)
+
+    if exit_code is not None:
+        sys.exit(exit_code)
+
+    return patches
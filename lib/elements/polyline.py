@@ -10,7 +10,7 @@ from .element import EmbroideryElement, param
 from .validation import ValidationWarning
 from ..i18n import _
 from ..stitch_plan import StitchGroup
-from ..utils import cache
+from ..utils import cached_method
 from ..utils.geometry import Point
 
 
@@ -57,7 +57,7 @@ class Polyline(EmbroideryElement):
         return points
 
     @property
-    @cache
+    @cached_method
     def shape(self):
         return shgeo.LineString(self.points)
 
@@ -74,7 +74,7 @@ class Polyline(EmbroideryElement):
         return path
 
     @property
-    @cache
+    @cached_method
     def csp(self):
         csp = self.parse_path()
 
@@ -5,17 +5,20 @@
 
 from copy import deepcopy
 from itertools import chain
+from math import ceil
 
+import numpy
 from shapely import affinity as shaffinity
 from shapely import geometry as shgeo
 from shapely.ops import nearest_points
 
 from inkex import paths
 
+from ..debug import debug
 from ..i18n import _
 from ..stitch_plan import StitchGroup
 from ..svg import line_strings_to_csp, point_lists_to_csp
-from ..utils import Point, cache, collapse_duplicate_point, cut
+from ..utils import Point, cached_method, collapse_duplicate_point, cut
 from .element import EmbroideryElement, param
 from .validation import ValidationError, ValidationWarning
 
@@ -211,35 +214,35 @@ class SatinColumn(EmbroideryElement):
         return self.get_float_param("zigzag_underlay_max_stitch_length_mm") or None
 
     @property
-    @cache
+    @cached_method
     def shape(self):
         # This isn't used for satins at all, but other parts of the code
         # may need to know the general shape of a satin column.
 
-        flattened = self.flatten(self.parse_path())
+        flattened = self.flattened_path()
         line_strings = [shgeo.LineString(path) for path in flattened]
 
         return shgeo.MultiLineString(line_strings)
 
     @property
-    @cache
+    @cached_method
     def csp(self):
         return self.parse_path()
 
     @property
-    @cache
+    @cached_method
     def rails(self):
         """The rails in order, as point lists"""
         return [subpath for i, subpath in enumerate(self.csp) if i in self.rail_indices]
 
     @property
-    @cache
+    @cached_method
     def flattened_rails(self):
         """The rails, as LineStrings."""
-        return tuple(shgeo.LineString(self.flatten_subpath(rail)) for rail in self.rails)
+        return tuple(shgeo.LineString(rail) for rail in self._flattened_rail_points())
 
     @property
-    @cache
+    @cached_method
     def flattened_rungs(self):
         """The rungs, as LineStrings."""
         rungs = []
@@ -258,12 +261,24 @@ class SatinColumn(EmbroideryElement):
         return tuple(rungs)
 
     @property
-    @cache
+    @cached_method
     def _raw_rungs(self):
-        return tuple(shgeo.LineString(self.flatten_subpath(rung)) for rung in self.rungs)
+        return tuple(shgeo.LineString(rung) for rung in self._flattened_rung_points())
+
+    def _flattened_rail_points(self):
+        """The rails in order, flattened into point lists"""
+        return [self.flattened_subpath(i) for i in range(len(self.csp)) if i in self.rail_indices]
+
+    def _flattened_rung_points(self):
+        """The rungs, flattened into point lists"""
+        if len(self.csp) == 2:
+            # the synthesized rungs aren't part of the path
+            return [self.flatten_subpath(rung) for rung in self.rungs]
+        else:
+            return [self.flattened_subpath(i) for i in range(len(self.csp)) if i not in self.rail_indices]
 
     @property
-    @cache
+    @cached_method
     def rungs(self):
         """The rungs, as point lists.
 
@@ -303,10 +318,9 @@ class SatinColumn(EmbroideryElement):
         return rungs
 
     @property
-    @cache
+    @cached_method
     def rail_indices(self):
-        paths = [self.flatten_subpath(subpath) for subpath in self.csp]
-        paths = [shgeo.LineString(path) for path in paths]
+        paths = [shgeo.LineString(path) for path in self.flattened_path()]
         num_paths = len(paths)
 
         # Imagine a satin column as a curvy ladder.
@@ -373,7 +387,7 @@ class SatinColumn(EmbroideryElement):
                     break
 
     @property
-    @cache
+    @cached_method
     def flattened_sections(self):
         """Flatten the rails, cut with the rungs, and return the sections in pairs."""
 
@@ -444,14 +458,13 @@ class SatinColumn(EmbroideryElement):
         # flatten the path because you can't just reverse a CSP subpath's elements (I think)
         point_lists = []
 
-        for rail in self.rails:
-            point_lists.append(list(reversed(self.flatten_subpath(rail))))
+        for rail in self._flattened_rail_points():
+            point_lists.append(list(reversed(rail)))
 
         # reverse the order of the rails because we're sewing in the opposite direction
         point_lists.reverse()
 
-        for rung in self.rungs:
-            point_lists.append(self.flatten_subpath(rung))
+        point_lists.extend(self._flattened_rung_points())
 
         return self._csp_to_satin(point_lists_to_csp(point_lists))
 
@@ -528,7 +541,7 @@ class SatinColumn(EmbroideryElement):
           rails.  Each element is a list of two rails of type LineString.
         """
 
-        rails = [shgeo.LineString(self.flatten_subpath(rail)) for rail in self.rails]
+        rails = self.flattened_rails
 
         path_lists = [[], []]
 
@@ -545,7 +558,7 @@ class SatinColumn(EmbroideryElement):
         Each rung is appended to the correct one of the two new satin columns.
         """
 
-        rungs = [shgeo.LineString(self.flatten_subpath(rung)) for rung in self.rungs]
+        rungs = self._raw_rungs
         for path_list in split_rails:
             path_list.extend(rung for rung in rungs if path_list[0].intersects(rung) and path_list[1].intersects(rung))
 
@@ -590,7 +603,7 @@ class SatinColumn(EmbroideryElement):
         return SatinColumn(node)
 
     @property
-    @cache
+    @cached_method
     def center_line(self):
         # similar technique to do_center_walk()
         center_walk, _ = self.plot_points_on_rails(self.zigzag_spacing, -100000)
@@ -616,38 +629,21 @@ class SatinColumn(EmbroideryElement):
 
         return pos1, pos2
 
-    def walk(self, path, start_pos, start_index, distance):
-        # Move <distance> pixels along <path>, which is a sequence of line
-        # segments defined by points.
+    def rail_positions(self, rail, distances):
+        # Find the points at each of <distances> pixels along <rail>, which is
+        # a sequence of line segments defined by points.  Distances past the
+        # end of the rail end up at its last point.  Returns an Nx2 array.
 
-        # <start_index> is the index of the line segment in <path> that
-        # we're currently on.  <start_pos> is where along that line
-        # segment we are.  Return a new position and index.
+        coords = numpy.array([(point.x, point.y) for point in rail], dtype=float)
+        segment_lengths = numpy.hypot(*numpy.diff(coords, axis=0).T)
+        cumulative_lengths = numpy.concatenate(([0.0], numpy.cumsum(segment_lengths)))
 
-        # print >> dbg, "walk", start_pos, start_index, distance
+        distances = numpy.minimum(distances, cumulative_lengths[-1])
+        indices = numpy.clip(numpy.searchsorted(cumulative_lengths, distances, side='right') - 1, 0, len(segment_lengths) - 1)
+        lengths = segment_lengths[indices]
+        fractions = numpy.divide(distances - cumulative_lengths[indices], lengths, out=numpy.zeros_like(distances), where=lengths > 0)
 
-        pos = start_pos
-        index = start_index
-        last_index = len(path) - 1
-        distance_remaining = distance
-
-        while True:
-            if index >= last_index:
-                return pos, index
-
-            segment_end = path[index + 1]
-            segment = segment_end - pos
-            segment_length = segment.length()
-
-            if segment_length > distance_remaining:
-                # our walk ends partway along this segment
-                return pos + segment.unit() * distance_remaining, index
-            else:
-                # our walk goes past the end of this segment, so advance
-                # one point
-                index += 1
-                distance_remaining -= segment_length
-                pos = segment_end
+        return coords[indices] + (coords[indices + 1] - coords[indices]) * fractions[:, numpy.newaxis]
 
     def plot_points_on_rails(self, spacing, offset):
         # Take a section from each rail in turn, and plot out an equal number
@@ -677,65 +673,69 @@ class SatinColumn(EmbroideryElement):
             len0 = shgeo.LineString(section0).length
             len1 = shgeo.LineString(section1).length
 
-            last_index0 = len(section0) - 1
-            last_index1 = len(section1) - 1
-
-            if len0 == 0:
+            if len0 == 0 or len(section0) < 2 or len(section1) < 2:
                 continue
 
             ratio = len1 / len0
 
-            index0 = 0
-            index1 = 0
-
-            while index0 < last_index0 and index1 < last_index1:
-                # Each iteration of this outer loop is one stitch.  Keep going
-                # until we fall off the end of the section.
-
-                # TODO: is there an other way?
-                # old_center = (pos0 + pos1) / 2.0
-                old_center = shgeo.Point(x/2 for x in (pos0 + pos1))
-
-                while to_travel > 0 and index0 < last_index0 and index1 < last_index1:
-                    # In this loop, we inch along each rail a tiny bit per
-                    # iteration.  The goal is to travel the requested spacing
-                    # amount along the _centerline_ between the two rails.
-                    #
-                    # Why not just travel the requested amount along the rails
-                    # themselves?  Imagine a letter V.  The distance we travel
-                    # along the rails themselves is much longer than the distance
-                    # between the horizontal stitches themselves:
-                    #
-                    # \______/
-                    #  \____/
-                    #   \__/
-                    #    \/
-                    #
-                    # For more complicated rail shapes, the distance between each
-                    # stitch will vary as the angles of the rails vary.  The
-                    # easiest way to compensate for this is to just go a tiny bit
-                    # at a time and see how far we went.
-
-                    # Note that this is 0.05 pixels, which is around 0.01mm, way
-                    # smaller than the resolution of an embroidery machine.
-                    pos0, index0 = self.walk(section0, pos0, index0, 0.05)
-                    pos1, index1 = self.walk(section1, pos1, index1, 0.05 * ratio)
-
-                    # TODO: is there a better way?
-                    # new_center = (pos0 + pos1) / 2.0
-                    new_center = shgeo.Point(x/2 for x in (pos0 + pos1))
-                    to_travel -= new_center.distance(old_center)
-                    old_center = new_center
-
-                if to_travel <= 0:
-                    add_pair(pos0, pos1)
-                    to_travel = spacing
+            # We want to travel the requested spacing along the _centerline_
+            # between the two rails.  Why not just travel the requested amount
+            # along the rails themselves?  Imagine a letter V.  The distance
+            # we travel along the rails themselves is much longer than the
+            # distance between the horizontal stitches themselves:
+            #
+            # \______/
+            #  \____/
+            #   \__/
+            #    \/
+            #
+            # For more complicated rail shapes, the distance between each
+            # stitch will vary as the angles of the rails vary.  To compensate
+            # for this, we step along both rails a tiny bit at a time and
+            # measure how far the center point between them has moved.  The
+            # stitches go on the first steps that travel far enough.
+            #
+            # Note that a step is 0.05 pixels, which is around 0.01mm, way
+            # smaller than the resolution of an embroidery machine.
+            #
+            # Both rails run out after the same number of steps, except if
+            # the second one has no length at all.  Then it runs out after the
+            # first step.
+            if len1 == 0:
+                steps = 1
+            else:
+                steps = max(1, int(ceil(len0 / 0.05)))
+            distances = numpy.arange(steps + 1) * 0.05
+            positions0 = self.rail_positions(section0, distances)
+            positions1 = self.rail_positions(section1, distances * ratio)
+
+            centers = (positions0 + positions1) / 2.0
+            center_travel = numpy.concatenate(([0.0], numpy.cumsum(numpy.hypot(*numpy.diff(centers, axis=0).T))))
+
+            step = 0
+            while True:
+                if to_travel > 0:
+                    next_step = numpy.searchsorted(center_travel, center_travel[step] + to_travel)
+                    if next_step > steps:
+                        to_travel -= center_travel[steps] - center_travel[step]
+                        break
+                    step = next_step
+
+                add_pair(Point(*positions0[step].tolist()), Point(*positions1[step].tolist()))
+                to_travel = spacing
+
+                if step == steps:
+                    break
+
+            pos0 = Point(*positions0[steps].tolist())
+            pos1 = Point(*positions1[steps].tolist())
 
         if to_travel > 0:
             add_pair(pos0, pos1)
 
         return points
 
+    @debug.time
     def do_contour_underlay(self):
         # "contour walk" underlay: do stitches up one side and down the
         # other.
@@ -746,6 +746,7 @@ class SatinColumn(EmbroideryElement):
             tags=("satin_column", "satin_column_underlay", "satin_contour_underlay"),
             stitches=(forward + list(reversed(back))))
 
+    @debug.time
     def do_center_walk(self):
         # Center walk underlay is just a running stitch down and back on the
         # center line between the bezier curves.
@@ -758,6 +759,7 @@ class SatinColumn(EmbroideryElement):
             tags=("satin_column", "satin_column_underlay", "satin_center_walk"),
             stitches=(forward + list(reversed(back))))
 
+    @debug.time
     def do_zigzag_underlay(self):
         # zigzag underlay, usually done at a much lower density than the
         # satin itself.  It looks like this:
@@ -794,6 +796,7 @@ class SatinColumn(EmbroideryElement):
         patch.add_tags(("satin_column", "satin_column_underlay", "satin_zigzag_underlay"))
         return patch
 
+    @debug.time
     def do_satin(self):
         # satin: do a zigzag pattern, alternating between the paths.  The
         # zigzag looks like this to make the satin stitches look perpendicular
@@ -817,6 +820,7 @@ class SatinColumn(EmbroideryElement):
         patch.add_tags(("satin_column", "satin_column_edge"))
         return patch
 
+    @debug.time
     def do_e_stitch(self):
         # e stitch: do a pattern that looks like the letter "E".  It looks like
         # this:
@@ -839,6 +843,7 @@ class SatinColumn(EmbroideryElement):
         patch.add_tags(("satin_column", "e_stitch"))
         return patch
 
+    @debug.time
     def do_split_stitch(self):
         # stitches exceeding the maximum stitch length will be divided into equal parts through additional stitches
         patch = StitchGroup(color=self.color)
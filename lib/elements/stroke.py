@@ -12,7 +12,7 @@ from ..i18n import _
 from ..stitch_plan import StitchGroup
 from ..stitches import bean_stitch, running_stitch
 from ..svg import parse_length_with_units
-from ..utils import Point, cache
+from ..utils import Point, cached_method
 
 warned_about_legacy_running_stitch = False
 
@@ -65,7 +65,7 @@ class Stroke(EmbroideryElement):
            type='float',
            default=0.4,
            sort_index=3)
-    @cache
+    @cached_method
     def zigzag_spacing(self):
         return max(self.get_float_param("zigzag_spacing_mm", 0.4), 0.01)
 
@@ -83,7 +83,7 @@ class Stroke(EmbroideryElement):
     @property
     def paths(self):
         path = self.parse_path()
-        flattened = self.flatten(path)
+        flattened = self.flattened_path()
 
         # manipulate invalid path
         if len(flattened[0]) == 1:
@@ -95,7 +95,7 @@ class Stroke(EmbroideryElement):
             return flattened
 
     @property
-    @cache
+    @cached_method
     def shape(self):
         line_strings = [shapely.geometry.LineString(path) for path in self.paths]
 
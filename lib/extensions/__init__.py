@@ -3,81 +3,87 @@
 # Copyright (c) 2010 Authors
 # Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
 
-from lib.extensions.troubleshoot import Troubleshoot
+"""The Ink/Stitch extensions, imported on first use.
 
-from .apply_threadlist import ApplyThreadlist
-from .auto_satin import AutoSatin
-from .break_apart import BreakApart
-from .cleanup import Cleanup
-from .commands_scale_symbols import CommandsScaleSymbols
-from .convert_to_satin import ConvertToSatin
-from .convert_to_stroke import ConvertToStroke
-from .cut_satin import CutSatin
-from .cutwork_segmentation import CutworkSegmentation
-from .duplicate_params import DuplicateParams
-from .embroider_settings import EmbroiderSettings
-from .flip import Flip
-from .generate_palette import GeneratePalette
-from .global_commands import GlobalCommands
-from .input import Input
-from .install import Install
-from .install_custom_palette import InstallCustomPalette
-from .layer_commands import LayerCommands
-from .lettering import Lettering
-from .lettering_custom_font_dir import LetteringCustomFontDir
-from .lettering_force_lock_stitches import LetteringForceLockStitches
-from .lettering_generate_json import LetteringGenerateJson
-from .lettering_remove_kerning import LetteringRemoveKerning
-from .letters_to_font import LettersToFont
-from .object_commands import ObjectCommands
-from .object_commands_toggle_visibility import ObjectCommandsToggleVisibility
-from .output import Output
-from .palette_split_text import PaletteSplitText
-from .palette_to_text import PaletteToText
-from .params import Params
-from .print_pdf import Print
-from .remove_embroidery_settings import RemoveEmbroiderySettings
-from .reorder import Reorder
-from .selection_to_pattern import SelectionToPattern
-from .simulator import Simulator
-from .stitch_plan_preview import StitchPlanPreview
-from .zip import Zip
+Importing all extension modules pulls in wxPython, flask and everything
+else any extension needs, which takes most of inkstitch.py's startup time.
+Each extension is only imported when its class is looked up, either as an
+attribute of this package (lib.extensions.Output) or with
+get_extension_class().  The full list, in the order the extensions are
+built into INX files, is still available as lib.extensions.extensions, but
+that imports all of them.
+"""
 
-__all__ = extensions = [StitchPlanPreview,
-                        Install,
-                        Params,
-                        Print,
-                        Input,
-                        Output,
-                        Zip,
-                        Flip,
-                        SelectionToPattern,
-                        ObjectCommands,
-                        ObjectCommandsToggleVisibility,
-                        LayerCommands,
-                        GlobalCommands,
-                        CommandsScaleSymbols,
-                        ConvertToSatin,
-                        ConvertToStroke,
-                        CutSatin,
-                        AutoSatin,
-                        Lettering,
-                        LetteringGenerateJson,
-                        LetteringRemoveKerning,
-                        LetteringCustomFontDir,
-                        LetteringForceLockStitches,
-                        LettersToFont,
-                        Troubleshoot,
-                        RemoveEmbroiderySettings,
-                        Cleanup,
-                        BreakApart,
-                        ApplyThreadlist,
-                        InstallCustomPalette,
-                        GeneratePalette,
-                        PaletteSplitText,
-                        PaletteToText,
-                        Simulator,
-                        Reorder,
-                        DuplicateParams,
-                        EmbroiderSettings,
-                        CutworkSegmentation]
+from importlib import import_module
+
+# class name -> module in this package
+_extension_modules = {
+    'StitchPlanPreview': 'stitch_plan_preview',
+    'Install': 'install',
+    'Params': 'params',
+    'Print': 'print_pdf',
+    'Input': 'input',
+    'Output': 'output',
+    'Zip': 'zip',
+    'Flip': 'flip',
+    'SelectionToPattern': 'selection_to_pattern',
+    'ObjectCommands': 'object_commands',
+    'ObjectCommandsToggleVisibility': 'object_commands_toggle_visibility',
+    'LayerCommands': 'layer_commands',
+    'GlobalCommands': 'global_commands',
+    'CommandsScaleSymbols': 'commands_scale_symbols',
+    'ConvertToSatin': 'convert_to_satin',
+    'ConvertToStroke': 'convert_to_stroke',
+    'CutSatin': 'cut_satin',
+    'AutoSatin': 'auto_satin',
+    'Lettering': 'lettering',
+    'LetteringGenerateJson': 'lettering_generate_json',
+    'LetteringRemoveKerning': 'lettering_remove_kerning',
+    'LetteringCustomFontDir': 'lettering_custom_font_dir',
+    'LetteringForceLockStitches': 'lettering_force_lock_stitches',
+    'LettersToFont': 'letters_to_font',
+    'Troubleshoot': 'troubleshoot',
+    'RemoveEmbroiderySettings': 'remove_embroidery_settings',
+    'Cleanup': 'cleanup',
+    'BreakApart': 'break_apart',
+    'ApplyThreadlist': 'apply_threadlist',
+    'InstallCustomPalette': 'install_custom_palette',
+    'GeneratePalette': 'generate_palette',
+    'PaletteSplitText': 'palette_split_text',
+    'PaletteToText': 'palette_to_text',
+    'Simulator': 'simulator',
+    'Reorder': 'reorder',
+    'DuplicateParams': 'duplicate_params',
+    'EmbroiderSettings': 'embroider_settings',
+    'CutworkSegmentation': 'cutwork_segmentation',
+}
+
+__all__ = list(_extension_modules)
+
+
+def get_extension_class(name):
+    """Import and return the extension class with this name, e.g. "Output".
+
+    Raises AttributeError if there's no such extension.
+    """
+
+    try:
+        module_name = _extension_modules[name]
+    except KeyError:
+        raise AttributeError("Ink/Stitch has no extension named %r" % name) from None
+
+    return getattr(import_module('.' + module_name, __name__), name)
+
+
+def __getattr__(name):
+    # Called for names that aren't module globals yet (PEP 562).  Importing a
+    # submodule sets it as an attribute of the package, but the classes are
+    # only found here.
+    if name == 'extensions':
+        return [get_extension_class(class_name) for class_name in _extension_modules]
+
+    return get_extension_class(name)
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__ + ['extensions'])
@@ -10,21 +10,29 @@ from collections.abc import MutableMapping
 
 import inkex
 from lxml import etree
-from lxml.etree import Comment
 from stringcase import snakecase
 
-from ..commands import is_command, layer_commands
-from ..elements import EmbroideryElement, nodes_to_elements
+from ..commands import find_commands, global_commands, is_command
+from ..debug import debug
+from ..elements import (embroider_in_parallel, embroider_serially,
+                        generate_in_parallel, generate_serially,
+                        nodes_to_elements)
 from ..elements.clone import is_clone
 from ..i18n import _
 from ..patterns import is_pattern
+from ..stitch_plan import StitchGroupCache
 from ..svg import generate_unique_id
+from ..svg.document_index import build_document_index
 from ..svg.tags import (CONNECTOR_TYPE, EMBROIDERABLE_TAGS, INKSCAPE_GROUPMODE,
                         NOT_EMBROIDERABLE_TAGS, SVG_CLIPPATH_TAG, SVG_DEFS_TAG,
                         SVG_GROUP_TAG, SVG_MASK_TAG)
 
 SVG_METADATA_TAG = inkex.addNS("metadata", "svg")
 
+# used if the stitch cache size hasn't been set in the Preferences extension:
+# the cache is off unless the user turns it on
+DEFAULT_STITCH_CACHE_SIZE_MB = 0
+
 
 def strip_namespace(tag):
     """Remove xml namespace from a tag name.
@@ -41,6 +49,34 @@ def strip_namespace(tag):
         return tag
 
 
+def specified_display(node, parent_style, stylesheets=True):
+    """Like node.specified_style(), but only good for looking up display.
+
+    parent_style is what this returned for the parent.  display isn't
+    inherited unless it's set to inherit, so if node doesn't set it and
+    there are no stylesheets that could, None is returned: display has
+    its default value.
+    """
+
+    if not isinstance(node, inkex.BaseElement):
+        return None
+
+    if not stylesheets and 'display' not in node.attrib and 'display' not in node.attrib.get('style', ''):
+        return None
+
+    style = inkex.Style.add_inherited(node.cascaded_style(), parent_style)
+    style.element = node
+    return style
+
+
+def parent_specified_style(node):
+    parent = node.getparent()
+    if isinstance(parent, inkex.BaseElement):
+        return parent.specified_style()
+
+    return None
+
+
 class InkStitchMetadata(MutableMapping):
     """Helper class to get and set inkstitch-specific metadata attributes.
 
@@ -103,6 +139,11 @@ class InkstitchExtension(inkex.Effect):
     def name(cls):
         return snakecase(cls.__name__)
 
+    def run(self, *args, **kwargs):
+        # the outermost span if profiling is enabled (see lib/debug.py)
+        with debug.span(self.name()):
+            return inkex.Effect.run(self, *args, **kwargs)
+
     def hide_all_layers(self):
         for g in self.document.getroot().findall(SVG_GROUP_TAG):
             if g.get(INKSCAPE_GROUPMODE) == "layer":
@@ -129,77 +170,151 @@ class InkstitchExtension(inkex.Effect):
 
         inkex.errormsg(_("Tip: Run Extensions > Ink/Stitch > Troubleshoot > Troubleshoot Objects") + "\n")
 
-    def descendants(self, node, selected=False, troubleshoot=False):  # noqa: C901
-        nodes = []
+    def descendants(self, node, selected=False, troubleshoot=False):
+        """Yield the nodes in and below node that Ink/Stitch should work with.
 
-        if node.tag == Comment:
-            return []
+        The nodes come in document order, children before their group.
+        Hidden objects and groups, ignored objects and layers and everything
+        in them are skipped.  Their display style is worked out from their
+        parent's, and the ignore commands come from the document index (see
+        get_nodes()), so each node is looked at once.
+        """
 
-        element = EmbroideryElement(node)
+        ignored_layers = self._ignored_layers(node)
+        stylesheets = len(node.getroottree().getroot().stylesheets) > 0
 
-        if element.has_command('ignore_object'):
-            return []
+        # (node, selected, its parent's specified style, children done)
+        stack = [(node, selected, parent_specified_style(node), False)]
+        while stack:
+            node, selected, parent_style, children_done = stack.pop()
 
-        if node.tag == SVG_GROUP_TAG and node.get(INKSCAPE_GROUPMODE) == "layer":
-            if len(list(layer_commands(node, "ignore_layer"))):
-                return []
+            if children_done:
+                if selected and self._is_wanted(node, troubleshoot):
+                    yield node
+                continue
 
-        if (node.tag in EMBROIDERABLE_TAGS or node.tag == SVG_GROUP_TAG) and element.get_style('display', 'inline') is None:
-            return []
+            if self._is_skipped(node, ignored_layers):
+                continue
+
+            style = specified_display(node, parent_style, stylesheets)
+            if style is not None and (node.tag in EMBROIDERABLE_TAGS or node.tag == SVG_GROUP_TAG):
+                if style.get('display', 'inline') in ('none', None):
+                    continue
+
+            if self.svg.selection:
+                if node.get("id") in self.svg.selection:
+                    selected = True
+            else:
+                # if the user didn't select anything that means we process everything
+                selected = True
+
+            stack.append((node, selected, None, True))
+            stack.extend((child, selected, style, False) for child in reversed(node))
+
+    def _ignored_layers(self, node):
+        """The layers that have an ignore_layer command in them."""
+
+        layers = set()
+        for command in global_commands(node.getroottree().getroot(), "ignore_layer"):
+            layers.update(command.node.iterancestors(SVG_GROUP_TAG))
+
+        return layers
+
+    def _is_skipped(self, node, ignored_layers):
+        if not isinstance(node.tag, str):
+            # comments
+            return True
 
         # defs, masks and clippaths can contain embroiderable elements
         # but should never be rendered directly.
         if node.tag in [SVG_DEFS_TAG, SVG_MASK_TAG, SVG_CLIPPATH_TAG]:
-            return []
+            return True
 
         # command connectors with a fill color set, will glitch into the elements list
         if is_command(node) or node.get(CONNECTOR_TYPE):
-            return []
+            return True
 
-        if self.svg.selection:
-            if node.get("id") in self.svg.selection:
-                selected = True
-        else:
-            # if the user didn't select anything that means we process everything
-            selected = True
+        if node.tag == SVG_GROUP_TAG and node.get(INKSCAPE_GROUPMODE) == "layer" and node in ignored_layers:
+            return True
 
-        for child in node:
-            nodes.extend(self.descendants(child, selected, troubleshoot))
+        return any(command.command == 'ignore_object' for command in find_commands(node))
 
-        if selected:
-            if node.tag == SVG_GROUP_TAG:
-                pass
-            elif (node.tag in EMBROIDERABLE_TAGS or is_clone(node)) and not is_pattern(node):
-                nodes.append(node)
-            # add images, text and patterns for the troubleshoot extension
-            elif troubleshoot and (node.tag in NOT_EMBROIDERABLE_TAGS or is_pattern(node)):
-                nodes.append(node)
+    def _is_wanted(self, node, troubleshoot):
+        if node.tag == SVG_GROUP_TAG:
+            return False
+        elif (node.tag in EMBROIDERABLE_TAGS or is_clone(node)) and not is_pattern(node):
+            return True
+        # add images, text and patterns for the troubleshoot extension
+        elif troubleshoot and (node.tag in NOT_EMBROIDERABLE_TAGS or is_pattern(node)):
+            return True
 
-        return nodes
+        return False
 
     def get_nodes(self, troubleshoot=False):
+        return list(self.iter_nodes(troubleshoot))
+
+    def iter_nodes(self, troubleshoot=False):
+        """Like get_nodes(), but yield the nodes one by one.
+
+        Don't change the document while iterating.
+        """
+
+        # descendants() looks up the commands of every node
+        build_document_index(self.document.getroot())
         return self.descendants(self.document.getroot(), troubleshoot=troubleshoot)
 
     def get_elements(self, troubleshoot=False):
-        self.elements = nodes_to_elements(self.get_nodes(troubleshoot))
+        self.elements = nodes_to_elements(self.iter_nodes(troubleshoot))
         if self.elements:
             return True
         if not troubleshoot:
             self.no_elements_error()
         return False
 
+    @debug.time
     def elements_to_stitch_groups(self, elements):
-        patches = []
-        for element in elements:
-            if patches:
-                last_patch = patches[-1]
-            else:
-                last_patch = None
+        metadata = self.get_inkstitch_metadata()
+        cache = self.get_stitch_group_cache(metadata)
+
+        if metadata['parallel_embroidery']:
+            patches = embroider_in_parallel(elements, cache=cache)
+        else:
+            patches = embroider_serially(elements, cache=cache)
 
-            patches.extend(element.embroider(last_patch))
+        if cache is not None:
+            cache.evict()
 
         return patches
 
+    def generate_stitch_groups(self, elements):
+        """Like elements_to_stitch_groups(), but yield the StitchGroups as soon as each element is done."""
+
+        metadata = self.get_inkstitch_metadata()
+        cache = self.get_stitch_group_cache(metadata)
+
+        if metadata['parallel_embroidery']:
+            element_patches = generate_in_parallel(elements, cache=cache)
+        else:
+            element_patches = generate_serially(elements, cache=cache)
+
+        try:
+            for patches in element_patches:
+                yield from patches
+        finally:
+            element_patches.close()
+            if cache is not None:
+                cache.evict()
+
+    def get_stitch_group_cache(self, metadata):
+        cache_size = metadata['stitch_cache_size_mb']
+        if cache_size is None:
+            cache_size = DEFAULT_STITCH_CACHE_SIZE_MB
+
+        if cache_size > 0:
+            return StitchGroupCache(cache_size * 1024 * 1024)
+        else:
+            return None
+
     def get_inkstitch_metadata(self):
         return InkStitchMetadata(self.svg)
 
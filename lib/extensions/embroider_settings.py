@@ -3,6 +3,8 @@
 # Copyright (c) 2010 Authors
 # Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
 
+from inkex import Boolean
+
 from .base import InkstitchExtension
 
 
@@ -16,7 +18,17 @@ class EmbroiderSettings(InkstitchExtension):
                                      action="store", type=float,
                                      dest="collapse_length_mm", default=3.0,
                                      help="max collapse length (mm)")
+        self.arg_parser.add_argument("-p", "--parallel_embroidery",
+                                     action="store", type=Boolean,
+                                     dest="parallel_embroidery", default=False,
+                                     help="embroider objects in parallel")
+        self.arg_parser.add_argument("-s", "--stitch_cache_size_mb",
+                                     action="store", type=int,
+                                     dest="stitch_cache_size_mb", default=0,
+                                     help="size of the stitch cache (MB), 0 to disable it")
 
     def effect(self):
         self.metadata = self.get_inkstitch_metadata()
         self.metadata['collapse_len_mm'] = self.options.collapse_length_mm
+        self.metadata['parallel_embroidery'] = self.options.parallel_embroidery
+        self.metadata['stitch_cache_size_mb'] = self.options.stitch_cache_size_mb
@@ -21,7 +21,7 @@ from ..lettering import Font, FontError
 from ..svg import get_correction_transform
 from ..svg.tags import (INKSCAPE_LABEL, INKSTITCH_LETTERING, SVG_GROUP_TAG,
                         SVG_PATH_TAG)
-from ..utils import DotDict, cache, get_bundled_dir, get_resource_dir
+from ..utils import DotDict, cached_method, get_bundled_dir, get_resource_dir
 from .commands import CommandsExtension
 from .lettering_custom_font_dir import get_custom_font_dir
 
@@ -195,7 +195,7 @@ class LetteringFrame(wx.Frame):
         self.on_font_changed()
 
     @property
-    @cache
+    @cached_method
     def default_font(self):
         try:
             return self.fonts_by_id[self.DEFAULT_FONT]
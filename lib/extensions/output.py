@@ -3,6 +3,7 @@
 # Copyright (c) 2010 Authors
 # Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
 
+import io
 import os
 import sys
 import tempfile
@@ -64,7 +65,12 @@ class Output(InkstitchExtension):
 
         if sys.platform == "win32":
             import msvcrt
-            msvcrt.setmode(sys.stdout.fileno(), os.O_BINARY)
+            try:
+                msvcrt.setmode(sys.stdout.fileno(), os.O_BINARY)
+            except io.UnsupportedOperation:
+                # In the render daemon stdout is a buffer in memory, which
+                # is binary already.  The client sets the binary mode.
+                pass
 
         # inkscape will read the file contents from stdout and copy
         # to the destination file that the user chose
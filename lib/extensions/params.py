@@ -8,7 +8,6 @@
 import os
 import sys
 from collections import defaultdict
-from copy import copy
 from itertools import groupby
 
 import wx
@@ -347,6 +346,10 @@ class SettingsFrame(wx.Frame):
         icon = wx.Icon(os.path.join(get_resource_dir("icons"), "inkstitch256x256.png"))
         self.SetIcon(icon)
 
+        # The patches of each element from the last preview, along with the
+        # element's stitch group cache key at the time.  See embroider_element().
+        self.patches_by_element = {}
+
         self.notebook = wx.Notebook(self, wx.ID_ANY)
         self.tabs = self.tabs_factory(self.notebook)
 
@@ -398,11 +401,7 @@ class SettingsFrame(wx.Frame):
                     # cancel; params were updated and we need to start over
                     return []
 
-                # Making a copy of the embroidery element is an easy
-                # way to drop the cache in the @cache decorators used
-                # for many params in embroider.py.
-
-                patches.extend(copy(node).embroider(None))
+                patches.extend(self.embroider_element(node))
         except SystemExit:
             wx.CallAfter(self._show_warning)
             raise
@@ -413,6 +412,21 @@ class SettingsFrame(wx.Frame):
 
         return patches
 
+    def embroider_element(self, element):
+        # Usually only a few of the selected elements are affected by a
+        # change, so we only embroider the elements whose params differ from
+        # the last preview and reuse the patches of the others.
+        key = element.stitch_group_cache_key(None)
+        last_key, patches = self.patches_by_element.get(element, (None, None))
+
+        if key is None or key != last_key:
+            # set_param() dropped the element's cached params, and embroider()
+            # notices other changes to the node by itself.
+            patches = element.embroider(None)
+            self.patches_by_element[element] = (key, patches)
+
+        return patches
+
     def _hide_warning(self):
         self.warning_panel.Hide()
         self.Layout()
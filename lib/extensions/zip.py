@@ -15,7 +15,7 @@ from lxml import etree
 import pyembroidery
 
 from ..i18n import _
-from ..output import write_embroidery_file
+from ..output import write_embroidery_files
 from ..stitch_plan import stitch_groups_to_stitch_plan
 from ..threads import ThreadCatalog
 from .base import InkstitchExtension
@@ -50,6 +50,7 @@ class Zip(InkstitchExtension):
         path = tempfile.mkdtemp()
 
         files = []
+        embroidery_files = []
 
         for format in self.formats:
             if getattr(self.options, format):
@@ -64,9 +65,13 @@ class Zip(InkstitchExtension):
                     output.write(self.get_threadlist(stitch_plan, base_file_name))
                     output.close()
                 else:
-                    write_embroidery_file(output_file, stitch_plan, self.document.getroot())
+                    embroidery_files.append(output_file)
                 files.append(output_file)
 
+        # all formats at once, so that the pattern is only encoded once for
+        # formats that share encoder settings
+        write_embroidery_files(embroidery_files, stitch_plan, self.document.getroot())
+
         if not files:
             self.errormsg(_("No embroidery file formats selected."))
 
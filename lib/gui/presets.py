@@ -10,7 +10,7 @@ import re
 import wx
 
 from ..i18n import _
-from ..utils import cache
+from ..utils import cached_method
 from .dialogs import info_dialog
 
 
@@ -79,14 +79,14 @@ class PresetsPanel(wx.Panel):
         self.Layout()
 
     @property
-    @cache
+    @cached_method
     def suite_name(self):
         try:
             return self.parent.get_preset_suite_name() + "_presets"
         except AttributeError:
             return "presets"
 
-    @cache
+    @cached_method
     def presets_path(self):
         try:
             import appdirs
@@ -740,6 +740,10 @@ class SimulatorPreview(Thread):
                 If possible, this method should periodically check
                 abort_event.is_set(), and if True, stop early.  The return
                 value will be ignored in this case.
+
+                If nothing changed, it may return the same StitchGroup
+                instances as last time.  The stitch plan is not generated
+                again in that case.
         """
         self.parent = parent
         self.target_duration = kwargs.pop('target_duration', 5)
@@ -749,6 +753,11 @@ class SimulatorPreview(Thread):
         self.simulate_window = None
         self.refresh_needed = Event()
 
+        # The stitch plan is reused if generate_patches() returns the same
+        # patches as last time.
+        self.last_patches = []
+        self.last_stitch_plan = None
+
         # used when closing to avoid having the window reopen at the last second
         self._disabled = False
 
@@ -789,12 +798,20 @@ class SimulatorPreview(Thread):
             return
 
         if patches and not self.refresh_needed.is_set():
-            stitch_plan = stitch_groups_to_stitch_plan(patches)
+            if self.same_patches(patches, self.last_patches):
+                stitch_plan = self.last_stitch_plan
+            else:
+                stitch_plan = stitch_groups_to_stitch_plan(patches)
+                self.last_patches = patches
+                self.last_stitch_plan = stitch_plan
 
             # GUI stuff needs to happen in the main thread, so we ask the main
             # thread to call refresh_simulator().
             wx.CallAfter(self.refresh_simulator, patches, stitch_plan)
 
+    def same_patches(self, patches, other_patches):
+        return len(patches) == len(other_patches) and all(patch is other for patch, other in zip(patches, other_patches))
+
     def refresh_simulator(self, patches, stitch_plan):
         if self.simulate_window:
             self.simulate_window.stop()
@@ -3,29 +3,35 @@
 # Copyright (c) 2010 Authors
 # Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
 
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+
 import inkex
+import numpy
 
 import pyembroidery
 
 from .commands import global_command
+from .debug import debug
 from .i18n import _
-from .stitch_plan import Stitch
+from .output_writers import get_writer
+from .stitch_plan.stitch import COLOR_CHANGE, JUMP, STOP, TRIM
 from .svg import PIXELS_PER_MM
 from .utils import Point
 
 
-def get_command(stitch):
-    if stitch.jump:
-        return pyembroidery.JUMP
-    elif stitch.trim:
-        return pyembroidery.TRIM
-    elif stitch.color_change:
-        return pyembroidery.COLOR_CHANGE
-    elif stitch.stop:
-        return pyembroidery.STOP
-    else:
-        return pyembroidery.NEEDLE_AT
+# convert from pixels to millimeters
+# also multiply by 10 to get tenths of a millimeter as required by pyembroidery
+PIXEL_SCALE = 10 / PIXELS_PER_MM
+
+
+def get_commands(flags):
+    """The pyembroidery command for each stitch, from a ColorBlock's flags."""
+
+    return numpy.select([flags & JUMP != 0, flags & TRIM != 0, flags & COLOR_CHANGE != 0, flags & STOP != 0],
+                        [pyembroidery.JUMP, pyembroidery.TRIM, pyembroidery.COLOR_CHANGE, pyembroidery.STOP],
+                        pyembroidery.NEEDLE_AT)
 
 
 def _string_to_floats(string):
@@ -45,45 +51,101 @@ def get_origin(svg, xxx_todo_changeme):
         return default
 
 
-def jump_to_stop_point(pattern, svg):
+def pattern_stitches(stitch_plan, svg, scale=None, translate=None):
+    """Convert the stitch plan to pyembroidery's stitch list all at once.
+
+    Each stitch becomes [x, y, command].  If scale and translate are given,
+    x and y are transformed like pyembroidery does it when it's given the
+    scale and translate settings: x * scale + translate.  Before each STOP, a jump to the
+    stop_position command is added, if there is one.  The list ends with
+    an END.
+    """
+
     stop_position = global_command(svg, "stop_position")
-    if stop_position:
-        pattern.add_stitch_absolute(pyembroidery.JUMP, stop_position.point.x, stop_position.point.y)
+    x = [numpy.zeros(1)]
+    y = [numpy.zeros(1)]
+    commands = [numpy.full(1, pyembroidery.END)]
 
+    for color_block in stitch_plan:
+        block_x = color_block.x
+        block_y = color_block.y
+        block_commands = get_commands(color_block.flags)
 
-def write_embroidery_file(file_path, stitch_plan, svg, settings={}):
-    origin = get_origin(svg, stitch_plan.bounding_box)
+        stops = numpy.flatnonzero(color_block.flags & STOP)
+        if stop_position and len(stops):
+            block_x = numpy.insert(block_x, stops, stop_position.point.x)
+            block_y = numpy.insert(block_y, stops, stop_position.point.y)
+            block_commands = numpy.insert(block_commands, stops, pyembroidery.JUMP)
 
-    pattern = pyembroidery.EmbPattern()
-    stitch = Stitch(0, 0)
+        x.insert(-1, block_x)
+        y.insert(-1, block_y)
+        commands.insert(-1, block_commands)
 
+    x = numpy.concatenate(x)
+    y = numpy.concatenate(y)
+
+    # The END is at the last stitch.
     for color_block in stitch_plan:
-        pattern.add_thread(color_block.color.pyembroidery_thread)
+        if len(color_block):
+            x[-1] = color_block.x[-1]
+            y[-1] = color_block.y[-1]
+
+    if scale is not None:
+        x = x * scale + translate[0]
+        y = y * scale + translate[1]
+
+    return [list(stitch) for stitch in zip(x.tolist(), y.tolist(), numpy.concatenate(commands).tolist())]
+
+
+# The settings that pyembroidery normalizes a pattern with, and the writer
+# module constants it takes them from if they aren't given.
+ENCODER_SETTINGS = {
+    "max_jump": "MAX_JUMP_DISTANCE",
+    "max_stitch": "MAX_STITCH_DISTANCE",
+    "full_jump": "FULL_JUMP",
+    "round": "ROUND",
+    "writes_speeds": "WRITES_SPEEDS",
+    "sequin_contingency": "SEQUIN_CONTINGENCY",
+    "thread_change_command": "THREAD_CHANGE_COMMAND",
+    "explicit_trim": "EXPLICIT_TRIM",
+    "translate": "TRANSLATE",
+    "scale": "SCALE",
+    "rotate": "ROTATE",
+}
 
-        for stitch in color_block:
-            if stitch.stop:
-                jump_to_stop_point(pattern, svg)
-            command = get_command(stitch)
-            pattern.add_stitch_absolute(command, stitch.x, stitch.y)
 
-    pattern.add_stitch_absolute(pyembroidery.END, stitch.x, stitch.y)
+def get_encoder_settings(writer, settings):
+    """The settings pyembroidery would normalize the pattern with for this writer."""
 
-    # convert from pixels to millimeters
-    # also multiply by 10 to get tenths of a millimeter as required by pyembroidery
-    scale = 10 / PIXELS_PER_MM
+    encoder_settings = {}
+    for name, constant in ENCODER_SETTINGS.items():
+        if name in settings:
+            encoder_settings[name] = settings[name]
+        elif hasattr(writer, constant):
+            encoder_settings[name] = getattr(writer, constant)
 
-    settings.update({
-        # correct for the origin
-        "translate": -origin,
+    return encoder_settings
 
-        # convert from pixels to millimeters
-        # also multiply by 10 to get tenths of a millimeter as required by pyembroidery
-        "scale": (scale, scale),
 
-        # This forces a jump at the start of the design and after each trim,
-        # even if we're close enough not to need one.
-        "full_jump": True,
-    })
+def encoder_settings_key(encoder_settings):
+    return tuple(sorted((name, tuple(value) if isinstance(value, list) else value) for name, value in encoder_settings.items()))
+
+
+def get_file_settings(file_path, writer, origin, settings):
+    settings = dict(settings)
+
+    # This forces a jump at the start of the design and after each trim,
+    # even if we're close enough not to need one.
+    settings.update({"full_jump": True})
+
+    if settings.get("encode", getattr(writer, "ENCODE", True)):
+        # The stitches are already corrected for the origin and scaled (see
+        # write_embroidery_files()).
+        settings.update({"translate": (0, 0), "scale": (1, 1)})
+    else:
+        # Writers that don't encode ignore these settings and write the
+        # stitches as they are.
+        settings.update({"translate": -origin, "scale": (PIXEL_SCALE, PIXEL_SCALE)})
 
     if file_path.endswith('.csv'):
         # Special treatment for CSV: instruct pyembroidery not to do any post-
@@ -93,11 +155,130 @@ def write_embroidery_file(file_path, stitch_plan, svg, settings={}):
         settings['max_jump'] = float('inf')
         settings['explicit_trim'] = False
 
-    try:
-        pyembroidery.write(pattern, file_path, settings)
-    except IOError as e:
-        # L10N low-level file error.  %(error)s is (hopefully?) translated by
-        # the user's system automatically.
-        msg = _("Error writing to %(path)s: %(error)s") % dict(path=file_path, error=e.strerror)
-        inkex.errormsg(msg)
-        sys.exit(1)
+    return settings
+
+
+def writable_copy(pattern):
+    """A copy of a pattern that a writer can change.
+
+    Some writers add threads to the pattern or turn its STOPs into color
+    changes, so each writer gets its own copy of the shared pattern.  Only
+    the STOPs are copied, because the other stitches are never changed.
+    """
+
+    copy = pattern.copy()
+    copy.stitches = [stitch[:] if stitch[2] & pyembroidery.COMMAND_MASK == pyembroidery.STOP else stitch for stitch in pattern.stitches]
+    return copy
+
+
+def run_in_threads(function, items, max_workers=None):
+    if len(items) < 2:
+        return [function(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(function, items))
+
+
+@debug.time
+def write_embroidery_file(file_path, stitch_plan, svg, settings={}):
+    write_embroidery_files([file_path], stitch_plan, svg, settings)
+
+
+def plan_files(file_paths, origin, settings):
+    """Return (file path, writer, settings, encoder settings key) for each file.
+
+    The key is None for writers that don't encode.  Also returns the encoder
+    settings for each key.
+    """
+
+    files = []
+    encoder_settings = {}
+    for file_path in file_paths:
+        try:
+            writer = get_writer(os.path.splitext(file_path)[1][1:])
+        except IOError as error:
+            report_write_error(file_path, error)
+
+        file_settings = get_file_settings(file_path, writer, origin, settings)
+
+        if file_settings.get("encode", getattr(writer, "ENCODE", True)):
+            file_encoder_settings = get_encoder_settings(writer, file_settings)
+            file_settings.update(file_encoder_settings)
+            key = encoder_settings_key(file_encoder_settings)
+            encoder_settings.setdefault(key, file_encoder_settings)
+        else:
+            key = None
+            encoder_settings.setdefault(key, None)
+
+        files.append((file_path, writer, file_settings, key))
+
+    return files, encoder_settings
+
+
+def build_patterns(stitch_plan, svg, origin, encoder_settings, max_workers=None):
+    """Build the pattern for each encoder settings key, normalized unless the key is None."""
+
+    if list(encoder_settings) == [None]:
+        encoded_stitches = None
+    else:
+        # We correct for the origin and scale the stitches here, because it's
+        # much faster with numpy.  pyembroidery would do the same for each
+        # stitch on its own when it encodes the pattern.
+        encoded_stitches = pattern_stitches(stitch_plan, svg, PIXEL_SCALE, (-origin.x, -origin.y))
+
+    def build_pattern(key):
+        pattern = pyembroidery.EmbPattern()
+        for color_block in stitch_plan:
+            pattern.add_thread(color_block.color.pyembroidery_thread)
+
+        if key is None:
+            pattern.stitches = pattern_stitches(stitch_plan, svg)
+            return pattern
+
+        pattern.stitches = encoded_stitches
+        with debug.span("pyembroidery.normalize"):
+            return pattern.get_normalized_pattern(dict(encoder_settings[key]))
+
+    return dict(zip(encoder_settings, run_in_threads(build_pattern, list(encoder_settings), max_workers)))
+
+
+@debug.time
+def write_embroidery_files(file_paths, stitch_plan, svg, settings={}, max_workers=None):
+    """Write the stitch plan to several files, usually one for each format.
+
+    pyembroidery builds and normalizes the pattern again for each file it
+    writes (splitting long stitches, adding jumps, encoding trims).  Here
+    that's done once for each distinct set of encoder settings and the
+    normalized pattern is shared by all files that need those settings.
+    The normalization and the writers run in up to max_workers threads.
+    """
+
+    origin = get_origin(svg, stitch_plan.bounding_box)
+    files, encoder_settings = plan_files(file_paths, origin, settings)
+    patterns = build_patterns(stitch_plan, svg, origin, encoder_settings, max_workers)
+
+    def write_file(file):
+        file_path, writer, file_settings, key = file
+        pattern = writable_copy(patterns[key])
+        debug.count("stitches written", len(pattern.stitches))
+
+        # The pattern is already normalized.
+        file_settings["encode"] = False
+
+        try:
+            with debug.span("pyembroidery.write", file=file_path):
+                pyembroidery.EmbPattern.write_embroidery(writer, pattern, file_path, file_settings)
+        except IOError as e:
+            return e
+
+    for file_path, error in zip(file_paths, run_in_threads(write_file, files, max_workers)):
+        if error is not None:
+            report_write_error(file_path, error)
+
+
+def report_write_error(file_path, error):
+    # L10N low-level file error.  %(error)s is (hopefully?) translated by
+    # the user's system automatically.
+    msg = _("Error writing to %(path)s: %(error)s") % dict(path=file_path, error=error.strerror or error)
+    inkex.errormsg(msg)
+    sys.exit(1)
@@ -0,0 +1,382 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""Faster writers for the embroidery formats we write most.
+
+pyembroidery writes a normalized EmbPattern one stitch at a time, with a
+few small writes for each.  The writers here encode all stitch records at
+once with numpy and write them in one go.  They're drop-in replacements for
+pyembroidery's writer modules: pyembroidery still normalizes the pattern
+with the writer's settings (MAX_STITCH_DISTANCE etc.), and the bytes
+written are exactly the same.
+
+PES isn't here: most of its time goes into the PEC thumbnail graphics.
+"""
+
+import datetime
+
+import numpy
+import pyembroidery
+from pyembroidery import DstWriter, ExpWriter, JefWriter
+from pyembroidery.EmbConstant import (COLOR_CHANGE, COMMAND_MASK, END,
+                                      JUMP, SEQUIN_EJECT, SEQUIN_MODE, STITCH,
+                                      STOP, TRIM)
+from pyembroidery.EmbThreadJef import get_thread_set
+from pyembroidery.WriteHelper import write_int_32le, write_string_utf8
+
+
+def stitch_arrays(pattern):
+    """Return x, y and the commands (without their extra bits) as numpy arrays."""
+
+    stitches = numpy.array(pattern.stitches).reshape(-1, 3)
+    commands = stitches[:, 2].astype(numpy.int64) & COMMAND_MASK
+
+    return stitches[:, 0], stitches[:, 1], commands
+
+
+def needle_deltas(x, y):
+    """The integer moves of the needle to each stitch, as pyembroidery's writers compute them.
+
+    Each move is rounded and the needle moves by the rounded amount, so the
+    rounding errors don't add up.
+    """
+
+    return needle_moves(x), needle_moves(y)
+
+
+def needle_moves(coordinates):
+    # The needle is always at an integer position, so after a move to an
+    # integer coordinate, it's exactly there.  pyembroidery rounds the
+    # normalized pattern, except for the jumps it adds to split long moves.
+    # Only those need to be followed one by one.
+    needle = numpy.round(coordinates)
+    for i in numpy.flatnonzero(needle != coordinates).tolist():
+        previous = int(needle[i - 1]) if i > 0 else 0
+        needle[i] = previous + int(round(float(coordinates[i]) - previous))
+
+    return numpy.diff(needle, prepend=0).astype(numpy.int64)
+
+
+def pack_records(records, lengths):
+    """Concatenate the first lengths[i] bytes of each row of records."""
+
+    used = numpy.arange(records.shape[1]) < lengths[:, numpy.newaxis]
+    return records[used].astype(numpy.uint8).tobytes()
+
+
+# DST stores each move as a sum of the powers of three from 81 down to 1,
+# each with a bit for + and one for -.  (step, byte, + bit, - bit)
+DST_X_DIGITS = ((81, 2, 2, 3), (27, 1, 2, 3), (9, 0, 2, 3), (3, 1, 0, 1), (1, 0, 0, 1))
+DST_Y_DIGITS = ((81, 2, 5, 4), (27, 1, 5, 4), (9, 0, 5, 4), (3, 1, 7, 6), (1, 0, 7, 6))
+
+
+def dst_trim_moves(trim_at):
+    # DstWriter writes a TRIM as a series of small jumps back and forth.
+    delta = -4
+    moves = [-delta // 2]
+    for p in range(1, trim_at - 1):
+        moves.append(delta)
+        delta = -delta
+    moves.append(delta // 2)
+
+    return moves
+
+
+def dst_encode_records(dx, dy, commands):
+    """Vectorized DstWriter.encode_record()."""
+
+    records = numpy.zeros((len(commands), 3), dtype=numpy.int64)
+    jump = (commands == JUMP) | (commands == SEQUIN_EJECT)
+    move = jump | (commands == STITCH)
+
+    records[:, 2] = numpy.where(jump, 1 << 7, 0) + numpy.where(move, 0b11, 0)
+
+    for value, digits, name in ((dx, DST_X_DIGITS, "dx"), (-dy, DST_Y_DIGITS, "dy")):
+        value = numpy.where(move, value, 0)
+        for step, byte, plus_bit, minus_bit in digits:
+            plus = value > step // 2
+            minus = value < -(step // 2)
+            records[:, byte] += numpy.where(plus, 1 << plus_bit, 0) + numpy.where(minus, 1 << minus_bit, 0)
+            value = value - step * plus + step * minus
+
+        if numpy.any(value != 0):
+            raise ValueError("The %s value given to the writer exceeds maximum allowed." % name)
+
+    records[(commands == COLOR_CHANGE) | (commands == STOP), 2] = 0b11000011
+    records[commands == END, 2] = 0b11110011
+    records[commands == SEQUIN_MODE, 2] = 0b01000011
+
+    return records
+
+
+def write_dst(pattern, f, settings=None):
+    """Same as pyembroidery's DstWriter.write()."""
+
+    extended_header = False
+    trim_at = 3
+    if settings is not None:
+        extended_header = settings.get("extended header", extended_header)
+        if settings.get("version", "default") == "extended":
+            extended_header = True
+        trim_at = settings.get("trim_at", trim_at)
+
+    x, y, commands = stitch_arrays(pattern)
+    write_dst_header(pattern, f, x, y, commands, extended_header)
+
+    dx, dy = needle_deltas(x, y)
+
+    # Each TRIM turns into several jump records.
+    trim_moves = numpy.array(dst_trim_moves(trim_at), dtype=numpy.int64)
+    trim = commands == TRIM
+    counts = numpy.where(trim, len(trim_moves), 1)
+    index = numpy.repeat(numpy.arange(len(commands)), counts)
+    offset = numpy.arange(len(index)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    trim_record = trim[index]
+
+    record_dx = numpy.where(trim_record, trim_moves[offset % len(trim_moves)], dx[index])
+    record_dy = numpy.where(trim_record, trim_moves[offset % len(trim_moves)], dy[index])
+    record_commands = numpy.where(trim_record, JUMP, commands[index])
+
+    f.write(dst_encode_records(record_dx, record_dy, record_commands).astype(numpy.uint8).tobytes())
+
+
+def write_dst_header(pattern, f, x, y, commands, extended_header):
+    if len(commands):
+        bounds = [float(x.min()), float(y.min()), float(x.max()), float(y.max())]
+    else:
+        bounds = pattern.bounds()
+
+    name = pattern.get_metadata("name", "Untitled")
+
+    write_string_utf8(f, "LA:%-16s\r" % name)
+    write_string_utf8(f, "ST:%7d\r" % len(commands))
+    write_string_utf8(f, "CO:%3d\r" % numpy.count_nonzero(commands == COLOR_CHANGE))
+
+    write_string_utf8(f, "+X:%5d\r" % abs(bounds[2]))
+    write_string_utf8(f, "-X:%5d\r" % abs(bounds[0]))
+    write_string_utf8(f, "+Y:%5d\r" % abs(bounds[3]))
+    write_string_utf8(f, "-Y:%5d\r" % abs(bounds[1]))
+    ax = 0
+    ay = 0
+    if len(commands):
+        ax = int(pattern.stitches[-1][0])
+        ay = -int(pattern.stitches[-1][1])
+    write_string_utf8(f, "AX:%s%5d\r" % ("+" if ax >= 0 else "-", abs(ax)))
+    write_string_utf8(f, "AY:%s%5d\r" % ("+" if ay >= 0 else "-", abs(ay)))
+    write_string_utf8(f, "MX:+%5d\r" % 0)
+    write_string_utf8(f, "MY:+%5d\r" % 0)
+    write_string_utf8(f, "PD:%6s\r" % "******")
+    if extended_header:
+        author = pattern.get_metadata("author")
+        if author is not None:
+            write_string_utf8(f, "AU:%s\r" % author)
+        meta_copyright = pattern.get_metadata("copyright")
+        if meta_copyright is not None:
+            write_string_utf8(f, "CP:%s\r" % meta_copyright)
+        for thread in pattern.threadlist:
+            write_string_utf8(f, "TC:%s,%s,%s\r" % (thread.hex_color(), thread.description, thread.catalog_number))
+    f.write(b"\x1a")
+    f.write(b"\x20" * (DstWriter.DSTHEADERSIZE - f.tell()))
+
+
+def write_exp(pattern, f, settings=None):
+    """Same as pyembroidery's ExpWriter.write()."""
+
+    x, y, commands = stitch_arrays(pattern)
+    dx, dy = needle_deltas(x, y)
+
+    records = numpy.zeros((len(commands), 4), dtype=numpy.int64)
+    lengths = numpy.zeros(len(commands), dtype=numpy.int64)
+
+    stitch = commands == STITCH
+    records[stitch, 0] = dx[stitch] & 0xFF
+    records[stitch, 1] = -dy[stitch] & 0xFF
+    lengths[stitch] = 2
+
+    jump = commands == JUMP
+    records[jump] = numpy.column_stack((numpy.full(numpy.count_nonzero(jump), 0x80), numpy.full(numpy.count_nonzero(jump), 0x04),
+                                        dx[jump] & 0xFF, -dy[jump] & 0xFF))
+    lengths[jump] = 4
+
+    trim = commands == TRIM
+    records[trim] = (0x80, 0x80, 0x07, 0x00)
+    lengths[trim] = 4
+
+    color_change = (commands == COLOR_CHANGE) | (commands == STOP)
+    records[color_change] = (0x80, 0x01, 0x00, 0x00)
+    lengths[color_change] = 4
+
+    f.write(pack_records(records, lengths))
+
+
+def write_jef(pattern, f, settings=None):
+    """Same as pyembroidery's JefWriter.write()."""
+
+    trims = False
+    command_count_max = 3
+    date_string = None
+    if settings is not None:
+        trims = settings.get("trims", trims)
+        command_count_max = settings.get("trim_at", command_count_max)
+        date_string = settings.get("date", date_string)
+
+    pattern.fix_color_count()
+    x, y, commands = stitch_arrays(pattern)
+    write_jef_header(pattern, f, x, y, commands, trims, command_count_max, date_string)
+
+    # JefWriter stops writing stitches at the first END.
+    dx, dy = needle_deltas(x, y)
+    ends = numpy.flatnonzero(commands == END)
+    if len(ends):
+        dx, dy, commands = dx[:ends[0]], dy[:ends[0]], commands[:ends[0]]
+
+    trim_length = 4 * command_count_max if trims else 0
+    records = numpy.zeros((len(commands), max(4, trim_length)), dtype=numpy.int64)
+    lengths = numpy.zeros(len(commands), dtype=numpy.int64)
+
+    stitch = commands == STITCH
+    records[stitch, 0] = dx[stitch] & 0xFF
+    records[stitch, 1] = -dy[stitch] & 0xFF
+    lengths[stitch] = 2
+
+    for command_mask, second_byte in (((commands == COLOR_CHANGE) | (commands == STOP), 0x01), (commands == JUMP, 0x02)):
+        records[command_mask, 0] = 0x80
+        records[command_mask, 1] = second_byte
+        records[command_mask, 2] = dx[command_mask] & 0xFF
+        records[command_mask, 3] = -dy[command_mask] & 0xFF
+        lengths[command_mask] = 4
+
+    trim = commands == TRIM
+    records[trim, :trim_length] = [0x80, 0x02, 0x00, 0x00] * (trim_length // 4)
+    lengths[trim] = trim_length
+
+    f.write(pack_records(records, lengths))
+    f.write(b"\x80\x10")
+
+
+def jef_palette(pattern, commands):
+    # JefWriter's palette loop, only looking at the stitches where something happens
+    jef_threads = get_thread_set()
+    last_index = None
+    last_thread = None
+    palette = []
+    color_toggled = False
+    color_count = 0
+    index_in_threadlist = 0
+
+    events = numpy.flatnonzero((commands == COLOR_CHANGE) | (commands == STOP)).tolist()
+    if len(commands) and (not events or events[0] != 0):
+        events.insert(0, 0)
+
+    for i in events:
+        flags = commands[i]
+        if flags == COLOR_CHANGE or index_in_threadlist == 0:
+            thread = pattern.threadlist[index_in_threadlist]
+            index_in_threadlist += 1
+            color_count += 1
+            index_of_jefthread = thread.find_nearest_color_index(jef_threads)
+            if last_index == index_of_jefthread and last_thread != thread:
+                repeated_thread = jef_threads[index_of_jefthread]
+                repeated_index = index_of_jefthread
+                jef_threads[index_of_jefthread] = None
+                index_of_jefthread = thread.find_nearest_color_index(jef_threads)
+                jef_threads[repeated_index] = repeated_thread
+            palette.append(index_of_jefthread)
+            last_index = index_of_jefthread
+            last_thread = thread
+            color_toggled = False
+        if flags == STOP:
+            color_count += 1
+            color_toggled = not color_toggled
+            if color_toggled:
+                palette.append(0)
+            else:
+                palette.append(last_index)
+
+    return palette, color_count
+
+
+def write_jef_header(pattern, f, x, y, commands, trims, command_count_max, date_string):
+    if date_string is None:
+        date_string = datetime.datetime.today().strftime("%Y%m%d%H%M%S")
+
+    palette, color_count = jef_palette(pattern, commands)
+
+    write_int_32le(f, 0x74 + (color_count * 8))
+    write_int_32le(f, 0x14)
+    write_string_utf8(f, date_string)
+    f.write(b"\x00\x00")
+    write_int_32le(f, color_count)
+
+    # counted up to the first END, plus the END
+    ends = numpy.flatnonzero(commands == END)
+    counted = commands[:ends[0]] if len(ends) else commands
+    point_count = (1 + numpy.count_nonzero(counted == STITCH) +
+                   2 * numpy.count_nonzero((counted == JUMP) | (counted == COLOR_CHANGE) | (counted == STOP)))
+    if trims:
+        point_count += 2 * command_count_max * numpy.count_nonzero(counted == TRIM)
+    write_int_32le(f, int(point_count))
+
+    if len(commands):
+        extends = [x.min().item(), y.min().item(), x.max().item(), y.max().item()]
+    else:
+        extends = pattern.bounds()
+    design_width = int(round(extends[2] - extends[0]))
+    design_height = int(round(extends[3] - extends[1]))
+    write_int_32le(f, JefWriter.get_jef_hoop_size(design_width, design_height))
+    half_width = int(round(design_width / 2))
+    half_height = int(round(design_height / 2))
+
+    # distance from center of hoop
+    write_int_32le(f, half_width)
+    write_int_32le(f, half_height)
+    write_int_32le(f, half_width)
+    write_int_32le(f, half_height)
+
+    # distance from the 110 x 110, 50 x 50, 140 x 200 and custom hoops
+    for hoop_width, hoop_height in ((550, 550), (250, 250), (700, 1000), (700, 1000)):
+        JefWriter.write_hoop_edge_distance(f, hoop_width - half_width, hoop_height - half_height)
+
+    for t in palette:
+        write_int_32le(f, t)
+
+    for i in range(0, color_count):
+        write_int_32le(f, 0x0D)
+
+
+class Writer(object):
+    """One of our writers in place of a pyembroidery writer module.
+
+    pyembroidery reads the settings it normalizes the pattern with from the
+    writer module, so we take those over.
+    """
+
+    def __init__(self, module, write):
+        for name, value in vars(module).items():
+            if name.isupper():
+                setattr(self, name, value)
+
+        self.write = write
+
+
+WRITERS = {
+    'dst': Writer(DstWriter, write_dst),
+    'exp': Writer(ExpWriter, write_exp),
+    'jef': Writer(JefWriter, write_jef),
+}
+
+
+def get_writer(extension):
+    """Return the writer for a file extension, ours if we have one."""
+
+    extension = extension.lower()
+    if extension in WRITERS:
+        return WRITERS[extension]
+
+    for file_type in pyembroidery.supported_formats():
+        if file_type["extension"] == extension and file_type.get("writer"):
+            return file_type["writer"]
+
+    raise IOError("Conversion to file type '{extension}' is not supported".format(extension=extension))
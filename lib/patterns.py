@@ -14,6 +14,9 @@ from .utils import Point
 def is_pattern(node):
     if node.tag not in EMBROIDERABLE_TAGS:
         return False
+    # node.get('style') parses the style, so don't unless it could match
+    if 'inkstitch-pattern-marker' not in node.attrib.get('style', ''):
+        return False
     style = node.get('style') or ''
     return "marker-start:url(#inkstitch-pattern-marker)" in style
 
@@ -64,15 +67,20 @@ def _apply_fill_patterns(patterns, patches):
             patch.stitches = patch_points
 
 
+def get_pattern_nodes(node):
+    """Return the pattern objects that are applied to node."""
+
+    xpath = "./parent::svg:g/*[contains(@style, 'marker-start:url(#inkstitch-pattern-marker)')]"
+    return node.xpath(xpath, namespaces=inkex.NSS)
+
+
 def _get_patterns(node):
     from .elements import EmbroideryElement
     from .elements.stroke import Stroke
 
     fills = []
     strokes = []
-    xpath = "./parent::svg:g/*[contains(@style, 'marker-start:url(#inkstitch-pattern-marker)')]"
-    patterns = node.xpath(xpath, namespaces=inkex.NSS)
-    for pattern in patterns:
+    for pattern in get_pattern_nodes(node):
         if pattern.tag not in EMBROIDERABLE_TAGS:
             continue
 
@@ -8,4 +8,6 @@ from .generate_stitch_plan import generate_stitch_plan
 from .read_file import stitch_plan_from_file
 from .stitch import Stitch
 from .stitch_group import StitchGroup
-from .stitch_plan import StitchPlan, stitch_groups_to_stitch_plan
+from .stitch_group_cache import StitchGroupCache
+from .stitch_plan import (StitchPlan, generate_color_blocks,
+                          stitch_groups_to_stitch_plan)
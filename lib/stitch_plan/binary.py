@@ -0,0 +1,208 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""A compact binary format for handing stitch plans between processes.
+
+Layout (all numbers little-endian):
+
+    header    magic (8 bytes), format version (uint16), compression (uint16),
+              metadata length (uint32), data length (uint64)
+    metadata  UTF-8 JSON, padded with spaces to a multiple of 8 bytes
+    data      for each color block: x (float64), y (float64), tag masks
+              (uint64) and flags (uint8, padded to a multiple of 8 bytes)
+
+The metadata holds the thread table (each thread as its JSON, see
+ThreadColor.__json__()), the thread and stitch count of each color block,
+the names of the stitch tags and the summary that the JSON form of a
+StitchPlan has (bounding box etc.).  The flags are the ones ColorBlock
+stores (see stitch.py).
+
+Without compression, the columns of the color blocks are numpy views of the
+buffer, so reading is nearly free and works on a memory-mapped file.  The
+data can also be compressed with zlib or, if the zstandard module is
+installed, zstd.
+"""
+
+import json
+import struct
+import zlib
+
+import numpy
+
+from ..threads import ThreadColor
+from .color_block import ColorBlock
+from .stitch import tag_mask, tag_names
+
+MAGIC = b"INKSTPLN"
+FORMAT_VERSION = 1
+MIMETYPE = "application/x-inkstitch-stitch-plan"
+
+HEADER = struct.Struct("<8sHHIQ")
+COMPRESSIONS = {None: 0, "zlib": 1, "zstd": 2}
+
+X_DTYPE = Y_DTYPE = numpy.dtype("<f8")
+TAGS_DTYPE = numpy.dtype("<u8")
+FLAGS_DTYPE = numpy.dtype("u1")
+
+
+def padding(length):
+    return -length % 8
+
+
+def compress(data, compression):
+    if compression == "zlib":
+        return zlib.compress(data)
+    elif compression == "zstd":
+        return _zstandard().ZstdCompressor().compress(data)
+    else:
+        return data
+
+
+def decompress(data, compression):
+    if compression == "zlib":
+        return zlib.decompress(data)
+    elif compression == "zstd":
+        return _zstandard().ZstdDecompressor().decompress(data)
+    else:
+        return data
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("zstd compression needs the zstandard module")
+
+    return zstandard
+
+
+class ThreadTable(object):
+    def __init__(self):
+        self.threads = []
+        self.indices = {}
+
+    def index(self, color):
+        if color is None:
+            return None
+
+        if not isinstance(color, ThreadColor):
+            color = ThreadColor(color)
+
+        key = (color.rgb, color.name, color.number, color.manufacturer)
+        if key not in self.indices:
+            self.indices[key] = len(self.threads)
+            self.threads.append(color.__json__())
+
+        return self.indices[key]
+
+
+def stitch_plan_to_bytes(stitch_plan, compression=None):
+    """Encode a StitchPlan in the binary format.
+
+    compression can be None, "zlib" or "zstd".
+    """
+
+    if compression not in COMPRESSIONS:
+        raise ValueError("unknown compression: %r" % compression)
+
+    threads = ThreadTable()
+    blocks = []
+    data = []
+
+    for color_block in stitch_plan:
+        blocks.append(dict(thread=threads.index(color_block.color),
+                           stitches=len(color_block),
+                           stitch_threads={i: threads.index(color) for i, color in color_block._colors.items()}))
+
+        flags = color_block.flags.astype(FLAGS_DTYPE).tobytes()
+        data.extend((color_block.x.astype(X_DTYPE).tobytes(),
+                     color_block.y.astype(Y_DTYPE).tobytes(),
+                     color_block.tag_masks.astype(TAGS_DTYPE).tobytes(),
+                     flags, bytes(padding(len(flags)))))
+
+    summary = {}
+    if stitch_plan.color_blocks:
+        summary = dict(num_stops=stitch_plan.num_stops,
+                       num_trims=stitch_plan.num_trims,
+                       num_stitches=stitch_plan.num_stitches,
+                       bounding_box=stitch_plan.bounding_box,
+                       estimated_thread=stitch_plan.estimated_thread)
+
+    metadata = json.dumps(dict(threads=threads.threads, color_blocks=blocks, tags=tag_names(), summary=summary)).encode('utf-8')
+    metadata += b" " * padding(len(metadata))
+    data = compress(b"".join(data), compression)
+
+    return HEADER.pack(MAGIC, FORMAT_VERSION, COMPRESSIONS[compression], len(metadata), len(data)) + metadata + data
+
+
+def read_header(buffer):
+    """Return the metadata and the (decompressed) data of an encoded stitch plan."""
+
+    buffer = memoryview(buffer)
+    if len(buffer) < HEADER.size:
+        raise ValueError("not an Ink/Stitch stitch plan: too short")
+
+    magic, version, compression, metadata_length, data_length = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError("not an Ink/Stitch stitch plan")
+    if version > FORMAT_VERSION:
+        raise ValueError("stitch plan format version %d is newer than this version of Ink/Stitch supports (%d)" % (version, FORMAT_VERSION))
+
+    compressions = {code: name for name, code in COMPRESSIONS.items()}
+    if compression not in compressions:
+        raise ValueError("unknown stitch plan compression: %d" % compression)
+
+    data_start = HEADER.size + metadata_length
+    if len(buffer) < data_start + data_length:
+        raise ValueError("stitch plan is truncated")
+
+    metadata = json.loads(bytes(buffer[HEADER.size:data_start]).decode('utf-8'))
+    data = decompress(buffer[data_start:data_start + data_length], compressions[compression])
+
+    return metadata, data
+
+
+def tag_mapping(tag_names):
+    """Return a function that converts tag masks of the encoding process to ours."""
+
+    bits = [tag_mask([name]) for name in tag_names]
+    if bits == [1 << i for i in range(len(bits))]:
+        # same tags in the same order, the usual case
+        return lambda masks: masks
+
+    def convert(masks):
+        converted = numpy.zeros(len(masks), dtype=numpy.uint64)
+        for i, bit in enumerate(bits):
+            converted[(masks & numpy.uint64(1 << i)) != 0] |= numpy.uint64(bit)
+        return converted
+
+    return convert
+
+
+def read_color_blocks(buffer):
+    """Decode the color blocks of an encoded stitch plan."""
+
+    metadata, data = read_header(buffer)
+    threads = [ThreadColor(tuple(thread['rgb']), thread['name'], thread['number'], thread['manufacturer']) for thread in metadata['threads']]
+    convert_tags = tag_mapping(metadata['tags'])
+
+    def thread(index):
+        return None if index is None else threads[index]
+
+    color_blocks = []
+    offset = 0
+    for block in metadata['color_blocks']:
+        count = block['stitches']
+        columns = []
+        for dtype in (X_DTYPE, Y_DTYPE, TAGS_DTYPE, FLAGS_DTYPE):
+            columns.append(numpy.frombuffer(data, dtype=dtype, count=count, offset=offset))
+            offset += count * dtype.itemsize
+        offset += padding(count)
+
+        x, y, tags, flags = columns
+        colors = {int(i): thread(index) for i, index in block['stitch_threads'].items()}
+        color_blocks.append(ColorBlock.from_columns(thread(block['thread']), x, y, flags, convert_tags(tags), colors))
+
+    return color_blocks
@@ -3,33 +3,238 @@
 # Copyright (c) 2010 Authors
 # Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
 
-from .stitch import Stitch
+import numpy
+
+from .stitch import JUMP, STOP, TRIM, COLOR_CHANGE, ReadOnlyStitch, encode_flags, tag_mask
 from ..threads import ThreadColor
 from ..utils.geometry import Point
 from ..svg import PIXELS_PER_MM
 
 
 class ColorBlock(object):
-    """Holds a set of stitches, all with the same thread color."""
+    """Holds a set of stitches, all with the same thread color.
+
+    Stitches are stored in columns: numpy arrays of x and y coordinates, a
+    flags array (see stitch.py) and a bitmask of interned tags.  Stitch
+    objects are only created when the stitches are accessed individually.
+    They're read-only copies (see ReadOnlyStitch): changing one raises
+    instead of being lost.
+    """
 
     def __init__(self, color=None, stitches=None):
         self.color = color
-        self.stitches = stitches or []
+        self._clear()
+
+        if stitches:
+            self.replace_stitches(stitches)
+
+    def _clear(self, capacity=16):
+        self._length = 0
+        self._x = numpy.empty(capacity)
+        self._y = numpy.empty(capacity)
+        self._flags = numpy.empty(capacity, dtype=numpy.uint8)
+        self._tags = numpy.empty(capacity, dtype=numpy.uint64)
+
+        # Stitch colors are almost never set, so they're stored sparsely by
+        # stitch index.
+        self._colors = {}
+        self._changed()
+
+    def _changed(self):
+        # Every method that changes the stitches calls this, so that the
+        # statistics are computed again.
+        self._statistics = None
+
+    @classmethod
+    def from_columns(cls, color, x, y, flags, tag_masks, colors=None):
+        """Create a ColorBlock from column arrays like the ones it stores.
+
+        The arrays aren't copied, so they can be read-only views of a buffer
+        (see binary.py).  They're copied when stitches are added.
+        """
+
+        color_block = cls(color)
+        color_block._x = x
+        color_block._y = y
+        color_block._flags = flags
+        color_block._tags = tag_masks
+        color_block._colors = dict(colors or {})
+        color_block._length = len(x)
+        color_block._changed()
+
+        return color_block
+
+    def _reserve(self, count):
+        needed = self._length + count
+        capacity = len(self._x)
+        if needed <= capacity and self._x.flags.writeable:
+            return
+
+        capacity = max(needed, 2 * capacity)
+        for column in ('_x', '_y', '_flags', '_tags'):
+            old = getattr(self, column)
+            new = numpy.empty(capacity, dtype=old.dtype)
+            new[:self._length] = old[:self._length]
+            setattr(self, column, new)
+
+    def _append(self, x, y, color=None, jump=False, stop=False, trim=False, color_change=False,
+                tie_modus=0, force_lock_stitches=False, no_ties=False, tags=None):
+        # same signature as Stitch()
+        self._reserve(1)
+
+        i = self._length
+        self._x[i] = x
+        self._y[i] = y
+        self._flags[i] = encode_flags(jump, stop, trim, color_change, tie_modus, force_lock_stitches, no_ties)
+        self._tags[i] = tag_mask(tags)
+        if color is not None:
+            self._colors[i] = color
+
+        self._length += 1
+        self._changed()
+
+    def _extend(self, coordinates, flags, tags, colors=None):
+        count = len(coordinates)
+        if not count:
+            return
+
+        self._reserve(count)
+
+        start = self._length
+        end = start + count
+        coordinates = numpy.asarray(coordinates, dtype=float).reshape(-1, 2)
+        self._x[start:end] = coordinates[:, 0]
+        self._y[start:end] = coordinates[:, 1]
+        self._flags[start:end] = flags
+        self._tags[start:end] = tags
+
+        for i, color in (colors or {}).items():
+            self._colors[start + i] = color
+
+        self._length = end
+        self._changed()
+
+    def _keep(self, keep):
+        """Remove every stitch for which the boolean array keep is False."""
+
+        indices = numpy.flatnonzero(keep)
+
+        if self._colors:
+            new_index = {old: new for new, old in enumerate(indices.tolist())}
+            self._colors = {new_index[i]: color for i, color in self._colors.items() if i in new_index}
+
+        for column in ('_x', '_y', '_flags', '_tags'):
+            setattr(self, column, getattr(self, column)[indices])
+
+        self._length = len(indices)
+        self._changed()
+
+    def _insert(self, positions, x, y, flags, tags, colors=None):
+        """Insert stitches before the given stitch indices, all at once.
+
+        positions must be sorted.  Stitches inserted at the same position
+        keep their order.  colors maps indices into the inserted stitches to
+        their colors.
+        """
+
+        count = len(positions)
+        if not count:
+            return
+
+        length = self._length + count
+        inserted = numpy.asarray(positions) + numpy.arange(count)
+        kept = numpy.ones(length, dtype=bool)
+        kept[inserted] = False
+        kept = numpy.flatnonzero(kept)
+
+        for column, values in (('_x', x), ('_y', y), ('_flags', flags), ('_tags', tags)):
+            old = getattr(self, column)
+            new = numpy.empty(length, dtype=old.dtype)
+            new[kept] = old[:self._length]
+            new[inserted] = values
+            setattr(self, column, new)
+
+        colors = [(int(kept[i]), color) for i, color in self._colors.items()] + [(int(inserted[i]), color) for i, color in (colors or {}).items()]
+        self._colors = dict(sorted(colors, key=lambda item: item[0]))
+
+        self._length = length
+        self._changed()
+
+    def _column(self, column):
+        view = getattr(self, column)[:self._length]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def x(self):
+        """Read-only numpy array of the x coordinates of the stitches."""
+        return self._column('_x')
+
+    @property
+    def y(self):
+        """Read-only numpy array of the y coordinates of the stitches."""
+        return self._column('_y')
+
+    @property
+    def coordinates(self):
+        """(N, 2) numpy array of the stitch coordinates."""
+        return numpy.column_stack((self.x, self.y))
+
+    @property
+    def flags(self):
+        """Read-only numpy array of the flags of the stitches (see stitch.py)."""
+        return self._column('_flags')
+
+    @property
+    def tag_masks(self):
+        """Read-only numpy array of the interned tags of the stitches."""
+        return self._column('_tags')
+
+    def _stitch(self, i):
+        return ReadOnlyStitch.from_flags(float(self._x[i]), float(self._y[i]), int(self._flags[i]), int(self._tags[i]), self._colors.get(i))
+
+    @property
+    def stitches(self):
+        """A list of read-only copies of the stitches in this block.
+
+        The list is built on each access, which takes O(n): use the column
+        properties (x, y, flags etc.) for bulk work.  Changing the list or
+        its stitches doesn't change the ColorBlock; use replace_stitches()
+        for that.
+        """
+
+        colors = self._colors
+        return [ReadOnlyStitch.from_flags(x, y, flags, tags, colors.get(i) if colors else None)
+                for i, (x, y, flags, tags) in enumerate(zip(self.x.tolist(), self.y.tolist(), self.flags.tolist(), self.tag_masks.tolist()))]
+
+    @stitches.setter
+    def stitches(self, stitches):
+        self.replace_stitches(stitches)
 
     def __iter__(self):
         return iter(self.stitches)
 
     def __len__(self):
-        return len(self.stitches)
+        return self._length
 
     def __repr__(self):
         return "ColorBlock(%s, %s)" % (self.color, self.stitches)
 
     def __getitem__(self, item):
-        return self.stitches[item]
+        if isinstance(item, slice):
+            return [self._stitch(i) for i in range(*item.indices(self._length))]
+
+        if item < 0:
+            item += self._length
+        if not 0 <= item < self._length:
+            raise IndexError("stitch index out of range")
+
+        return self._stitch(item)
 
     def __delitem__(self, item):
-        del self.stitches[item]
+        keep = numpy.ones(self._length, dtype=bool)
+        keep[item] = False
+        self._keep(keep)
 
     def __json__(self):
         return dict(color=self.color, stitches=self.stitches)
@@ -52,35 +257,68 @@ class ColorBlock(object):
 
     @property
     def last_stitch(self):
-        if self.stitches:
-            return self.stitches[-1]
+        if self._length:
+            return self[-1]
         else:
             return None
 
     @property
     def num_stitches(self):
         """Number of stitches in this color block."""
-        return len(self.stitches)
+        return self._length
+
+    @property
+    def statistics(self):
+        """Statistics about the stitches of this block, as a dict.
+
+        num_stitches, num_jumps, num_trims, num_stops, num_color_changes,
+        estimated_thread (the length of all stitches, in pixels) and
+        bounding_box (None for an empty block).  They're computed together
+        and kept until the stitches change.
+        """
+
+        if self._statistics is None:
+            self._statistics = self._compute_statistics()
+
+        return dict(self._statistics)
+
+    def _compute_statistics(self):
+        x = self.x
+        y = self.y
+
+        # one count per flag bit, all at once
+        flag_counts = numpy.unpackbits(self.flags[:, None], axis=1, bitorder='little').sum(axis=0).tolist()
+
+        def count(flag):
+            return int(flag_counts[flag.bit_length() - 1])
+
+        if self._length:
+            bounding_box = (float(x.min()), float(y.min()), float(x.max()), float(y.max()))
+        else:
+            bounding_box = None
+
+        return dict(num_stitches=self._length,
+                    num_jumps=count(JUMP),
+                    num_trims=count(TRIM),
+                    num_stops=count(STOP),
+                    num_color_changes=count(COLOR_CHANGE),
+                    estimated_thread=float(numpy.hypot(numpy.diff(x), numpy.diff(y)).sum()),
+                    bounding_box=bounding_box)
 
     @property
     def estimated_thread(self):
-        previous_stitch = self.stitches[0]
-        length = 0
-        for stitch in self.stitches[1:]:
-            length += (stitch - previous_stitch).length()
-            previous_stitch = stitch
-        return length
+        return self.statistics['estimated_thread']
 
     @property
     def num_trims(self):
         """Number of trims in this color block."""
 
-        return sum(1 for stitch in self if stitch.trim)
+        return self.statistics['num_trims']
 
     @property
     def stop_after(self):
-        if self.last_stitch is not None:
-            return self.last_stitch.stop
+        if self._length:
+            return bool(self._flags[self._length - 1] & STOP)
         else:
             return False
 
@@ -88,10 +326,10 @@ class ColorBlock(object):
     def trim_after(self):
         # If there's a STOP, it will be at the end.  We still want to return
         # True.
-        for stitch in reversed(self.stitches):
-            if stitch.stop or stitch.jump:
+        for flags in reversed(self.flags.tolist()):
+            if flags & (STOP | JUMP):
                 continue
-            elif stitch.trim:
+            elif flags & TRIM:
                 return True
             else:
                 break
@@ -99,54 +337,114 @@ class ColorBlock(object):
         return False
 
     def filter_duplicate_stitches(self):
-        if not self.stitches:
-            return
+        """Remove stitches that are within 0.1mm of the last stitch kept."""
 
-        stitches = [self.stitches[0]]
+        if not self._length:
+            return
 
-        for stitch in self.stitches[1:]:
-            if stitches[-1].jump or stitch.stop or stitch.trim or stitch.color_change:
-                # Don't consider jumps, stops, color changes, or trims as candidates for filtering
-                pass
-            else:
-                length = (stitch - stitches[-1]).length()
-                if length <= 0.1 * PIXELS_PER_MM:
-                    # duplicate stitch, skip this one
-                    continue
+        keep = duplicate_stitch_filter(self.x, self.y, self.flags, 0.1 * PIXELS_PER_MM)
+        if not keep.all():
+            self._keep(keep)
 
-            stitches.append(stitch)
+    def add_stitch(self, *args, **kwargs):
+        """Add a stitch.
 
-        self.stitches = stitches
+        Accepts the same arguments as Stitch(), except that instead of x and
+        y, the first argument can also be a Stitch or Point.  Only the
+        position is taken from it.
+        """
 
-    def add_stitch(self, *args, **kwargs):
         if not args:
             # They're adding a command, e.g. `color_block.add_stitch(stop=True)``.
             # Use the position from the last stitch.
-            if self.last_stitch:
-                args = (self.last_stitch.x, self.last_stitch.y)
+            if self._length:
+                args = (self._x[self._length - 1], self._y[self._length - 1])
             else:
                 raise ValueError("internal error: can't add a command to an empty stitch block")
-            self.stitches.append(Stitch(*args, **kwargs))
-        if isinstance(args[0], Stitch):
-            self.stitches.append(Stitch(*args, **kwargs))
-        elif isinstance(args[0], Point):
-            self.stitches.append(Stitch(args[0].x, args[0].y, *args[1:], **kwargs))
+
+        if isinstance(args[0], Point):
+            self._append(args[0].x, args[0].y, *args[1:], **kwargs)
+        else:
+            self._append(*args, **kwargs)
 
     def add_stitches(self, stitches, *args, **kwargs):
-        for stitch in stitches:
-            if isinstance(stitch, (Stitch, Point)):
-                self.add_stitch(stitch, *args, **kwargs)
-            else:
-                self.add_stitch(*stitch, *args, **kwargs)
+        if args or 'color' in kwargs:
+            for stitch in stitches:
+                if isinstance(stitch, Point):
+                    self.add_stitch(stitch, *args, **kwargs)
+                else:
+                    self.add_stitch(*stitch, *args, **kwargs)
+            return
+
+        # Every stitch gets the same flags and tags, so we can add them all at once.
+        tags = kwargs.pop('tags', None)
+        coordinates = [(stitch.x, stitch.y) if isinstance(stitch, Point) else stitch for stitch in stitches]
+        self._extend(coordinates, encode_flags(**kwargs), tag_mask(tags))
 
     def replace_stitches(self, stitches):
-        self.stitches = stitches
+        """Replace all stitches with the given Stitch objects, keeping their attributes."""
+
+        self._clear(max(len(stitches), 16))
+        self._extend([(stitch.x, stitch.y) for stitch in stitches],
+                     [stitch.flags for stitch in stitches],
+                     [tag_mask(stitch.tags) for stitch in stitches],
+                     {i: stitch.color for i, stitch in enumerate(stitches) if stitch.color is not None})
 
     @property
     def bounding_box(self):
-        minx = min(stitch.x for stitch in self)
-        miny = min(stitch.y for stitch in self)
-        maxx = max(stitch.x for stitch in self)
-        maxy = max(stitch.y for stitch in self)
+        bounding_box = self.statistics['bounding_box']
+        if bounding_box is None:
+            raise ValueError("an empty color block has no bounding box")
+
+        return bounding_box
+
+
+def duplicate_stitch_filter(x, y, flags, min_length):
+    """Return a boolean array of the stitches to keep.
+
+    A stitch is a duplicate if it's at most min_length away from the last
+    stitch that was kept.  Jumps, stops, color changes, and trims aren't
+    considered as candidates for filtering, and neither is the stitch
+    after a jump.
+
+    As long as no stitch has been removed, the last stitch kept is the
+    previous one, so the candidates are found with numpy.  Only from a
+    candidate on, until a stitch is kept again, the stitches are compared
+    one by one.
+    """
+
+    count = len(x)
+    keep = numpy.ones(count, dtype=bool)
+    exempt = ((flags[:-1] & JUMP) != 0) | ((flags[1:] & (STOP | TRIM | COLOR_CHANGE)) != 0)
+
+    # A little slack, because the exact comparison below rounds differently.
+    distance = numpy.hypot(numpy.diff(x), numpy.diff(y))
+    candidates = numpy.flatnonzero(~exempt & (distance <= min_length * (1 + 1e-9))) + 1
+    if not len(candidates):
+        return keep
+
+    x = x.tolist()
+    y = y.tolist()
+    flags = flags.tolist()
+
+    def is_duplicate(i, last):
+        if flags[last] & JUMP or flags[i] & (STOP | TRIM | COLOR_CHANGE):
+            return False
+
+        return ((x[i] - x[last]) ** 2 + (y[i] - y[last]) ** 2) ** 0.5 <= min_length
+
+    next_candidate = 0
+    for candidate in candidates.tolist():
+        if candidate < next_candidate:
+            # already compared
+            continue
+
+        last = candidate - 1
+        i = candidate
+        while i < count and is_duplicate(i, last):
+            keep[i] = False
+            i += 1
+
+        next_candidate = i + 1
 
-        return minx, miny, maxx, maxy
+    return keep
@@ -4,20 +4,69 @@
 # Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
 
 from ..utils.geometry import Point
-from copy import deepcopy
+
+# Bits of the flags value that ColorBlock stores for each stitch.  tie_modus
+# (0-3) takes up the top two bits.
+JUMP = 1 << 0
+TRIM = 1 << 1
+STOP = 1 << 2
+COLOR_CHANGE = 1 << 3
+FORCE_LOCK_STITCHES = 1 << 4
+NO_TIES = 1 << 5
+TIE_MODUS_SHIFT = 6
+
+# Tags are interned: each distinct tag gets a bit in a 64-bit mask.
+MAX_TAGS = 64
+_tag_bits = {}
+_tag_names = []
+
+
+def encode_flags(jump=False, stop=False, trim=False, color_change=False, tie_modus=0, force_lock_stitches=False, no_ties=False):
+    return ((JUMP if jump else 0) |
+            (TRIM if trim else 0) |
+            (STOP if stop else 0) |
+            (COLOR_CHANGE if color_change else 0) |
+            (FORCE_LOCK_STITCHES if force_lock_stitches else 0) |
+            (NO_TIES if no_ties else 0) |
+            (int(tie_modus) << TIE_MODUS_SHIFT))
+
+
+def tag_mask(tags):
+    """Return the bitmask representing a collection of tags."""
+
+    mask = 0
+    for tag in tags or ():
+        bit = _tag_bits.get(tag)
+        if bit is None:
+            if len(_tag_names) >= MAX_TAGS:
+                raise ValueError("internal error: more than %d distinct stitch tags" % MAX_TAGS)
+            bit = _tag_bits[tag] = 1 << len(_tag_names)
+            _tag_names.append(tag)
+        mask |= bit
+
+    return mask
+
+
+def tag_names():
+    """The interned tags, in the order of their bits."""
+    return list(_tag_names)
+
+
+def tags_from_mask(mask):
+    return {tag for i, tag in enumerate(_tag_names) if mask & (1 << i)}
 
 
 class Stitch(Point):
     """A stitch is a Point with extra information telling how to sew it."""
 
+    __slots__ = ('color', 'jump', 'trim', 'stop', 'color_change', 'force_lock_stitches', 'tie_modus', 'no_ties', 'tags')
+
     def __init__(self, x, y=None, color=None, jump=False, stop=False, trim=False, color_change=False,
                  tie_modus=0, force_lock_stitches=False, no_ties=False, tags=None):
-        if isinstance(x, Stitch):
-            # Allow creating a Stitch from another Stitch.  Attributes passed as
-            # arguments will override any existing attributes.
-            vars(self).update(deepcopy(vars(x)))
-        elif isinstance(x, Point):
-            # Allow creating a Stitch from a Point
+        if isinstance(x, Point):
+            # Allow creating a Stitch from another Stitch or from a Point.
+            # Only the position is taken over, everything else comes from
+            # the arguments.
             point = x
             self.x = point.x
             self.y = point.y
@@ -36,6 +85,27 @@ class Stitch(Point):
 
         self.add_tags(tags or [])
 
+    @classmethod
+    def from_flags(cls, x, y, flags, tags=0, color=None):
+        """Create a Stitch from the compact representation used in ColorBlock."""
+
+        stitch = cls(x, y, color,
+                     jump=bool(flags & JUMP),
+                     stop=bool(flags & STOP),
+                     trim=bool(flags & TRIM),
+                     color_change=bool(flags & COLOR_CHANGE),
+                     tie_modus=flags >> TIE_MODUS_SHIFT,
+                     force_lock_stitches=bool(flags & FORCE_LOCK_STITCHES),
+                     no_ties=bool(flags & NO_TIES))
+        if tags:
+            stitch.tags = tags_from_mask(tags)
+
+        return stitch
+
+    @property
+    def flags(self):
+        return encode_flags(self.jump, self.stop, self.trim, self.color_change, self.tie_modus, self.force_lock_stitches, self.no_ties)
+
     def __repr__(self):
         return "Stitch(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)" % (self.x,
                                                                    self.y,
@@ -75,6 +145,43 @@ class Stitch(Point):
                       self.tie_modus, self.force_lock_stitches, self.no_ties, self.tags)
 
     def __json__(self):
-        attributes = dict(vars(self))
-        attributes['tags'] = list(attributes['tags'])
-        return attributes
+        return dict(x=self.x,
+                    y=self.y,
+                    color=self.color,
+                    jump=self.jump,
+                    trim=self.trim,
+                    stop=self.stop,
+                    color_change=self.color_change,
+                    force_lock_stitches=self.force_lock_stitches,
+                    tie_modus=self.tie_modus,
+                    no_ties=self.no_ties,
+                    tags=list(self.tags))
+
+
+class ReadOnlyStitch(Stitch):
+    """A copy of a stitch in a ColorBlock that raises if it's changed.
+
+    Changing the copy wouldn't change the ColorBlock, so it's an error
+    instead of a silent no-op.  copy() returns a Stitch that can be changed.
+    """
+
+    __slots__ = ('_read_only',)
+
+    @classmethod
+    def from_flags(cls, x, y, flags, tags=0, color=None):
+        stitch = super().from_flags(x, y, flags, tags, color)
+        stitch.tags = frozenset(stitch.tags)
+        stitch._read_only = True
+
+        return stitch
+
+    def __setattr__(self, name, value):
+        if getattr(self, '_read_only', False):
+            raise AttributeError("the stitches of a ColorBlock are read-only copies; "
+                                 "change the ColorBlock instead (e.g. replace_stitches())")
+
+        Stitch.__setattr__(self, name, value)
+
+    def __reduce__(self):
+        # for pickle and copy, which would set the attributes one by one
+        return (ReadOnlyStitch.from_flags, (self.x, self.y, self.flags, tag_mask(self.tags), self.color))
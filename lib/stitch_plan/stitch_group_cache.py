@@ -0,0 +1,309 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+import os
+import struct
+import time
+from hashlib import sha256
+from tempfile import NamedTemporaryFile
+
+import appdirs
+import numpy
+
+from ..debug import debug
+from ..utils import cache
+from ..utils.version import get_inkstitch_version
+from .stitch import Stitch
+from .stitch_group import StitchGroup
+
+# Bump this whenever the file format changes.
+FORMAT_VERSION = 1
+MAGIC = b'ISGC'
+
+_header = struct.Struct('<4sHI')
+_group_header = struct.Struct('<BBIHHI')
+_string_length = struct.Struct('<H')
+_stitch_color = struct.Struct('<I')
+
+# bits of the flags byte in _group_header
+_TRIM_AFTER = 1 << 0
+_STOP_AFTER = 1 << 1
+_FORCE_LOCK_STITCHES = 1 << 2
+_STITCH_AS_IS = 1 << 3
+
+
+class StitchGroupCacheError(ValueError):
+    pass
+
+
+def _pack_string(string):
+    if not isinstance(string, str):
+        raise StitchGroupCacheError("can only store strings, not %r" % (string,))
+
+    data = string.encode('utf-8')
+    return _string_length.pack(len(data)) + data
+
+
+def _unpack_string(data, offset):
+    length, = _string_length.unpack_from(data, offset)
+    offset += _string_length.size
+    return data[offset:offset + length].decode('utf-8'), offset + length
+
+
+def _pack_stitch_group(group):
+    stitches = group.stitches
+
+    tag_names = sorted(set().union(*(stitch.tags for stitch in stitches)))
+    if len(tag_names) > 64:
+        raise StitchGroupCacheError("too many distinct tags")
+    tag_bits = {tag: 1 << i for i, tag in enumerate(tag_names)}
+    stitch_colors = [(i, stitch.color) for i, stitch in enumerate(stitches) if stitch.color is not None]
+
+    flags = ((_TRIM_AFTER if group.trim_after else 0) |
+             (_STOP_AFTER if group.stop_after else 0) |
+             (_FORCE_LOCK_STITCHES if group.force_lock_stitches else 0) |
+             (_STITCH_AS_IS if group.stitch_as_is else 0))
+
+    chunks = [_group_header.pack(flags, int(group.tie_modus), len(stitches), len(tag_names), len(stitch_colors), group.color is not None)]
+    if group.color is not None:
+        chunks.append(_pack_string(group.color))
+    chunks.extend(_pack_string(tag) for tag in tag_names)
+    for i, color in stitch_colors:
+        chunks.append(_stitch_color.pack(i) + _pack_string(color))
+
+    chunks.append(numpy.array([stitch.x for stitch in stitches], dtype='<f8').tobytes())
+    chunks.append(numpy.array([stitch.y for stitch in stitches], dtype='<f8').tobytes())
+    chunks.append(numpy.array([stitch.flags for stitch in stitches], dtype=numpy.uint8).tobytes())
+    if tag_names:
+        masks = [sum(tag_bits[tag] for tag in stitch.tags) for stitch in stitches]
+        chunks.append(numpy.array(masks, dtype='<u8').tobytes())
+
+    return b''.join(chunks)
+
+
+def _unpack_stitch_group(data, offset):
+    flags, tie_modus, num_stitches, num_tags, num_colors, has_color = _group_header.unpack_from(data, offset)
+    offset += _group_header.size
+
+    color = None
+    if has_color:
+        color, offset = _unpack_string(data, offset)
+
+    tag_names = []
+    for i in range(num_tags):
+        tag, offset = _unpack_string(data, offset)
+        tag_names.append(tag)
+
+    stitch_colors = {}
+    for i in range(num_colors):
+        index, = _stitch_color.unpack_from(data, offset)
+        stitch_colors[index], offset = _unpack_string(data, offset + _stitch_color.size)
+
+    def column(dtype):
+        nonlocal offset
+        values = numpy.frombuffer(data, dtype=dtype, count=num_stitches, offset=offset)
+        offset += values.nbytes
+        return values.tolist()
+
+    xs = column('<f8')
+    ys = column('<f8')
+    stitch_flags = column(numpy.uint8)
+    masks = column('<u8') if tag_names else [0] * num_stitches
+
+    stitches = []
+    for i, (x, y, stitch_flag, mask) in enumerate(zip(xs, ys, stitch_flags, masks)):
+        stitch = Stitch.from_flags(x, y, stitch_flag, 0, stitch_colors.get(i))
+        if mask:
+            stitch.tags = {tag for bit, tag in enumerate(tag_names) if mask & (1 << bit)}
+        stitches.append(stitch)
+
+    group = StitchGroup(color=color,
+                        trim_after=bool(flags & _TRIM_AFTER),
+                        stop_after=bool(flags & _STOP_AFTER),
+                        tie_modus=tie_modus,
+                        force_lock_stitches=bool(flags & _FORCE_LOCK_STITCHES),
+                        stitch_as_is=bool(flags & _STITCH_AS_IS))
+    group.stitches = stitches
+
+    return group, offset
+
+
+def stitch_groups_to_bytes(groups):
+    """Serialize a list of StitchGroups into a compact binary string.
+
+    Raises StitchGroupCacheError if a group holds something that can't be
+    stored, e.g. a color or tag that isn't a string.
+    """
+
+    return b''.join([_header.pack(MAGIC, FORMAT_VERSION, len(groups))] + [_pack_stitch_group(group) for group in groups])
+
+
+def stitch_groups_from_bytes(data):
+    """Inverse of stitch_groups_to_bytes()."""
+
+    try:
+        magic, version, num_groups = _header.unpack_from(data, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise StitchGroupCacheError("not a stitch group cache file")
+
+        offset = _header.size
+        groups = []
+        for i in range(num_groups):
+            group, offset = _unpack_stitch_group(data, offset)
+            groups.append(group)
+    except (struct.error, UnicodeDecodeError, ValueError) as exc:
+        raise StitchGroupCacheError(str(exc))
+
+    if offset != len(data):
+        raise StitchGroupCacheError("trailing data")
+
+    return groups
+
+
+@cache
+def code_fingerprint():
+    """Identify the version of the code that generated cached stitches.
+
+    In a release, the version number is enough.  In a git clone, the code
+    changes all the time, so we include the modification times of all
+    source files.
+    """
+
+    fingerprint = sha256()
+    fingerprint.update(("%s %s" % (FORMAT_VERSION, get_inkstitch_version())).encode('utf-8'))
+
+    lib_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    for dir_path, dir_names, file_names in sorted(os.walk(lib_dir)):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            if file_name.endswith('.py'):
+                stat = os.stat(os.path.join(dir_path, file_name))
+                fingerprint.update(("%s %s %s" % (os.path.join(dir_path, file_name), stat.st_mtime_ns, stat.st_size)).encode('utf-8'))
+
+    return fingerprint.digest()
+
+
+def default_cache_dir():
+    return os.path.join(appdirs.user_cache_dir('inkstitch'), 'stitch_groups')
+
+
+class StitchGroupCache(object):
+    """A content-addressed on-disk cache of the results of EmbroideryElement.embroider().
+
+    Entries are keyed by EmbroideryElement.stitch_group_cache_key(), so
+    an element is only embroidered again if something it depends on has
+    changed.  Each entry is a file.  Reading an entry marks it as recently
+    used by touching the file, and evict() removes the least recently used
+    entries once the cache grows beyond max_size bytes.
+
+    The cache is only a speedup: if anything goes wrong reading or writing
+    it, we simply embroider the element.
+    """
+
+    EXTENSION = '.isg'
+    TEMP_EXTENSION = '.tmp'
+
+    # A temporary file this old was left behind by a process that crashed
+    # or couldn't finish writing it.
+    STALE_TEMP_FILE_AGE = 60 * 60
+
+    def __init__(self, max_size, cache_dir=None):
+        self.max_size = max_size
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.hits = 0
+        self.misses = 0
+
+    def embroider(self, element, last_patch):
+        key = element.stitch_group_cache_key(last_patch)
+        if key is None:
+            return element.embroider(last_patch)
+
+        path = self._path(key)
+        patches = self.get(path)
+
+        if patches is None:
+            self.misses += 1
+            debug.count("stitch group cache misses")
+            patches = element.embroider(last_patch)
+            self.set(path, patches)
+        else:
+            self.hits += 1
+            debug.count("stitch group cache hits")
+
+        return patches
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, sha256(code_fingerprint() + key).hexdigest() + self.EXTENSION)
+
+    def get(self, path):
+        try:
+            with open(path, 'rb') as cache_file:
+                patches = stitch_groups_from_bytes(cache_file.read())
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, StitchGroupCacheError):
+            self._remove(path)
+            return None
+
+        return patches
+
+    def set(self, path, patches):
+        try:
+            data = stitch_groups_to_bytes(patches)
+        except StitchGroupCacheError:
+            return
+
+        cache_file = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+            # Write to a temporary file and move it into place, so that
+            # nobody ever reads a half-written entry.
+            with NamedTemporaryFile(dir=self.cache_dir, suffix=self.TEMP_EXTENSION, delete=False) as cache_file:
+                cache_file.write(data)
+            os.replace(cache_file.name, path)
+        except OSError:
+            # e.g. the disk is full: don't make it fuller
+            if cache_file is not None:
+                self._remove(cache_file.name)
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_size.
+
+        Also removes stale temporary files.
+        """
+
+        entries = []
+        stale_temp_files = []
+        stale = time.time() - self.STALE_TEMP_FILE_AGE
+        try:
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(self.EXTENSION):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                elif entry.name.endswith(self.TEMP_EXTENSION) and entry.stat().st_mtime < stale:
+                    stale_temp_files.append(entry.path)
+        except OSError:
+            # Another process may be evicting at the same time.
+            return
+
+        for path in stale_temp_files:
+            self._remove(path)
+
+        total_size = sum(size for mtime, size, path in entries)
+
+        for mtime, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+
+            self._remove(path)
+            total_size -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
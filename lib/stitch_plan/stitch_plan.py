@@ -7,14 +7,16 @@ from sys import exit
 
 from inkex import errormsg
 
+from ..debug import debug
 from ..i18n import _
 from ..svg import PIXELS_PER_MM
+from .binary import read_color_blocks, stitch_plan_to_bytes
 from .color_block import ColorBlock
 from .ties import add_ties
 
 
-def stitch_groups_to_stitch_plan(stitch_groups, collapse_len=None, disable_ties=False):  # noqa: C901
-
+@debug.time
+def stitch_groups_to_stitch_plan(stitch_groups, collapse_len=None, disable_ties=False):
     """Convert a collection of StitchGroups to a StitchPlan.
 
     * applies instructions embedded in the StitchGroup such as trim_after and stop_after
@@ -27,13 +29,30 @@ def stitch_groups_to_stitch_plan(stitch_groups, collapse_len=None, disable_ties=
                    "Extensions > Ink/Stitch > Troubleshoot > Troubleshoot objects in case you have expected a stitchout."))
         exit(1)
 
+    stitch_plan = StitchPlan()
+    stitch_plan.color_blocks = list(generate_color_blocks(stitch_groups, collapse_len, disable_ties))
+
+    return stitch_plan
+
+
+def generate_color_blocks(stitch_groups, collapse_len=None, disable_ties=False):  # noqa: C901
+    """Like stitch_groups_to_stitch_plan(), but yield each ColorBlock as soon as it's finished.
+
+    stitch_groups can be any iterable, e.g. a generator that embroiders one
+    element at a time.  A color block is finished when the next color
+    starts or after a stop.  Each block already has its ties and duplicate
+    stitches filtered out when it's yielded.
+    """
+
     if collapse_len is None:
         collapse_len = 3.0
     collapse_len = collapse_len * PIXELS_PER_MM
-    stitch_plan = StitchPlan()
-    color_block = stitch_plan.new_color_block(color=stitch_groups[0].color)
+    color_block = None
 
     for stitch_group in stitch_groups:
+        if color_block is None:
+            color_block = ColorBlock(color=stitch_group.color)
+
         if not stitch_group.stitches:
             continue
 
@@ -45,16 +64,18 @@ def stitch_groups_to_stitch_plan(stitch_groups, collapse_len=None, disable_ties=
             else:
                 # end the previous block with a color change
                 color_block.add_stitch(color_change=True)
+                yield finish_color_block(color_block, disable_ties)
 
                 # make a new block of our color
-                color_block = stitch_plan.new_color_block(color=stitch_group.color)
+                color_block = ColorBlock(color=stitch_group.color)
 
                 # always start a color with a JUMP to the first stitch position
                 color_block.add_stitch(stitch_group.stitches[0], jump=True, tie_modus=stitch_group.tie_modus)
         else:
-            if (len(color_block) and
-                    ((stitch_group.stitches[0] - color_block.stitches[-1]).length() > collapse_len or
-                     color_block.stitches[-1].force_lock_stitches)):
+            last_stitch = color_block.last_stitch
+            if (last_stitch is not None and
+                    ((stitch_group.stitches[0] - last_stitch).length() > collapse_len or
+                     last_stitch.force_lock_stitches)):
                 color_block.add_stitch(stitch_group.stitches[0], jump=True, tie_modus=stitch_group.tie_modus)
 
         color_block.add_stitches(stitches=stitch_group.stitches, tie_modus=stitch_group.tie_modus,
@@ -65,18 +86,24 @@ def stitch_groups_to_stitch_plan(stitch_groups, collapse_len=None, disable_ties=
 
         if stitch_group.stop_after:
             color_block.add_stitch(stop=True)
-            color_block = stitch_plan.new_color_block(color_block.color)
+            yield finish_color_block(color_block, disable_ties)
+            color_block = ColorBlock(color_block.color)
+
+    # If the last block ended in a stop, we now have an empty block.
+    if color_block is not None and len(color_block) > 0:
+        yield finish_color_block(color_block, disable_ties)
 
-    if len(color_block) == 0:
-        # last block ended in a stop, so now we have an empty block
-        del stitch_plan.color_blocks[-1]
 
-    stitch_plan.filter_duplicate_stitches()
+def finish_color_block(color_block, disable_ties=False):
+    color_block.filter_duplicate_stitches()
 
     if not disable_ties:
-        stitch_plan.add_ties()
+        # Every block but the last one ends in a color change or a stop, so
+        # adding the ties block by block gives the same result as adding
+        # them to the whole stitch plan at once.
+        add_ties([color_block])
 
-    return stitch_plan
+    return color_block
 
 
 class StitchPlan(object):
@@ -127,6 +154,26 @@ class StitchPlan(object):
                     estimated_thread=self.estimated_thread
                     )
 
+    def to_bytes(self, compression=None):
+        """Encode the stitch plan in Ink/Stitch's binary format (see binary.py).
+
+        compression can be None, "zlib" or "zstd".
+        """
+        return stitch_plan_to_bytes(self, compression)
+
+    @classmethod
+    def from_bytes(cls, buffer):
+        """Decode a stitch plan encoded by to_bytes().
+
+        buffer can be anything that supports the buffer protocol, e.g. bytes
+        or an mmap.  Unless the data is compressed, the stitches aren't
+        copied, so the buffer must stay open while the stitch plan is used.
+        """
+
+        stitch_plan = cls()
+        stitch_plan.color_blocks = read_color_blocks(buffer)
+        return stitch_plan
+
     @property
     def num_colors(self):
         """Number of unique colors in the stitch plan."""
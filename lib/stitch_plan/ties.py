@@ -3,71 +3,185 @@
 # Copyright (c) 2010 Authors
 # Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
 
-from copy import deepcopy
+"""Tie-ins and tie-offs.
 
-from .stitch import Stitch
+A tie-off goes before each trim, jump, stop and color change and at the end
+of the stitch plan, and a tie-in after the first stitch that follows them.
+A tie is four stitches that go back and forth along the tie path: for a
+tie-off, the last two stitches before it (which can be the stitches of a
+tie-in), for a tie-in, the first two stitches after it.
+
+The ties of a color block are computed on its columns (see color_block.py)
+all at once.  Stitches are referred to by their index in a pool of the
+block's stitches followed by the tie-in stitches.  Ties that travel along
+the tie path are new stitches without any flags; those are marked with the
+source -1.  Short ties are copies of the stitches of their tie path, so
+their source is the index of that stitch.
+"""
+
+import math
+
+import numpy
+
+from .stitch import (COLOR_CHANGE, FORCE_LOCK_STITCHES, JUMP, NO_TIES, STOP,
+                     TIE_MODUS_SHIFT, TRIM)
+from ..debug import debug
 from ..svg import PIXELS_PER_MM
 
+SPECIAL = JUMP | TRIM | COLOR_CHANGE | STOP
 
-def add_tie(stitches, tie_path):
-    if len(tie_path) < 2 or tie_path[0].no_ties:
-        # It's from a manual stitch block, so don't add tie stitches.  The user
-        # will add them if they want them.
-        return
+# how far along the tie path the stitches of a tie go
+TIE_DELTAS = numpy.array([0.5, 1.0, 0.5, 0])
 
-    to_previous = tie_path[1] - tie_path[0]
-    length = to_previous.length()
-    if length > 0.5 * PIXELS_PER_MM:
-        # Travel back one stitch, stopping halfway there.
-        # Then go forward one stitch, stopping halfway between
-        # again.
 
-        # but travel at most 1.5mm
-        length = min(length, 1.5 * PIXELS_PER_MM)
+def tie_stitches(x0, y0, source0, x1, y1, source1):
+    """Compute the stitches of many ties at once.
 
-        direction = to_previous.unit()
-        for delta in (0.5, 1.0, 0.5, 0):
-            stitches.append(Stitch(tie_path[0] + delta * length * direction))
-    else:
-        # Too short to travel part of the way to the previous stitch; ust go
-        # back and forth to it a couple times.
-        for i in (1, 0, 1, 0):
-            stitches.append(deepcopy(tie_path[i]))
+    Each tie path goes from (x0, y0) to (x1, y1).  Returns the x, y and
+    source of the stitches as arrays of shape (number of ties, 4).
+    """
 
+    to_previous_x = x1 - x0
+    to_previous_y = y1 - y0
 
-def add_tie_off(stitches):
-    # tie_modus: 0 = both | 1 = before | 2 = after | 3 = neither
-    if stitches[-1].tie_modus not in [1, 3] or stitches[-1].force_lock_stitches:
-        add_tie(stitches, stitches[-1:-3:-1])
+    # Point.length() squares with math.pow(), which doesn't always round like
+    # numpy does.  Use it too, so that the ties end up exactly where they
+    # always did.  There are only a few ties per color block.
+    length = numpy.array([math.sqrt(math.pow(x, 2.0) + math.pow(y, 2.0)) for x, y in zip(to_previous_x.tolist(), to_previous_y.tolist())])
+
+    # Travel back one stitch, stopping halfway there.  Then go forward one
+    # stitch, stopping halfway between again.  But travel at most 1.5mm.
+    travel = length > 0.5 * PIXELS_PER_MM
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        direction_x = to_previous_x * (1.0 / length)
+        direction_y = to_previous_y * (1.0 / length)
+    distance = numpy.outer(numpy.minimum(length, 1.5 * PIXELS_PER_MM), TIE_DELTAS)
+    travel_x = x0[:, None] + direction_x[:, None] * distance
+    travel_y = y0[:, None] + direction_y[:, None] * distance
 
+    # Too short to travel part of the way to the previous stitch; just go back
+    # and forth to it a couple times.
+    back_and_forth_x = numpy.column_stack((x1, x0, x1, x0))
+    back_and_forth_y = numpy.column_stack((y1, y0, y1, y0))
+    back_and_forth_source = numpy.column_stack((source1, source0, source1, source0))
 
-def add_tie_in(stitches, upcoming_stitches):
-    if stitches[0].tie_modus not in [2, 3]:
-        add_tie(stitches, upcoming_stitches)
+    travel = travel[:, None]
+    return (numpy.where(travel, travel_x, back_and_forth_x),
+            numpy.where(travel, travel_y, back_and_forth_y),
+            numpy.where(travel, -1, back_and_forth_source))
 
 
+def source_values(values, sources):
+    """The values of the source stitches, 0 for new stitches."""
+
+    result = values[numpy.maximum(sources, 0)]
+    result[sources < 0] = 0
+    return result
+
+
+def tie_ins(flags, special, need_tie_in):
+    """Indices of the stitches that get a tie-in after them."""
+
+    after_special = numpy.empty(len(flags), dtype=bool)
+    after_special[0] = need_tie_in
+    after_special[1:] = special[:-1]
+
+    # tie_modus: 0 = both | 1 = before | 2 = after | 3 = neither
+    # The first stitch of the block decides whether there are tie-ins.
+    if flags[0] >> TIE_MODUS_SHIFT in (2, 3):
+        return numpy.empty(0, dtype=int)
+
+    indices = numpy.flatnonzero(~special & after_special)
+
+    # The tie path is the stitch and the next one.  Stitches from manual
+    # stitch blocks don't get ties; the user will add them if they want them.
+    indices = indices[indices + 1 < len(flags)]
+    return indices[(flags[indices] & NO_TIES) == 0]
+
+
+def tie_offs(special, need_tie_in, tie_off_at_end):
+    """Indices of the stitches that get a tie-off before them.
+
+    The index is the length of the block for a tie-off at the end.
+    """
+
+    before_special = numpy.empty(len(special), dtype=bool)
+    before_special[0] = not need_tie_in
+    before_special[1:] = ~special[:-1]
+
+    indices = numpy.flatnonzero(special & before_special)
+    if tie_off_at_end and not special[-1]:
+        indices = numpy.append(indices, len(special))
+
+    # There's nothing to tie off before the first stitch.
+    return indices[indices > 0]
+
+
+def add_block_ties(color_block, need_tie_in=True, tie_off_at_end=True):
+    """Add the ties of one color block.
+
+    need_tie_in tells whether the stitches before the block ended with a
+    trim, jump, etc.  Returns whether the stitches of the block do.
+    """
+
+    count = len(color_block)
+    if not count:
+        return need_tie_in
+
+    x = color_block.x
+    y = color_block.y
+    flags = color_block.flags
+    special = (flags & SPECIAL) != 0
+
+    tie_in_at = tie_ins(flags, special, need_tie_in)
+    in_x, in_y, in_source = tie_stitches(x[tie_in_at], y[tie_in_at], tie_in_at,
+                                         x[tie_in_at + 1], y[tie_in_at + 1], tie_in_at + 1)
+
+    # The tie path of a tie-off is the last two stitches before it.  If a
+    # tie-in came right before that, those are its last two stitches.
+    pool_x = numpy.concatenate((x, in_x.ravel()))
+    pool_y = numpy.concatenate((y, in_y.ravel()))
+    pool_source = numpy.concatenate((numpy.arange(count), in_source.ravel()))
+    last_tie_in_stitch = numpy.full(count, -1)
+    last_tie_in_stitch[tie_in_at] = count + 4 * numpy.arange(len(tie_in_at)) + 3
+
+    tie_off_at = tie_offs(special, need_tie_in, tie_off_at_end)
+    previous = tie_off_at - 1
+    last = numpy.where(last_tie_in_stitch[previous] >= 0, last_tie_in_stitch[previous], previous)
+    before_previous = numpy.where(previous > 0, last_tie_in_stitch[previous - 1], -1)
+    second_to_last = numpy.where(last_tie_in_stitch[previous] >= 0, last_tie_in_stitch[previous] - 1,
+                                 numpy.where(before_previous >= 0, before_previous, previous - 1))
+
+    last_flags = source_values(flags, pool_source[last])
+    tie_modus = last_flags >> TIE_MODUS_SHIFT
+    wanted = (((tie_modus != 1) & (tie_modus != 3)) | ((last_flags & FORCE_LOCK_STITCHES) != 0)) & ((last_flags & NO_TIES) == 0)
+    wanted &= second_to_last >= 0
+    last = last[wanted]
+    second_to_last = second_to_last[wanted]
+    tie_off_at = tie_off_at[wanted]
+    off_x, off_y, off_source = tie_stitches(pool_x[last], pool_y[last], pool_source[last],
+                                            pool_x[second_to_last], pool_y[second_to_last], pool_source[second_to_last])
+
+    # A tie-in goes after its stitch, so before a tie-off at the next one.
+    positions = numpy.concatenate((tie_in_at + 1, tie_off_at))
+    order = numpy.argsort(positions, kind='stable')
+    sources = numpy.concatenate((in_source, off_source))[order].ravel()
+    colors = color_block._colors
+    color_block._insert(numpy.repeat(positions[order], 4),
+                        numpy.concatenate((in_x, off_x))[order].ravel(),
+                        numpy.concatenate((in_y, off_y))[order].ravel(),
+                        source_values(flags, sources),
+                        source_values(color_block.tag_masks, sources),
+                        {i: colors[source] for i, source in enumerate(sources.tolist()) if source in colors})
+
+    return bool(special[-1])
+
+
+@debug.time
 def add_ties(stitch_plan):
     """Add tie-off before and after trims, jumps, and color changes."""
 
+    color_blocks = list(stitch_plan)
     need_tie_in = True
-    for color_block in stitch_plan:
-        new_stitches = []
-        for i, stitch in enumerate(color_block.stitches):
-            is_special = stitch.trim or stitch.jump or stitch.color_change or stitch.stop
-
-            if is_special and not need_tie_in:
-                add_tie_off(new_stitches)
-                new_stitches.append(stitch)
-                need_tie_in = True
-            elif need_tie_in and not is_special:
-                new_stitches.append(stitch)
-                add_tie_in(new_stitches, upcoming_stitches=color_block.stitches[i:])
-                need_tie_in = False
-            else:
-                new_stitches.append(stitch)
-
-        color_block.replace_stitches(new_stitches)
-
-    if not need_tie_in:
-        # tie off at the end if we haven't already
-        add_tie_off(color_block.stitches)
+    for i, color_block in enumerate(color_blocks):
+        need_tie_in = add_block_ties(color_block, need_tie_in, tie_off_at_end=(i == len(color_blocks) - 1))
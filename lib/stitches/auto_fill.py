@@ -9,6 +9,7 @@ import math
 from itertools import chain, groupby
 
 import networkx
+import numpy
 from shapely import geometry as shgeo
 from shapely.ops import snap
 from shapely.strtree import STRtree
@@ -18,8 +19,10 @@ from ..stitch_plan import Stitch
 from ..svg import PIXELS_PER_MM
 from ..utils.geometry import Point as InkstitchPoint
 from ..utils.geometry import line_string_to_point_list
-from .fill import intersect_region_with_grating, stitch_row
+from .fill import intersect_region_with_grating, stitch_rows
+from .fill_stitch_graph import FillStitchGraph
 from .running_stitch import running_stitch
+from .travel_router import TravelRouter
 
 
 class PathEdge(object):
@@ -71,38 +74,59 @@ def auto_fill(shape,
 
     travel_graph = build_travel_graph(fill_stitch_graph, shape, angle, underpath)
     path = find_stitch_path(fill_stitch_graph, travel_graph, starting_point, ending_point)
-    result = path_to_stitches(path, travel_graph, fill_stitch_graph, angle, row_spacing,
+    result = path_to_stitches(path, TravelRouter(travel_graph), fill_stitch_graph, angle, row_spacing,
                               max_stitch_length, running_stitch_length, staggers, skip_last)
 
     return result
 
 
-def which_outline(shape, coords):
-    """return the index of the outline on which the point resides
+class Outlines(object):
+    """The outlines of a fill region, for finding the outline a point is on.
 
-    Index 0 is the outer boundary of the fill region.  1+ are the
-    outlines of the holes.
+    Index 0 is the outer boundary of the fill region.  1+ are the outlines of
+    the holes.  The outlines are extracted from the shape only once and
+    indexed in an STRtree, because we look up every node of the graphs.
     """
 
-    # I'd use an intersection check, but floating point errors make it
-    # fail sometimes.
+    def __init__(self, shape):
+        self.outlines = list(ensure_multi_line_string(shape.boundary).geoms)
+        self.indices = {id(outline): i for i, outline in enumerate(self.outlines)}
+        self.strtree = STRtree(self.outlines)
 
-    point = shgeo.Point(*coords)
-    outlines = list(shape.boundary)
-    outline_indices = list(range(len(outlines)))
-    closest = min(outline_indices, key=lambda index: outlines[index].distance(point))
+    def __getitem__(self, index):
+        return self.outlines[index]
 
-    return closest
+    def which_outline(self, coords):
+        """return the index of the outline on which the point resides"""
 
+        # I'd use an intersection check, but floating point errors make it
+        # fail sometimes.
 
-def project(shape, coords, outline_index):
-    """project the point onto the specified outline
+        if len(self.outlines) == 1:
+            return 0
 
-    This returns the distance along the outline at which the point resides.
-    """
+        return self.indices[id(self.strtree.nearest(shgeo.Point(*coords)))]
+
+    def project(self, coords, outline_index):
+        """project the point onto the specified outline
+
+        This returns the distance along the outline at which the point resides.
+        """
+
+        return self.outlines[outline_index].project(shgeo.Point(*coords))
 
-    outline = list(shape.boundary)[outline_index]
-    return outline.project(shgeo.Point(*coords))
+
+def nearest_node(nodes, point):
+    # Each graph is only searched once or twice, which is faster with a
+    # vectorized search than with a spatial index over its nodes.  The
+    # distances are computed like shapely does, and argmin() picks the first
+    # of equally near nodes like min() did, so the result is the same.
+
+    nodes = list(nodes)
+    coords = numpy.array(nodes, dtype=float)
+    dx = coords[:, 0] - point[0]
+    dy = coords[:, 1] - point[1]
+    return nodes[numpy.argmin(numpy.sqrt(dx * dx + dy * dy))]
 
 
 @debug.time
@@ -145,41 +169,44 @@ def build_fill_stitch_graph(shape, angle, row_spacing, end_row_spacing, starting
     rows_of_segments = intersect_region_with_grating(shape, angle, row_spacing, end_row_spacing)
     segments = [segment for row in rows_of_segments for segment in row]
 
-    graph = networkx.MultiGraph()
+    graph = FillStitchGraph()
 
     # First, add the grating segments as edges.  We'll use the coordinates
-    # of the endpoints as nodes, which networkx will add automatically.
+    # of the endpoints as nodes, which the graph will add automatically.
     for segment in segments:
-        # networkx allows us to label nodes with arbitrary data.  We'll
-        # mark this one as a grating segment.
+        # Edges are labeled with a key.  We'll mark this one as a grating
+        # segment.
         graph.add_edge(*segment, key="segment", underpath_edges=[])
 
-    tag_nodes_with_outline_and_projection(graph, shape, graph.nodes())
+    outlines = Outlines(shape)
+    tag_nodes_with_outline_and_projection(graph, outlines, graph.nodes())
     add_edges_between_outline_nodes(graph, duplicate_every_other=True)
 
     if starting_point:
-        insert_node(graph, shape, starting_point)
+        insert_node(graph, outlines, starting_point)
 
     if ending_point:
-        insert_node(graph, shape, ending_point)
+        insert_node(graph, outlines, ending_point)
 
     debug.log_graph(graph, "graph")
+    debug.count("fill stitch graph nodes", len(graph))
+    debug.count("fill stitch graph edges", graph.number_of_edges())
 
     return graph
 
 
-def insert_node(graph, shape, point):
+def insert_node(graph, outlines, point):
     """Add node to graph, splitting one of the outline edges"""
 
     point = tuple(point)
-    outline = which_outline(shape, point)
-    projection = project(shape, point, outline)
-    projected_point = list(shape.boundary)[outline].interpolate(projection)
+    outline = outlines.which_outline(point)
+    projection = outlines.project(point, outline)
+    projected_point = outlines[outline].interpolate(projection)
     node = (projected_point.x, projected_point.y)
 
     edges = []
     for start, end, key, data in graph.edges(keys=True, data=True):
-        if key == "outline":
+        if key == "outline" and data['outline'] == outline:
             edges.append(((start, end), data))
 
     edge, data = min(edges, key=lambda edge_data: shgeo.LineString(edge_data[0]).distance(projected_point))
@@ -187,13 +214,13 @@ def insert_node(graph, shape, point):
     graph.remove_edge(*edge, key="outline")
     graph.add_edge(edge[0], node, key="outline", **data)
     graph.add_edge(node, edge[1], key="outline", **data)
-    tag_nodes_with_outline_and_projection(graph, shape, nodes=[node])
+    tag_nodes_with_outline_and_projection(graph, outlines, nodes=[node])
 
 
-def tag_nodes_with_outline_and_projection(graph, shape, nodes):
+def tag_nodes_with_outline_and_projection(graph, outlines, nodes):
     for node in nodes:
-        outline_index = which_outline(shape, node)
-        outline_projection = project(shape, node, outline_index)
+        outline_index = outlines.which_outline(node)
+        outline_projection = outlines.project(node, outline_index)
 
         graph.add_node(node, outline=outline_index, projection=outline_projection)
 
@@ -249,7 +276,7 @@ def graph_is_valid(graph, shape, max_stitch_length):
     # The graph may be empty if the shape is so small that it fits between the
     # rows of stitching.  Certain small weird shapes can also cause a non-
     # eulerian graph.
-    return not networkx.is_empty(graph) and networkx.is_eulerian(graph)
+    return graph.number_of_edges() > 0 and graph.is_eulerian()
 
 
 def fallback(shape, running_stitch_length):
@@ -299,7 +326,7 @@ def build_travel_graph(fill_stitch_graph, shape, fill_stitch_angle, underpath):
 
         # This will ensure that a path traveling inside the shape can reach its
         # target on the outline, which will be one of the points added above.
-        tag_nodes_with_outline_and_projection(graph, shape, boundary_points)
+        tag_nodes_with_outline_and_projection(graph, Outlines(shape), boundary_points)
     else:
         add_boundary_travel_nodes(graph, shape)
 
@@ -309,6 +336,8 @@ def build_travel_graph(fill_stitch_graph, shape, fill_stitch_angle, underpath):
         process_travel_edges(graph, fill_stitch_graph, shape, travel_edges)
 
     debug.log_graph(graph, "travel graph")
+    debug.count("travel graph nodes", graph.number_of_nodes())
+    debug.count("travel graph edges", graph.number_of_edges())
 
     return graph
 
@@ -349,6 +378,9 @@ def process_travel_edges(graph, fill_stitch_graph, shape, travel_edges):
     # not looking for high precision anyway.
     outline = shape.boundary.simplify(0.5 * PIXELS_PER_MM, preserve_topology=False)
 
+    queries = 0
+    crosses_tests = 0
+
     for ls in travel_edges:
         # In most cases, ls will be a simple line segment.  If we're
         # unlucky, in rare cases we can get a tiny little extra squiggle
@@ -358,13 +390,15 @@ def process_travel_edges(graph, fill_stitch_graph, shape, travel_edges):
 
         edge = (p1.as_tuple(), p2.as_tuple(), 'travel')
 
+        queries += 1
         for segment in strtree.query(ls):
             # It seems like the STRTree only gives an approximate answer of
             # segments that _might_ intersect ls.  Refining the result is
             # necessary but the STRTree still saves us a ton of time.
+            crosses_tests += 1
             if segment.crosses(ls):
                 start, end = segment.coords
-                fill_stitch_graph[start][end]['segment']['underpath_edges'].append(edge)
+                fill_stitch_graph.get_edge_data(start, end, 'segment')['underpath_edges'].append(edge)
 
         # The weight of a travel edge is the length of the line segment.
         weight = p1.distance(p2)
@@ -377,6 +411,9 @@ def process_travel_edges(graph, fill_stitch_graph, shape, travel_edges):
 
         graph.add_edge(*edge, weight=weight)
 
+    debug.count("shapely strtree queries", queries)
+    debug.count("shapely crosses tests", crosses_tests)
+
     # without this, we sometimes get exceptions like this:
     # Exception AttributeError: "'NoneType' object has no attribute 'GEOSSTRtree_destroy'" in
     #   <bound method STRtree.__del__ of <shapely.strtree.STRtree instance at 0x0D2BFD50>> ignored
@@ -454,13 +491,6 @@ def build_travel_edges(shape, fill_angle):
     return endpoints, chain(diagonal_edges, vertical_edges)
 
 
-def nearest_node(nodes, point, attr=None):
-    point = shgeo.Point(*point)
-    nearest = min(nodes, key=lambda node: shgeo.Point(*node).distance(point))
-
-    return nearest
-
-
 @debug.time
 def find_stitch_path(graph, travel_graph, starting_point=None, ending_point=None):
     """find a path that visits every grating segment exactly once
@@ -484,10 +514,8 @@ def find_stitch_path(graph, travel_graph, starting_point=None, ending_point=None
     the order of most-recently-visited first.
     """
 
-    graph = graph.copy()
-
     if not starting_point:
-        starting_point = list(graph.nodes.keys())[0]
+        starting_point = next(iter(graph))
 
     starting_node = nearest_node(graph, starting_point)
 
@@ -497,23 +525,9 @@ def find_stitch_path(graph, travel_graph, starting_point=None, ending_point=None
         ending_point = starting_point
         ending_node = starting_node
 
-    # The algorithm below is adapted from networkx.eulerian_circuit().
-    path = []
-    vertex_stack = [(ending_node, None)]
-    last_vertex = None
-    last_key = None
-
-    while vertex_stack:
-        current_vertex, current_key = vertex_stack[-1]
-        if graph.degree(current_vertex) == 0:
-            if last_vertex:
-                path.append(PathEdge((last_vertex, current_vertex), last_key))
-            last_vertex, last_key = current_vertex, current_key
-            vertex_stack.pop()
-        else:
-            ignore, next_vertex, next_key = pick_edge(graph.edges(current_vertex, keys=True))
-            vertex_stack.append((next_vertex, next_key))
-            graph.remove_edge(current_vertex, next_vertex, next_key)
+    # Prefer a segment if one is available.  This has the effect of
+    # creating long sections of back-and-forth row traversal.
+    path = [PathEdge((start, end), key) for start, end, key in graph.walk(ending_node, preferred_key="segment")]
 
     # The above has the excellent property that it tends to do travel stitches
     # before the rows in that area, so we can hide the travel stitches under
@@ -547,18 +561,6 @@ def find_stitch_path(graph, travel_graph, starting_point=None, ending_point=None
     return path
 
 
-def pick_edge(edges):
-    """Pick the next edge to traverse in the pathfinding algorithm"""
-
-    # Prefer a segment if one is available.  This has the effect of
-    # creating long sections of back-and-forth row traversal.
-    for source, node, key in edges:
-        if key == 'segment':
-            return source, node, key
-
-    return list(edges)[0]
-
-
 def collapse_sequential_outline_edges(path):
     """collapse sequential edges that fall on the same outline
 
@@ -589,10 +591,10 @@ def collapse_sequential_outline_edges(path):
     return new_path
 
 
-def travel(travel_graph, start, end, running_stitch_length, skip_last):
+def travel(router, start, end, running_stitch_length, skip_last):
     """Create stitches to get from one point on an outline of the shape to another."""
 
-    path = networkx.shortest_path(travel_graph, start, end, weight='weight')
+    path = router.shortest_path(start, end)
     path = [Stitch(*p) for p in path]
     stitches = running_stitch(path, running_stitch_length)
 
@@ -616,7 +618,7 @@ def travel(travel_graph, start, end, running_stitch_length, skip_last):
 
 
 @debug.time
-def path_to_stitches(path, travel_graph, fill_stitch_graph, angle, row_spacing, max_stitch_length, running_stitch_length, staggers, skip_last):
+def path_to_stitches(path, router, fill_stitch_graph, angle, row_spacing, max_stitch_length, running_stitch_length, staggers, skip_last):
     path = collapse_sequential_outline_edges(path)
 
     stitches = []
@@ -625,11 +627,21 @@ def path_to_stitches(path, travel_graph, fill_stitch_graph, angle, row_spacing,
     if not path[0].is_segment():
         stitches.append(Stitch(*path[0].nodes[0]))
 
+    # The needle positions of the rows don't depend on the travel in between
+    # them, so compute them all at once.
+    rows = [(edge[0], edge[1]) for edge in path if edge.is_segment()]
+    row_stitches = iter(stitch_rows(rows, angle, row_spacing, max_stitch_length, staggers, skip_last))
+
     for edge in path:
         if edge.is_segment():
-            stitch_row(stitches, edge[0], edge[1], angle, row_spacing, max_stitch_length, staggers, skip_last)
-            travel_graph.remove_edges_from(fill_stitch_graph[edge[0]][edge[1]]['segment'].get('underpath_edges', []))
+            stitches.extend(next(row_stitches))
+            router.remove_edges(fill_stitch_graph.get_edge_data(edge[0], edge[1], 'segment').get('underpath_edges', []))
         else:
-            stitches.extend(travel(travel_graph, edge[0], edge[1], running_stitch_length, skip_last))
+            stitches.extend(travel(router, edge[0], edge[1], running_stitch_length, skip_last))
+
+    debug.log("travel routing: %d searches, %d nodes expanded, %d edges removed, %.6fs",
+              router.searches, router.expanded_nodes, router.removed_edges, router.routing_time)
+    debug.count("shortest path calls", router.searches)
+    debug.count("shortest path nodes expanded", router.expanded_nodes)
 
     return stitches
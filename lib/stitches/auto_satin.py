@@ -18,7 +18,7 @@ from ..svg import (PIXELS_PER_MM, generate_unique_id, get_correction_transform,
                    line_strings_to_csp)
 from ..svg.tags import (INKSCAPE_LABEL, INKSTITCH_ATTRIBS)
 from ..utils import Point as InkstitchPoint
-from ..utils import cache, cut
+from ..utils import cached_method, cut
 
 
 class SatinSegment(object):
@@ -121,12 +121,12 @@ class SatinSegment(object):
         return center_line
 
     @property
-    @cache
+    @cached_method
     def start_point(self):
         return self.satin.center_line.interpolate(self.start, normalized=True)
 
     @property
-    @cache
+    @cached_method
     def end_point(self):
         return self.satin.center_line.interpolate(self.end, normalized=True)
 
@@ -192,7 +192,7 @@ class JumpStitch(object):
         return False
 
     @property
-    @cache
+    @cached_method
     def length(self):
         return self.start.distance(self.end)
 
@@ -231,12 +231,12 @@ class RunningStitch(object):
         return stroke
 
     @property
-    @cache
+    @cached_method
     def start_point(self):
         return self.path.interpolate(0.0, normalized=True)
 
     @property
-    @cache
+    @cached_method
     def end_point(self):
         return self.path.interpolate(1.0, normalized=True)
 
@@ -244,7 +244,7 @@ class RunningStitch(object):
     def original_node(self):
         return self.original_element.node
 
-    @cache
+    @cached_method
     def reversed(self):
         return RunningStitch(shgeo.LineString(reversed(self.path.coords)), self.original_element)
 
@@ -4,14 +4,22 @@
 # Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
 
 import math
+from itertools import chain
 
+import numpy
 import shapely
+import shapely.affinity
 
+from ..debug import debug
 from ..stitch_plan import Stitch
 from ..svg import PIXELS_PER_MM
 from ..utils import Point as InkstitchPoint
 from ..utils import cache
 
+# Rows that pass this close to a vertex of the shape are intersected by
+# shapely (see intersect_region_with_grating()).
+GRATING_VERTEX_TOLERANCE = 1e-6
+
 
 def legacy_fill(shape, angle, row_spacing, end_row_spacing, max_stitch_length, flip, staggers, skip_last):
     rows_of_segments = intersect_region_with_grating(shape, angle, row_spacing, end_row_spacing, flip)
@@ -32,20 +40,30 @@ def north(angle):
     return east(angle).rotate(math.pi / 2)
 
 
-def row_num(point, angle, row_spacing):
-    return round((point * north(angle)) / row_spacing)
+# what each point returned by fill_row_points() is
+FILL_ROW_START = 0
+FILL_ROW = 1
+FILL_ROW_END = 2
 
+FILL_ROW_TAGS = {
+    FILL_ROW_START: ('fill_row_start',),
+    FILL_ROW: ('fill_row',),
+    FILL_ROW_END: ('fill_row_end',),
+}
 
-def adjust_stagger(stitch, angle, row_spacing, max_stitch_length, staggers):
-    this_row_num = row_num(stitch, angle, row_spacing)
-    row_stagger = this_row_num % staggers
-    stagger_offset = (float(row_stagger) / staggers) * max_stitch_length
-    offset = ((stitch * east(angle)) - stagger_offset) % max_stitch_length
 
-    return stitch - offset * east(angle)
+def fill_row_points(begs, ends, angle, row_spacing, max_stitch_length, staggers, skip_last=False):
+    """Compute the needle positions of many rows of fill stitching at once.
 
+    begs and ends are sequences of the start and end points of the rows.
+
+    Returns a tuple (points, kinds, row_sizes):
+
+        points    - an (N, 2) numpy array of all needle positions, row by row
+        kinds     - for each point, FILL_ROW_START, FILL_ROW or FILL_ROW_END
+        row_sizes - the number of points in each row
+    """
 
-def stitch_row(stitches, beg, end, angle, row_spacing, max_stitch_length, staggers, skip_last=False):
     # We want our stitches to look like this:
     #
     # ---*-----------*-----------
@@ -66,37 +84,93 @@ def stitch_row(stitches, beg, end, angle, row_spacing, max_stitch_length, stagge
     # tile with each other.  That's important because we often get
     # abutting fill regions from pull_runs().
 
-    beg = Stitch(*beg, tags=('fill_row_start',))
-    end = Stitch(*end, tags=('fill_row_end',))
+    begs = numpy.asarray(begs, dtype=float).reshape(-1, 2)
+    ends = numpy.asarray(ends, dtype=float).reshape(-1, 2)
+    east_vector = numpy.array(east(angle).as_tuple())
+    north_vector = numpy.array(north(angle).as_tuple())
 
-    row_direction = (end - beg).unit()
-    segment_length = (end - beg).length()
+    row_vectors = ends - begs
+    segment_lengths = numpy.hypot(*row_vectors.T)
+    row_directions = row_vectors / segment_lengths[:, numpy.newaxis]
 
-    stitches.append(beg)
-
-    first_stitch = adjust_stagger(beg, angle, row_spacing, max_stitch_length, staggers)
+    # Find the stitch on each row's stagger grid that is nearest to the
+    # beginning of the row, going backward along the "east" direction.
+    row_nums = numpy.round((begs @ north_vector) / row_spacing)
+    stagger_offsets = (row_nums % staggers) / staggers * max_stitch_length
+    offsets = ((begs @ east_vector) - stagger_offsets) % max_stitch_length
+    first_stitches = -offsets[:, numpy.newaxis] * east_vector
 
     # we might have chosen our first stitch just outside this row, so move back in
-    if (first_stitch - beg) * row_direction < 0:
-        first_stitch += row_direction * max_stitch_length
+    outside = numpy.einsum('ij,ij->i', first_stitches, row_directions) < 0
+    first_stitches[outside] += row_directions[outside] * max_stitch_length
+    first_offsets = numpy.hypot(*first_stitches.T)
+
+    num_stitches = numpy.ceil((segment_lengths - first_offsets) / max_stitch_length).clip(0).astype(int)
+
+    # Add the end of the row unless the last stitch is already close to it.
+    last_offsets = numpy.where(num_stitches > 0, first_offsets + (num_stitches - 1) * max_stitch_length, 0)
+    last_stitches = begs + last_offsets[:, numpy.newaxis] * row_directions
+    add_end = numpy.hypot(*(ends - last_stitches).T) > 0.1 * PIXELS_PER_MM
+    if skip_last:
+        add_end[:] = False
+
+    row_sizes = 1 + num_stitches + add_end
+    row_index = numpy.repeat(numpy.arange(len(row_sizes)), row_sizes)
+    position = numpy.arange(row_sizes.sum()) - numpy.repeat(numpy.cumsum(row_sizes) - row_sizes, row_sizes)
+
+    kinds = numpy.full(len(position), FILL_ROW)
+    kinds[position == 0] = FILL_ROW_START
+    kinds[position > num_stitches[row_index]] = FILL_ROW_END
+
+    distances = first_offsets[row_index] + (position - 1) * max_stitch_length
+    distances[kinds == FILL_ROW_START] = 0
+    distances[kinds == FILL_ROW_END] = segment_lengths[row_index[kinds == FILL_ROW_END]]
+    points = begs[row_index] + distances[:, numpy.newaxis] * row_directions[row_index]
+
+    # use the exact row ends rather than recomputing them
+    points[kinds == FILL_ROW_END] = ends[row_index[kinds == FILL_ROW_END]]
+
+    return points, kinds, row_sizes
+
 
-    offset = (first_stitch - beg).length()
+def stitch_rows(rows, angle, row_spacing, max_stitch_length, staggers, skip_last=False):
+    """Stitch each (beg, end) row, returning a list of Stitches per row."""
 
-    while offset < segment_length:
-        stitches.append(Stitch(beg + offset * row_direction, tags=('fill_row')))
-        offset += max_stitch_length
+    if not rows:
+        return []
 
-    if (end - stitches[-1]).length() > 0.1 * PIXELS_PER_MM and not skip_last:
-        stitches.append(end)
+    begs, ends = zip(*rows)
+    points, kinds, row_sizes = fill_row_points(begs, ends, angle, row_spacing, max_stitch_length, staggers, skip_last)
 
+    stitches = [Stitch(x, y, tags=FILL_ROW_TAGS[kind]) for (x, y), kind in zip(points.tolist(), kinds.tolist())]
+    row_ends = numpy.cumsum(row_sizes).tolist()
 
+    return [stitches[row_end - row_size:row_end] for row_end, row_size in zip(row_ends, row_sizes.tolist())]
+
+
+def stitch_row(stitches, beg, end, angle, row_spacing, max_stitch_length, staggers, skip_last=False):
+    stitches.extend(stitch_rows([(beg, end)], angle, row_spacing, max_stitch_length, staggers, skip_last)[0])
+
+
+@debug.time
 def intersect_region_with_grating(shape, angle, row_spacing, end_row_spacing=None, flip=False):
+    # Instead of constructing a LineString for every row and asking shapely
+    # to intersect it with the shape, we do a scanline pass over the edges of
+    # the shape in a coordinate system aligned with the grating: "u" runs
+    # along the rows and "v" runs across them.  All rows are handled at once
+    # with numpy.
+    #
+    # The rows are the same as shapely's, but the crossings are computed
+    # differently, so the coordinates can differ in the last bits (about
+    # 1e-9 px).  That's enough to change which of two equally good nodes or
+    # travel paths auto_fill picks, so the stitches of a fill can change a
+    # little compared to the shapely version.
+
     # the max line length I'll need to intersect the whole shape is the diagonal
     (minx, miny, maxx, maxy) = shape.bounds
     upper_left = InkstitchPoint(minx, miny)
     lower_right = InkstitchPoint(maxx, maxy)
-    length = (upper_left - lower_right).length()
-    half_length = length / 2.0
+    half_length = (upper_left - lower_right).length() / 2.0
 
     # Now get a unit vector rotated to the requested angle.  I use -angle
     # because shapely rotates clockwise, but my geometry textbooks taught
@@ -106,71 +180,178 @@ def intersect_region_with_grating(shape, angle, row_spacing, end_row_spacing=Non
     # and get a normal vector
     normal = direction.rotate(math.pi / 2)
 
-    # I'll start from the center, move in the normal direction some amount,
-    # and then walk left and right half_length in each direction to create
-    # a line segment in the grating.
+    # All coordinates below are relative to the center of the bounding box.
     center = InkstitchPoint((minx + maxx) / 2.0, (miny + maxy) / 2.0)
 
+    edge_starts, edge_ends = _shape_edges(shape)
+    if not len(edge_starts):
+        return []
+
     # I need to figure out how far I need to go along the normal to get to
     # the edge of the shape.  To do that, I'll rotate the bounding box
     # angle degrees clockwise and ask for the new bounding box.  The max
     # and min y tell me how far to go.
-
     _, start, _, end = shapely.affinity.rotate(shape, angle, origin='center', use_radians=True).bounds
-
-    # convert start and end to be relative to center (simplifies things later)
     start -= center.y
     end -= center.y
-
     height = abs(end - start)
 
-    # print >> dbg, "grating:", start, end, height, row_spacing, end_row_spacing
-
     # offset start slightly so that rows are always an even multiple of
     # row_spacing_px from the origin.  This makes it so that abutting
     # fill regions at the same angle and spacing always line up nicely.
     start -= (start + normal * center) % row_spacing
 
+    row_offsets = _grating_row_offsets(start, end, height, row_spacing, end_row_spacing)
+
+    to_grating = numpy.array((direction.as_tuple(), normal.as_tuple())).T
+    u0, v0 = ((edge_starts - center.as_tuple()) @ to_grating).T
+    u1, v1 = ((edge_ends - center.as_tuple()) @ to_grating).T
+
+    # A row that passes through a vertex or runs along an edge may touch the
+    # shape in single points or in runs that are points, and shapely decides
+    # which of them count.  Those rows are intersected by shapely, like every
+    # row used to be.  They're rare, unless the shape has edges parallel to
+    # the rows.
+    vertex_v = numpy.sort(v0)
+    nearest_vertex = numpy.searchsorted(vertex_v, row_offsets)
+    distance_below = numpy.abs(row_offsets - vertex_v[(nearest_vertex - 1).clip(0)])
+    distance_above = numpy.abs(vertex_v[nearest_vertex.clip(max=len(vertex_v) - 1)] - row_offsets)
+    on_vertex = numpy.minimum(distance_below, distance_above) <= GRATING_VERTEX_TOLERANCE
+
+    # Every other row crosses each edge that spans it once, and crosses each
+    # closed ring an even number of times.
+    first_row = numpy.searchsorted(row_offsets, numpy.minimum(v0, v1), side='left')
+    last_row = numpy.searchsorted(row_offsets, numpy.maximum(v0, v1), side='left')
+    counts = last_row - first_row
+
+    edge_index = numpy.repeat(numpy.arange(len(counts)), counts)
+    row_index = first_row[edge_index] + numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+
+    crossings = ~on_vertex[row_index]
+    edge_index = edge_index[crossings]
+    row_index = row_index[crossings]
+
+    row_v = row_offsets[row_index]
+    ev0 = v0[edge_index]
+    ev1 = v1[edge_index]
+    eu0 = u0[edge_index]
+    eu1 = u1[edge_index]
+    crossing_u = eu0 + (row_v - ev0) * (eu1 - eu0) / (ev1 - ev0)
+
+    # Sort the crossings by row and then along the row.  Successive pairs of
+    # crossings in a row are then the entry and exit points of a run.  The
+    # rows run from +u to -u, like the LineStrings did.
+    order = numpy.lexsort((crossing_u, row_index))
+    row_index = row_index[order][0::2]
+    run_start_u = crossing_u[order][1::2]
+    run_end_u = crossing_u[order][0::2]
+    row_v = row_offsets[row_index]
+
+    origins = numpy.array(center.as_tuple()) + numpy.outer(row_v, normal.as_tuple())
+    run_starts = origins + numpy.outer(run_start_u, direction.as_tuple())
+    run_ends = origins + numpy.outer(run_end_u, direction.as_tuple())
+
+    # Within a row, runs are ordered by their distance from the upper left
+    # corner of the shape's bounding box.
+    distances = numpy.hypot(*(run_starts - upper_left.as_tuple()).T)
+    order = numpy.lexsort((distances, row_index))
+    row_index = row_index[order].tolist()
+    runs = numpy.stack((run_starts[order], run_ends[order]), axis=1).tolist()
+
+    runs_by_row = {}
+    for row, (run_start, run_end) in zip(row_index, runs):
+        runs_by_row.setdefault(row, []).append((tuple(run_start), tuple(run_end)))
+
+    for row in numpy.flatnonzero(on_vertex).tolist():
+        runs_by_row[row] = _shapely_grating_row(shape, row_offsets[row], center, direction, normal, half_length, upper_left)
+
     rows = []
+    for row in sorted(runs_by_row):
+        runs = runs_by_row[row]
 
-    current_row_y = start
+        if not runs:
+            continue
 
-    while current_row_y < end:
-        p0 = center + normal * current_row_y + direction * half_length
-        p1 = center + normal * current_row_y - direction * half_length
-        endpoints = [p0.as_tuple(), p1.as_tuple()]
-        grating_line = shapely.geometry.LineString(endpoints)
+        if flip:
+            runs.reverse()
+            runs = [tuple(reversed(run)) for run in runs]
+
+        rows.append(runs)
+
+    return rows
 
-        res = grating_line.intersection(shape)
 
-        if (isinstance(res, shapely.geometry.MultiLineString) or isinstance(res, shapely.geometry.GeometryCollection)):
-            runs = [line_string.coords for line_string in res.geoms if isinstance(line_string, shapely.geometry.LineString)]
+def _shapely_grating_row(shape, row_y, center, direction, normal, half_length, upper_left):
+    """Intersect one row of the grating with the shape using shapely"""
+
+    p0 = center + normal * row_y + direction * half_length
+    p1 = center + normal * row_y - direction * half_length
+    endpoints = [p0.as_tuple(), p1.as_tuple()]
+    grating_line = shapely.geometry.LineString(endpoints)
+
+    res = grating_line.intersection(shape)
+
+    if (isinstance(res, shapely.geometry.MultiLineString) or isinstance(res, shapely.geometry.GeometryCollection)):
+        runs = [line_string.coords for line_string in res.geoms if isinstance(line_string, shapely.geometry.LineString)]
+    else:
+        if res.is_empty or len(res.coords) == 1:
+            # ignore if we intersected at a single point or no points
+            runs = []
         else:
-            if res.is_empty or len(res.coords) == 1:
-                # ignore if we intersected at a single point or no points
-                runs = []
-            else:
-                runs = [res.coords]
+            runs = [res.coords]
+
+    runs.sort(key=lambda seg: (InkstitchPoint(*seg[0]) - upper_left).length())
+
+    return [tuple(tuple(point) for point in run) for run in runs]
+
 
-        if runs:
-            runs.sort(key=lambda seg: (InkstitchPoint(*seg[0]) - upper_left).length())
+def _shape_edges(shape):
+    """Return the start and end points of every edge of a (Multi)Polygon
 
-            if flip:
-                runs.reverse()
-                runs = [tuple(reversed(run)) for run in runs]
+    Edges of the outer boundary and of all holes are returned together as two
+    numpy arrays of shape (N, 2).
+    """
 
-            rows.append(runs)
+    starts = []
+    ends = []
+
+    for polygon in getattr(shape, 'geoms', [shape]):
+        for ring in chain([polygon.exterior], polygon.interiors):
+            coords = numpy.array(ring.coords)
+            if len(coords) < 2:
+                continue
+            starts.append(coords[:-1])
+            ends.append(coords[1:])
+
+    if not starts:
+        return numpy.empty((0, 2)), numpy.empty((0, 2))
+
+    return numpy.concatenate(starts), numpy.concatenate(ends)
+
+
+def _grating_row_offsets(start, end, height, row_spacing, end_row_spacing=None):
+    """Return the positions of the rows of the grating along the normal vector
+
+    The rows are added up one by one, like the grating always did, so that
+    they are in exactly the same places.
+    """
+
+    offsets = []
+    current_row_y = start
+
+    while current_row_y < end:
+        offsets.append(current_row_y)
 
         if end_row_spacing:
             current_row_y += row_spacing + (end_row_spacing - row_spacing) * ((current_row_y - start) / height)
         else:
             current_row_y += row_spacing
 
-    return rows
+    return numpy.array(offsets)
 
 
 def section_to_stitches(group_of_segments, angle, row_spacing, max_stitch_length, staggers, skip_last):
-    stitches = []
+    rows = []
     swap = False
 
     for segment in group_of_segments:
@@ -179,11 +360,11 @@ def section_to_stitches(group_of_segments, angle, row_spacing, max_stitch_length
         if (swap):
             (beg, end) = (end, beg)
 
-        stitch_row(stitches, beg, end, angle, row_spacing, max_stitch_length, staggers, skip_last)
+        rows.append((beg, end))
 
         swap = not swap
 
-    return stitches
+    return list(chain.from_iterable(stitch_rows(rows, angle, row_spacing, max_stitch_length, staggers, skip_last)))
 
 
 def make_quadrilateral(segment1, segment2):
@@ -0,0 +1,307 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+from array import array
+
+import numpy
+
+
+class FillStitchGraph(object):
+    """A compact undirected multigraph for auto-fill's fill stitch graph.
+
+    Nodes are (x, y) tuples, like in networkx, but internally each node is
+    interned into an integer id and edges are stored in flat arrays.  Edges
+    are identified by their two nodes and a key ("segment", "outline",
+    "extra"), and there's at most one edge per pair of nodes and key.
+    Nodes can be tagged with the outline they're on and their projection
+    onto it.
+
+    The methods used while building the graph mimic networkx.MultiGraph, so
+    that code like add_edges_between_outline_nodes() works on both this and
+    the travel graph.  For walking the graph (see walk()), the edges are
+    converted to compressed sparse row arrays and removed edges are tracked
+    in a bitmap.
+
+    debug.log_graph() only needs edges(), so it logs this graph like a
+    networkx graph.
+    """
+
+    def __init__(self):
+        self._nodes = []
+        self._node_ids = {}
+        self._outlines = array('l')
+        self._projections = array('d')
+
+        self._starts = array('l')
+        self._ends = array('l')
+        self._keys = bytearray()
+        self._data = []
+        self._removed = bytearray()
+        self._num_removed = 0
+
+        # Keys are stored as indices into this list.
+        self._key_names = []
+        self._key_codes = {}
+
+        # edge code (see _edge_code()) -> edge id
+        self._edge_ids = {}
+
+        # networkx orders the neighbors of a node by when they became
+        # neighbors.  We need the same order to walk the graph the same way,
+        # so each edge remembers when its two nodes became neighbors.
+        self._neighbor_order = array('l')
+        self._num_neighbor_pairs = 0
+
+    def _node_id(self, node):
+        node_id = self._node_ids.get(node)
+        if node_id is None:
+            node_id = self._node_ids[node] = len(self._nodes)
+            self._nodes.append(node)
+            self._outlines.append(-1)
+            self._projections.append(numpy.nan)
+
+        return node_id
+
+    def _key_code(self, key):
+        key_code = self._key_codes.get(key)
+        if key_code is None:
+            if len(self._key_names) == 256:
+                raise ValueError("a FillStitchGraph can have at most 256 different edge keys")
+            key_code = self._key_codes[key] = len(self._key_names)
+            self._key_names.append(key)
+
+        return key_code
+
+    @staticmethod
+    def _edge_code(start_id, end_id, key_code):
+        # A single int is a lot smaller than a tuple as a dict key.
+        if start_id > end_id:
+            start_id, end_id = end_id, start_id
+
+        return (((start_id << 32) | end_id) << 8) | key_code
+
+    def _edge_id(self, start, end, key):
+        start = self._node_ids.get(start)
+        end = self._node_ids.get(end)
+        key = self._key_codes.get(key)
+        if start is None or end is None or key is None:
+            return None
+
+        return self._edge_ids.get(self._edge_code(start, end, key))
+
+    def add_node(self, node, outline=None, projection=None):
+        node_id = self._node_id(node)
+        if outline is not None:
+            self._outlines[node_id] = outline
+        if projection is not None:
+            self._projections[node_id] = projection
+
+    def add_edge(self, start, end, key, **data):
+        """Add an edge, or update the data of the edge if it already exists."""
+
+        start_id = self._node_id(start)
+        end_id = self._node_id(end)
+        key_code = self._key_code(key)
+        edge_code = self._edge_code(start_id, end_id, key_code)
+
+        edge_id = self._edge_ids.get(edge_code)
+        if edge_id is not None:
+            self._data[edge_id].update(data)
+            return
+
+        self._neighbor_order.append(self._pair_order(edge_code - key_code))
+        self._edge_ids[edge_code] = len(self._starts)
+        self._starts.append(start_id)
+        self._ends.append(end_id)
+        self._keys.append(key_code)
+        self._data.append(data)
+        self._removed.append(0)
+
+    def _pair_order(self, pair_code):
+        # If there's another edge between the two nodes, they've been
+        # neighbors since that edge was added.
+        for key_code in range(len(self._key_names)):
+            edge_id = self._edge_ids.get(pair_code | key_code)
+            if edge_id is not None:
+                return self._neighbor_order[edge_id]
+
+        self._num_neighbor_pairs += 1
+        return self._num_neighbor_pairs
+
+    def remove_edge(self, start, end, key):
+        edge_id = self._edge_id(start, end, key)
+        if edge_id is None:
+            raise KeyError("no %s edge between %s and %s" % (key, start, end))
+
+        del self._edge_ids[self._edge_code(self._starts[edge_id], self._ends[edge_id], self._keys[edge_id])]
+        self._removed[edge_id] = 1
+        self._num_removed += 1
+
+    def get_edge_data(self, start, end, key):
+        edge_id = self._edge_id(start, end, key)
+        if edge_id is None:
+            return None
+
+        return self._data[edge_id]
+
+    def __iter__(self):
+        return iter(self._nodes)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def nodes(self, data=False):
+        if not data:
+            return list(self._nodes)
+
+        return [(node, self._node_data(node_id)) for node_id, node in enumerate(self._nodes)]
+
+    def _node_data(self, node_id):
+        data = {}
+        if self._outlines[node_id] != -1:
+            data['outline'] = self._outlines[node_id]
+        if not numpy.isnan(self._projections[node_id]):
+            data['projection'] = self._projections[node_id]
+
+        return data
+
+    def edges(self, keys=False, data=False):
+        """Iterate over the edges in the same order as networkx would."""
+
+        for edge_id in self._edge_order():
+            edge = (self._nodes[self._starts[edge_id]], self._nodes[self._ends[edge_id]])
+            if keys:
+                edge += (self._key_names[self._keys[edge_id]],)
+            if data:
+                edge += (self._data[edge_id],)
+            yield edge
+
+    def _edge_order(self):
+        # networkx goes through the nodes in the order they were added, and
+        # lists each edge at the node that was added first.  The edges of a
+        # node are ordered by when their other node became a neighbor.
+        edge_ids = self._live_edges()
+        firsts = numpy.minimum(self._array(self._starts)[edge_ids], self._array(self._ends)[edge_ids])
+        order = self._array(self._neighbor_order)[edge_ids]
+
+        return edge_ids[numpy.lexsort((edge_ids, order, firsts))].tolist()
+
+    @staticmethod
+    def _array(values):
+        # copy, so that the array or bytearray can still grow afterwards
+        return numpy.frombuffer(values, dtype=values.typecode if isinstance(values, array) else numpy.uint8).copy()
+
+    def number_of_edges(self):
+        return len(self._starts) - self._num_removed
+
+    def _live_edges(self):
+        return numpy.flatnonzero(self._array(self._removed) == 0)
+
+    def _degrees(self):
+        # A self-loop counts twice, like in networkx.
+        edge_ids = self._live_edges()
+        nodes = numpy.concatenate((self._array(self._starts)[edge_ids], self._array(self._ends)[edge_ids]))
+        return numpy.bincount(nodes, minlength=len(self._nodes))
+
+    def is_eulerian(self):
+        """True if there's a circuit that visits every edge exactly once."""
+
+        if not self._nodes or numpy.any(self._degrees() % 2):
+            return False
+
+        return self._is_connected()
+
+    def _is_connected(self):
+        offsets, neighbors, edge_ids = self._adjacency()
+        seen = bytearray(len(self._nodes))
+        seen[0] = 1
+        stack = [0]
+
+        while stack:
+            node = stack.pop()
+            for neighbor in neighbors[offsets[node]:offsets[node + 1]]:
+                if not seen[neighbor]:
+                    seen[neighbor] = 1
+                    stack.append(neighbor)
+
+        return all(seen)
+
+    def _adjacency(self):
+        """Return the live edges in compressed sparse row form.
+
+        The entries offsets[i] to offsets[i + 1] of neighbors and edge_ids
+        are the edges of node i, ordered like networkx orders the edges of a
+        node in a copy of the graph: first the neighbors that were added to
+        the graph before the node, in that order, then the other neighbors
+        in the order they became neighbors.  A self-loop is listed once.
+        """
+
+        edge_ids = self._live_edges()
+        starts = self._array(self._starts)[edge_ids]
+        ends = self._array(self._ends)[edge_ids]
+        not_loop = starts != ends
+
+        nodes = numpy.concatenate((starts, ends[not_loop]))
+        neighbors = numpy.concatenate((ends, starts[not_loop]))
+        edge_ids = numpy.concatenate((edge_ids, edge_ids[not_loop]))
+
+        later = neighbors >= nodes
+        order = numpy.where(later, self._array(self._neighbor_order)[edge_ids], neighbors)
+
+        sort = numpy.lexsort((edge_ids, order, later, nodes))
+        offsets = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(nodes, minlength=len(self._nodes)))))
+
+        return offsets.tolist(), neighbors[sort].tolist(), edge_ids[sort].tolist()
+
+    def walk(self, start, preferred_key):
+        """Walk all edges of the graph in a closed loop starting and ending at start.
+
+        This is Hierholzer's algorithm as in networkx.eulerian_circuit(), but
+        at each node, the first edge with preferred_key is taken if there is
+        one.  Returns a list of (start, end, key) tuples.  The graph itself
+        isn't changed.
+        """
+
+        offsets, neighbors, edge_ids = self._adjacency()
+        degrees = self._degrees().tolist()
+        removed = bytearray(len(self._starts))
+        keys = self._keys
+        key_names = self._key_names
+        preferred_key = self._key_codes.get(preferred_key)
+        nodes = self._nodes
+
+        # the first edge of each node that might not be removed yet
+        first = offsets[:-1]
+
+        path = []
+        vertex_stack = [(self._node_ids[start], None)]
+        last_vertex = None
+        last_key = None
+
+        while vertex_stack:
+            current_vertex, current_key = vertex_stack[-1]
+            if degrees[current_vertex] == 0:
+                if last_vertex is not None:
+                    path.append((nodes[last_vertex], nodes[current_vertex], key_names[last_key]))
+                last_vertex, last_key = current_vertex, current_key
+                vertex_stack.pop()
+            else:
+                while removed[edge_ids[first[current_vertex]]]:
+                    first[current_vertex] += 1
+
+                entry = first[current_vertex]
+                for i in range(entry, offsets[current_vertex + 1]):
+                    if keys[edge_ids[i]] == preferred_key and not removed[edge_ids[i]]:
+                        entry = i
+                        break
+
+                edge_id = edge_ids[entry]
+                next_vertex = neighbors[entry]
+                removed[edge_id] = 1
+                degrees[current_vertex] -= 1
+                degrees[next_vertex] -= 1
+                vertex_stack.append((next_vertex, keys[edge_id]))
+
+        return path
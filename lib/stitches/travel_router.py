@@ -0,0 +1,190 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+import time
+from heapq import heappop, heappush
+from itertools import count
+from math import hypot
+
+import numpy
+
+
+class NoTravelPathError(Exception):
+    pass
+
+
+class TravelRouter(object):
+    """Find shortest travel paths through an auto-fill travel graph.
+
+    The graph is converted to arrays once: nodes are numbered, and the edges
+    leaving each node are stored in compressed sparse row form (the edges
+    leaving node i are entries offsets[i] to offsets[i + 1] of targets and
+    edges).  Each undirected edge is stored once in each direction.
+    Removing an edge just marks it as removed.
+
+    Paths are found with bidirectional A*.  The graph is geometric, but the
+    weights aren't plain edge lengths (see build_travel_graph()), so the
+    straight-line distances are scaled by the smallest ratio of weight to
+    length of any edge.  That keeps the heuristic admissible, so the paths
+    found are as short as the ones Dijkstra's algorithm would find.
+
+    The router counts how many searches it did, how many nodes they expanded
+    and how long they took in total, so that we can see where the time goes
+    for a given shape.
+    """
+
+    def __init__(self, graph):
+        self.nodes = list(graph)
+        self.node_indices = {node: i for i, node in enumerate(self.nodes)}
+
+        coords = numpy.array(self.nodes, dtype=float).reshape(-1, 2)
+        self.x = coords[:, 0].tolist()
+        self.y = coords[:, 1].tolist()
+
+        # Edges without a weight count as 1, like in networkx.
+        edges = list(graph.edges(keys=True, data='weight', default=1))
+        self.edge_ids = {}
+        for i, (start, end, key, weight) in enumerate(edges):
+            self.edge_ids[(start, end, key)] = i
+            self.edge_ids[(end, start, key)] = i
+
+        starts = numpy.array([self.node_indices[edge[0]] for edge in edges], dtype=int)
+        ends = numpy.array([self.node_indices[edge[1]] for edge in edges], dtype=int)
+        weights = numpy.array([edge[3] for edge in edges], dtype=float)
+
+        sources = numpy.concatenate((starts, ends))
+        order = numpy.argsort(sources, kind='stable')
+        self.offsets = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(sources, minlength=len(self.nodes))))).tolist()
+        self.targets = numpy.concatenate((ends, starts))[order].tolist()
+        self.edges = numpy.tile(numpy.arange(len(edges)), 2)[order].tolist()
+        self.weights = weights.tolist()
+        self.removed = bytearray(len(edges))
+
+        lengths = numpy.hypot(coords[starts, 0] - coords[ends, 0], coords[starts, 1] - coords[ends, 1])
+        has_length = lengths > 0
+        if has_length.any():
+            self.heuristic_scale = max(0.0, float((weights[has_length] / lengths[has_length]).min()))
+        else:
+            self.heuristic_scale = 0.0
+
+        self.searches = 0
+        self.expanded_nodes = 0
+        self.removed_edges = 0
+        self.routing_time = 0.0
+
+    def remove_edges(self, edges):
+        """Remove edges given as (start, end, key) tuples.  Unknown edges are ignored."""
+
+        for edge in edges:
+            edge_id = self.edge_ids.get(edge)
+            if edge_id is not None and not self.removed[edge_id]:
+                self.removed[edge_id] = 1
+                self.removed_edges += 1
+
+    def shortest_path(self, start, end):
+        """Return the list of nodes on the shortest path from start to end."""
+
+        start_time = time.perf_counter()
+        self.searches += 1
+
+        try:
+            source = self.node_indices[start]
+            target = self.node_indices[end]
+            if source == target:
+                path = [source]
+            else:
+                path = self._search(source, target)
+        finally:
+            self.routing_time += time.perf_counter() - start_time
+
+        return [self.nodes[node] for node in path]
+
+    def _search(self, source, target):
+        # Bidirectional A*: one search runs forward from the source, the
+        # other one backward from the target.  The forward search adds the
+        # potential p below to the distance of each node, the backward search
+        # subtracts it.  p changes by at most the weight of an edge along any
+        # edge, so both searches are just Dijkstra's algorithm on non-negative
+        # reduced weights.  For a node on a path, the keys of both searches
+        # add up to the length of the path, so we can stop as soon as the two
+        # queues together can't lead to anything shorter than the best path
+        # found so far.
+
+        offsets, targets, edges, weights, removed = self.offsets, self.targets, self.edges, self.weights, self.removed
+        x, y = self.x, self.y
+        source_x, source_y, target_x, target_y = x[source], y[source], x[target], y[target]
+        half_scale = self.heuristic_scale / 2.0
+
+        # forward search at index 0, backward search at index 1
+        signs = (half_scale, -half_scale)
+        distances = ({source: 0.0}, {target: 0.0})
+        parents = ({source: None}, {target: None})
+        done = (set(), set())
+        queues = ([(0.0, 0, source)], [(0.0, 0, target)])
+
+        # The counter breaks ties so that nodes are taken in the order they
+        # were reached.
+        order = count(1)
+
+        best_length = float('inf')
+        meeting_node = None
+
+        # The searches take turns.  That keeps them about the same size, even
+        # if one of them starts out in a dense part of the graph.
+        direction = 1
+
+        while queues[0] and queues[1]:
+            if queues[0][0][0] + queues[1][0][0] >= best_length:
+                break
+
+            direction = 1 - direction
+            queue = queues[direction]
+            ignore, ignore, node = heappop(queue)
+            if node in done[direction]:
+                continue
+            done[direction].add(node)
+            self.expanded_nodes += 1
+
+            sign = signs[direction]
+            node_distances = distances[direction]
+            node_parents = parents[direction]
+            other_distances = distances[1 - direction]
+            distance = node_distances[node]
+
+            for i in range(offsets[node], offsets[node + 1]):
+                edge = edges[i]
+                if removed[edge]:
+                    continue
+
+                neighbor = targets[i]
+                neighbor_distance = distance + weights[edge]
+                if neighbor_distance < node_distances.get(neighbor, best_length):
+                    node_distances[neighbor] = neighbor_distance
+                    node_parents[neighbor] = node
+
+                    key = neighbor_distance
+                    if sign:
+                        neighbor_x, neighbor_y = x[neighbor], y[neighbor]
+                        key += sign * (hypot(neighbor_x - target_x, neighbor_y - target_y) - hypot(neighbor_x - source_x, neighbor_y - source_y))
+                    heappush(queue, (key, next(order), neighbor))
+
+                    if neighbor in other_distances and neighbor_distance + other_distances[neighbor] < best_length:
+                        best_length = neighbor_distance + other_distances[neighbor]
+                        meeting_node = neighbor
+
+        if meeting_node is None:
+            raise NoTravelPathError("no travel path from %s to %s" % (self.nodes[source], self.nodes[target]))
+
+        return _path_to(meeting_node, parents[0])[::-1] + _path_to(meeting_node, parents[1])[1:]
+
+
+def _path_to(node, parents):
+    """Follow the parents from node back to where the search started."""
+
+    path = [node]
+    while parents[path[-1]] is not None:
+        path.append(parents[path[-1]])
+
+    return path
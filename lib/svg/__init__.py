@@ -6,6 +6,7 @@
 from .guides import get_guides
 from .path import apply_transforms, get_node_transform, get_correction_transform, line_strings_to_csp, point_lists_to_csp, line_strings_to_path
 from .path import apply_transforms, get_node_transform, get_correction_transform, line_strings_to_csp, point_lists_to_csp
+from .path import flatten_subpath
 from .rendering import color_block_to_point_lists, render_stitch_plan
 from .svg import get_document, generate_unique_id
 from .units import *
\ No newline at end of file
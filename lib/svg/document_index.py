@@ -0,0 +1,168 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+"""An index of the nodes of a document that are looked up by reference.
+
+Commands are found by the connectors that point to an element, clones by
+the id in their xlink:href, and so on.  Looking each of them up with an
+XPath query searches the whole document every time, which adds up to
+O(N^2) for a document with N elements.  build_document_index() finds all
+of them in one pass instead.  The lookup functions below use the index if
+one was built for the document and fall back to XPath otherwise.
+
+The index is a snapshot.  Lookups check that what they find is still in
+the document, and ids that aren't in the index are searched for, but new
+connectors and command symbols aren't noticed.  Code that adds them must
+call invalidate_document_index() (the functions in commands.py do).
+"""
+
+from collections import OrderedDict
+
+from inkex import NSS
+
+from .svg import find_elements
+from .tags import CONNECTION_END, CONNECTION_START, SVG_USE_TAG, XLINK_HREF
+
+# Only the indexes of the last few documents are kept.  Usually there's only
+# one document, but the API server and the render daemon see one after the
+# other.
+MAX_INDEXES = 4
+
+_indexes = OrderedDict()
+
+
+def get_root(node):
+    # not get_document(), which caches the document of each node even after
+    # the node was removed from it
+    return node.getroottree().getroot()
+
+
+class DocumentIndex(object):
+    def __init__(self, document):
+        self.document = document
+
+        # id -> node, the first one if the id is used more than once, like
+        # XPath would find it
+        self.nodes_by_id = {}
+
+        # id -> the connectors that point to that node, in document order
+        self.connectors_by_target = {}
+
+        # <use> nodes of Ink/Stitch command symbols, in document order
+        self.command_symbol_uses = []
+
+        for node in document.iterdescendants():
+            if not isinstance(node.tag, str):
+                # comments and processing instructions
+                continue
+
+            attributes = node.attrib
+            node_id = attributes.get('id')
+            if node_id is not None and node_id not in self.nodes_by_id:
+                self.nodes_by_id[node_id] = node
+
+            if CONNECTION_START in attributes or CONNECTION_END in attributes:
+                targets = {url[1:] for url in (attributes.get(CONNECTION_START), attributes.get(CONNECTION_END)) if url and url.startswith('#')}
+                for target in targets:
+                    self.connectors_by_target.setdefault(target, []).append(node)
+
+            if node.tag == SVG_USE_TAG and attributes.get(XLINK_HREF, '').startswith('#inkstitch_'):
+                self.command_symbol_uses.append(node)
+
+    def contains(self, node):
+        # not get_root(): lxml gives the document's root even for nodes that
+        # were removed from it
+        parent = node
+        while parent is not None:
+            node = parent
+            parent = node.getparent()
+
+        return node is self.document
+
+    def node_by_id(self, node_id):
+        node = self.nodes_by_id.get(node_id)
+        if node is not None and node.get('id') == node_id and self.contains(node):
+            return node
+
+        return None
+
+    def connectors(self, node_id):
+        url = '#%s' % node_id
+        return [connector for connector in self.connectors_by_target.get(node_id, ())
+                if (connector.get(CONNECTION_START) == url or connector.get(CONNECTION_END) == url) and self.contains(connector)]
+
+    def command_symbols(self):
+        return [use for use in self.command_symbol_uses if use.get(XLINK_HREF, '').startswith('#inkstitch_') and self.contains(use)]
+
+
+def build_document_index(node):
+    """Index the document that node is in and return the DocumentIndex."""
+
+    document = get_root(node)
+    index = DocumentIndex(document)
+
+    _indexes.pop(id(document), None)
+    _indexes[id(document)] = index
+    while len(_indexes) > MAX_INDEXES:
+        _indexes.popitem(last=False)
+
+    return index
+
+
+def get_document_index(node):
+    """Return the DocumentIndex of node's document, or None if it hasn't been built."""
+
+    document = get_root(node)
+    index = _indexes.get(id(document))
+    if index is not None and index.document is document:
+        return index
+
+    return None
+
+
+def invalidate_document_index(node):
+    """Drop the index of node's document, e.g. after adding commands to it."""
+
+    index = get_document_index(node)
+    if index is not None:
+        del _indexes[id(index.document)]
+
+
+def find_node_by_id(node, node_id):
+    """Find the node with the given id in node's document, or return None."""
+
+    index = get_document_index(node)
+    if index is not None:
+        found = index.node_by_id(node_id)
+        if found is not None:
+            return found
+
+    nodes = find_elements(node, ".//*[@id='%s']" % node_id)
+    if nodes:
+        return nodes[0]
+
+    return None
+
+
+def find_connectors(node):
+    """Find the connectors that point to node."""
+
+    node_id = node.get('id')
+    index = get_document_index(node)
+    if index is not None:
+        return index.connectors(node_id)
+
+    xpath = ".//*[@inkscape:connection-start='#%(id)s' or @inkscape:connection-end='#%(id)s']" % dict(id=node_id)
+    return get_root(node).xpath(xpath, namespaces=NSS)
+
+
+def find_command_symbols(node):
+    """Find the <use> nodes of all Ink/Stitch command symbols in node's document."""
+
+    index = get_document_index(node)
+    if index is not None:
+        return index.command_symbols()
+
+    return get_root(node).xpath(".//svg:use[starts-with(@xlink:href, '#inkstitch_')]", namespaces=NSS)
@@ -5,7 +5,7 @@
 
 from inkex.units import convert_unit
 
-from ..utils import Point, cache, string_to_floats
+from ..utils import Point, document_cache, string_to_floats
 from .tags import INKSCAPE_LABEL, SODIPODI_GUIDE, SODIPODI_NAMEDVIEW
 
 
@@ -35,7 +35,7 @@ class InkscapeGuide(object):
         self.direction = Point(parts[1], parts[0])
 
 
-@cache
+@document_cache
 def get_guides(svg):
     """Find all Inkscape guides and return as InkscapeGuide instances."""
 
@@ -4,6 +4,7 @@
 # Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
 
 import inkex
+import numpy
 
 from .tags import SVG_GROUP_TAG, SVG_LINK_TAG
 from .units import get_viewbox_transform
@@ -92,6 +93,89 @@ def point_lists_to_csp(point_lists):
     return csp
 
 
+# The curves are split in half until they're flat enough.  Each split makes
+# a curve about 4 times flatter, so this is only reached if the coordinates
+# are broken (NaN).
+MAX_SUBDIVISIONS = 64
+
+
+def flatten_subpath(subpath, flatness=0.1):
+    """Approximate a subpath of a cubic superpath with a series of points.
+
+    Returns the points as an array of shape (n, 2).  They're exactly the
+    ones that inkex.bezier.cspsubdiv() finds: each bezier curve is split in
+    half until its control points are at most flatness away from the line
+    between its ends.  Instead of one curve after the other, all curves
+    that aren't flat enough yet are split at once.
+    """
+
+    nodes = numpy.array(subpath, dtype=float).reshape(-1, 3, 2)
+    if len(nodes) < 2:
+        return nodes[:, 1].copy()
+
+    # one row per curve: start, first control point, second control point, end
+    curves = numpy.stack((nodes[:-1, 1], nodes[:-1, 2], nodes[1:, 0], nodes[1:, 1]), axis=1)
+    done = numpy.zeros(len(curves), dtype=bool)
+
+    for i in range(MAX_SUBDIVISIONS):
+        todo = numpy.flatnonzero(~done)
+        flat = _control_point_distance(curves[todo]) <= flatness
+        done[todo[flat]] = True
+
+        split = todo[~flat]
+        if not len(split):
+            break
+
+        # replace each curve to split by its two halves
+        counts = numpy.ones(len(curves), dtype=int)
+        counts[split] = 2
+        positions = (numpy.cumsum(counts) - counts)[split]
+        first, second = _split_in_half(curves[split])
+        curves = numpy.repeat(curves, counts, axis=0)
+        done = numpy.repeat(done, counts)
+        curves[positions] = first
+        curves[positions + 1] = second
+
+    return numpy.concatenate((nodes[:1, 1], curves[:, 3]))
+
+
+def _control_point_distance(curves):
+    """Like inkex.bezier.maxdist() for each curve, with the same rounding."""
+
+    x0, y0 = curves[:, 0, 0], curves[:, 0, 1]
+    x3, y3 = curves[:, 3, 0], curves[:, 3, 1]
+    dx = x3 - x0
+    dy = y3 - y0
+    length_squared = dx * dx + dy * dy
+
+    distances = []
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        length = numpy.hypot(dx, dy)
+        for control_point in (1, 2):
+            x, y = curves[:, control_point, 0], curves[:, control_point, 1]
+            dot = (x - x0) * dx + (y - y0) * dy
+            perpendicular = numpy.fabs(dx * (y0 - y) - (x0 - x) * dy) / length
+            distances.append(numpy.where(dot <= 0, numpy.hypot(x0 - x, y0 - y),
+                                         numpy.where(length_squared <= dot, numpy.hypot(x3 - x, y3 - y), perpendicular)))
+
+    # not numpy.maximum(): max() ignores the second distance if it's NaN
+    return numpy.where(distances[1] > distances[0], distances[1], distances[0])
+
+
+def _split_in_half(curves):
+    """Like inkex.bezier.beziersplitatt() at 0.5 for each curve."""
+
+    start, control1, control2, end = curves[:, 0], curves[:, 1], curves[:, 2], curves[:, 3]
+    m1 = start + 0.5 * (control1 - start)
+    m2 = control1 + 0.5 * (control2 - control1)
+    m3 = control2 + 0.5 * (end - control2)
+    m4 = m1 + 0.5 * (m2 - m1)
+    m5 = m2 + 0.5 * (m3 - m2)
+    middle = m4 + 0.5 * (m5 - m4)
+
+    return numpy.stack((start, m1, m4, middle), axis=1), numpy.stack((middle, m5, m3, end), axis=1)
+
+
 def line_strings_to_path(line_strings):
     csp = line_strings_to_csp(line_strings)
 
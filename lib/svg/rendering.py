@@ -11,7 +11,7 @@ import inkex
 from .tags import (INKSCAPE_GROUPMODE, INKSCAPE_LABEL, INKSTITCH_ATTRIBS)
 from .units import PIXELS_PER_MM, get_viewbox_transform
 from ..i18n import _
-from ..utils import Point, cache
+from ..utils import Point, document_cache
 
 # The stitch vector path looks like this:
 #  _______
@@ -157,7 +157,7 @@ def color_block_to_point_lists(color_block):
     return point_lists
 
 
-@cache
+@document_cache
 def get_correction_transform(svg):
     transform = get_viewbox_transform(svg)
 
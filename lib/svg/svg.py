@@ -6,10 +6,10 @@
 from inkex import NSS
 from lxml import etree
 
-from ..utils import cache
+from ..utils import document_cache
 
 
-@cache
+@document_cache
 def get_document(node):
     return node.getroottree().getroot()
 
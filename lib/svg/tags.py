@@ -40,6 +40,8 @@ SODIPODI_GUIDE = inkex.addNS('guide', 'sodipodi')
 SODIPODI_ROLE = inkex.addNS('role', 'sodipodi')
 
 INKSTITCH_LETTERING = inkex.addNS('lettering', 'inkstitch')
+# prefix of all attribute names in the inkstitch namespace
+INKSTITCH_NAMESPACE = '{%s}' % inkex.NSS['inkstitch']
 
 EMBROIDERABLE_TAGS = (SVG_PATH_TAG, SVG_POLYLINE_TAG, SVG_POLYGON_TAG,
                       SVG_RECT_TAG, SVG_ELLIPSE_TAG, SVG_CIRCLE_TAG)
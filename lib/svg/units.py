@@ -6,7 +6,7 @@
 import inkex
 
 from ..i18n import _
-from ..utils import cache
+from ..utils import document_cache
 
 # modern versions of Inkscape use 96 pixels per inch as per the CSS standard
 PIXELS_PER_MM = 96 / 25.4
@@ -94,7 +94,7 @@ def convert_length(length):
     """
 
 
-@cache
+@document_cache
 def get_viewbox(svg):
     viewbox = svg.get('viewBox')
     if viewbox is None:
@@ -102,7 +102,7 @@ def get_viewbox(svg):
     return viewbox.strip().replace(',', ' ').split()
 
 
-@cache
+@document_cache
 def get_doc_size(svg):
     width = svg.get('width')
     height = svg.get('height')
@@ -128,7 +128,7 @@ def get_doc_size(svg):
     return doc_width, doc_height
 
 
-@cache
+@document_cache
 def get_viewbox_transform(node):
     # somewhat cribbed from inkscape-silhouette
     doc_width, doc_height = get_doc_size(node)
@@ -5,14 +5,22 @@
 
 from collections.abc import Set
 
-from colormath.color_conversions import convert_color
-from colormath.color_diff import delta_e_cie1994
-from colormath.color_objects import LabColor, sRGBColor
-
 from .color import ThreadColor
 
+# colormath is imported where it's used: it imports networkx, which takes a
+# large part of the startup time of extensions that never compare colors.
+
+
+def to_lab_color(rgb):
+    from colormath.color_conversions import convert_color
+    from colormath.color_objects import LabColor, sRGBColor
+
+    return convert_color(sRGBColor(*rgb, is_upscaled=True), LabColor)
+
 
 def compare_thread_colors(color1, color2):
+    from colormath.color_diff import delta_e_cie1994
+
     # K_L=2 indicates textiles
     return delta_e_cie1994(color1, color2, K_L=2)
 
@@ -61,7 +69,7 @@ class ThreadPalette(Set):
                     thread_name = thread_name.strip()
 
                     thread = ThreadColor(thread_color, thread_name, thread_number, manufacturer=self.name)
-                    self.threads[thread] = convert_color(sRGBColor(*thread_color, is_upscaled=True), LabColor)
+                    self.threads[thread] = to_lab_color(thread_color)
                 except (ValueError, IndexError):
                     continue
 
@@ -80,6 +88,6 @@ class ThreadPalette(Set):
         if isinstance(color, ThreadColor):
             color = color.rgb
 
-        color = convert_color(sRGBColor(*color, is_upscaled=True), LabColor)
+        color = to_lab_color(color)
 
         return min(self, key=lambda thread: compare_thread_colors(self.threads[thread], color))
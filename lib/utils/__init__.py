@@ -3,7 +3,7 @@
 # Copyright (c) 2010 Authors
 # Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
 
-from .cache import cache
+from .cache import cache, cached_method, clear_document_caches, document_cache, invalidate_cache
 from .dotdict import DotDict
 from .geometry import *
 from .inkscape import *
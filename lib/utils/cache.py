@@ -3,6 +3,9 @@
 # Copyright (c) 2010 Authors
 # Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
 
+from collections import OrderedDict
+from functools import wraps
+
 try:
     from functools import lru_cache
 except ImportError:
@@ -13,3 +16,151 @@ except ImportError:
 
 def cache(*args, **kwargs):
     return lru_cache(maxsize=None)(*args, **kwargs)
+
+
+# the functions decorated with document_cache()
+_document_caches = []
+
+
+def document_cache(function):
+    """Like @cache, for functions of the nodes of an SVG document.
+
+    An extension handles one document per process, but the render daemon
+    and the batch exporter handle many.  Every cached result would keep its
+    document alive, and a new document could get an old one's id() and
+    with it stale results.  They call clear_document_caches() after each
+    document.
+    """
+
+    cached_function = cache(function)
+    _document_caches.append(cached_function)
+    return cached_function
+
+
+def clear_document_caches():
+    for function in _document_caches:
+        function.cache_clear()
+
+
+# How many results cached_method() keeps for each object.  An element has a
+# few dozen cached methods, and get_param() and friends one result per param.
+MAX_ENTRIES_PER_OBJECT = 512
+
+_missing = object()
+
+# the statistics of all methods decorated with cached_method()
+_method_statistics = []
+
+
+class CacheStatistics(object):
+    def __init__(self, name):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return "CacheStatistics(%s, hits=%d, misses=%d)" % (self.name, self.hits, self.misses)
+
+
+class InstanceCache(object):
+    """The results of the cached methods of one object."""
+
+    def __init__(self, owner, max_entries=MAX_ENTRIES_PER_OBJECT):
+        # A shallow copy of the object gets the same InstanceCache in its
+        # __dict__.  The id tells us that it isn't the copy's own.
+        self.owner_id = id(owner)
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        result = self.entries.get(key, _missing)
+        if result is not _missing:
+            try:
+                self.entries.move_to_end(key)
+            except KeyError:
+                # another thread cleared the cache meanwhile
+                pass
+        return result
+
+    def put(self, key, result):
+        self.entries[key] = result
+        if len(self.entries) > self.max_entries:
+            try:
+                self.entries.popitem(last=False)
+            except KeyError:
+                pass
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def instance_cache(obj):
+    """Return the InstanceCache of obj, creating it if needed."""
+
+    instance_cache = obj.__dict__.get('_instance_cache')
+    if instance_cache is None or instance_cache.owner_id != id(obj):
+        instance_cache = obj.__dict__['_instance_cache'] = InstanceCache(obj)
+
+    return instance_cache
+
+
+def invalidate_cache(obj):
+    """Forget the results of obj's cached methods."""
+
+    instance_cache = obj.__dict__.get('_instance_cache')
+    if instance_cache is not None and instance_cache.owner_id == id(obj):
+        instance_cache.clear()
+
+
+def cached_method(method):
+    """Like @cache, but for methods and properties.
+
+    lru_cache keys on self, so it keeps every object it has ever seen
+    alive.  Instead, the results are stored on the object itself and go
+    away with it.  invalidate_cache(obj) drops them, e.g. after something
+    they depend on has changed.  Nothing else does: a cached method returns
+    stale results until the object's owner invalidates them (see
+    EmbroideryElement.invalidate_cache()).  At most MAX_ENTRIES_PER_OBJECT
+    results are kept for each object; the least recently used one goes
+    first.
+
+    The hits and misses of all objects are counted in the method's
+    cache_statistics; see method_cache_statistics().
+    """
+
+    statistics = CacheStatistics(method.__qualname__)
+    _method_statistics.append(statistics)
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        cache = instance_cache(self)
+        if kwargs:
+            key = (method, args, tuple(sorted(kwargs.items())))
+        else:
+            key = (method, args)
+
+        result = cache.get(key)
+        if result is _missing:
+            statistics.misses += 1
+            cache.misses += 1
+            result = method(self, *args, **kwargs)
+            cache.put(key, result)
+        else:
+            statistics.hits += 1
+            cache.hits += 1
+
+        return result
+
+    wrapper.cache_statistics = statistics
+    return wrapper
+
+
+def method_cache_statistics():
+    """Return the CacheStatistics of every method that was called at least once."""
+
+    return [statistics for statistics in _method_statistics if statistics.hits or statistics.misses]
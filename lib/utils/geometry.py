@@ -65,12 +65,14 @@ def collapse_duplicate_point(geometry):
 
 
 class Point:
+    __slots__ = ('x', 'y')
+
     def __init__(self, x, y):
         self.x = x
         self.y = y
 
     def __json__(self):
-        return vars(self)
+        return dict(x=self.x, y=self.y)
 
     def __add__(self, other):
         return self.__class__(self.x + other.x, self.y + other.y)
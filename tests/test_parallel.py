@@ -0,0 +1,35 @@
+# Authors: see git history
+#
+# Copyright (c) 2010 Authors
+# Licensed under the GNU GPL version 3.0 or later.  See the file LICENSE for details.
+
+from threading import Event, Thread
+
+import pytest
+
+from benchmarks.parallel import (load_elements, stitch_plan_json,
+                                 synthetic_document)
+from lib.elements import embroider_in_parallel, embroider_serially
+from lib.elements.parallel import can_embroider_in_parallel
+
+
+@pytest.mark.skipif(not can_embroider_in_parallel(), reason="needs fork() and a single thread")
+def test_parallel_stitch_plan_is_identical_to_serial():
+    # Separate documents, so that nothing cached on the elements in the
+    # serial run is reused in the parallel run.
+    serial = stitch_plan_json(embroider_serially(load_elements(synthetic_document(num_objects=16))))
+    parallel = stitch_plan_json(embroider_in_parallel(load_elements(synthetic_document(num_objects=16)), processes=2))
+
+    assert parallel == serial
+
+
+def test_no_parallel_embroidery_with_other_threads():
+    stop = Event()
+    thread = Thread(target=stop.wait)
+    thread.start()
+
+    try:
+        assert not can_embroider_in_parallel()
+    finally:
+        stop.set()
+        thread.join()